@@ -54,6 +54,8 @@ include:
 include:
     "rules/placement/appspam.smk"
 #results evaluation and plots
+include:
+    "rules/op/operate_placements.smk"
 include:
     "rules/op/operate_nodedistance.smk"
 include:
@@ -0,0 +1,63 @@
+"""
+WORKFLOW TO EVALUATE HOW PLACEMENTS SCALE WITH THE NUMBER OF QUERIES
+This top snakefile loads all necessary modules and operations.
+User queries are subsampled to every count of "query_counts", which is placed
+by every tool, while databases, hmm profiles and reference packages are built once.
+CPU/RAM/disk measurements are done via SnakeMake "benchmark" functions.
+"""
+
+__author__ = "Benjamin Linard, Nikolai Romashchenko"
+__license__ = "MIT"
+
+import pewo.config as cfg
+
+# this config file is set globally for all subworkflows
+configfile: "config.yaml"
+
+config["mode"] = "volume"
+
+# explicitly set config as if there was a single pruning which in fact represents the full (NOT pruned) tree.
+# the read length wildcard holds the number of queries
+# NOTE: this statement MUST be set BEFORE the "includes"
+config["pruning_count"] = 1
+config["read_length"] = cfg.get_query_counts(config)
+
+#utils
+include:
+    "rules/utils/workflow.smk"
+include:
+    "rules/utils/etc.smk"
+#prepare input files
+include:
+    "rules/op/operate_inputs.smk"
+include:
+    "rules/op/operate_optimisation.smk"
+#phylo-kmer placement, e.g.: rappas
+include:
+    "rules/op/ar.smk"
+include:
+    "rules/placement/rappas.smk"
+include:
+    "rules/placement/epik.smk"
+#alignment (for distance-based and ML approaches)
+include:
+    "rules/alignment/hmmer.smk"
+#ML-based placements, e.g.: epa, epang, pplacer
+include:
+    "rules/placement/epa.smk"
+include:
+    "rules/placement/pplacer.smk"
+include:
+    "rules/placement/epang.smk"
+#distance-based placements, e.g.: apples
+include:
+    "rules/placement/apples.smk"
+include:
+    "rules/placement/appspam.smk"
+#results and plots
+include:
+    "rules/op/operate_volume.smk"
+
+rule all:
+    input:
+        build_volume_workflow()
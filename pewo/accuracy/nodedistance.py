@@ -0,0 +1,345 @@
+"""
+Computes the node distance (ND) and the expected node distance (eND) of placements
+produced in the accuracy mode.
+
+For every pruning, the branch-to-branch node distance matrix of the pruned tree
+is computed once and stored as NumPy arrays. Every .jplace file is then scored
+with vectorized lookups in that matrix, and the partial results are merged.
+"""
+
+__author__ = "Benjamin Linard, Nikolai Romashchenko"
+__license__ = "MIT"
+
+
+import hashlib
+import itertools
+import shutil
+import string
+from functools import lru_cache
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+import numpy as np
+from pewo.io import newick
+from pewo.io.placements import PlacementTable
+from pewo.io.jplace import JplaceParser, PlacementColumns
+from pewo.software import PlacementSoftware
+from pewo.templates import get_output_template, get_output_template_args, \
+    get_node_distance_template
+
+
+# Columns of results.csv, consumed by scripts/R/eval_accuracy_plots.R.
+# Parameters not used by a software are reported as NA.
+RESULT_COLUMNS = [
+    "software", "pruning", "r", "h", "query",
+    "g", "bigg", "ms", "sb", "mp", "meth", "crit",
+    "k", "o", "red", "ar", "mu", "mode", "w", "pattern",
+    "nd", "e_nd"
+]
+
+# Names of wildcards that differ from the names of result columns
+_COLUMN_NAMES = {"length": "r"}
+
+_MISSING_VALUE = "NA"
+
+
+class PlacementJob(NamedTuple):
+    """
+    A .jplace file to score, with the wildcard values it was produced with.
+    """
+    software: str
+    heuristic: Optional[str]
+    jplace: str
+    distances: str
+    wildcards: Dict[str, str]
+
+
+def _leaf_key(name: str) -> int:
+    """
+    Returns a pseudo-random 64-bit key of a leaf. Keys are deterministic
+    so that different processes compute the same clade hashes.
+    """
+    return int.from_bytes(hashlib.blake2b(name.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _clade_hashes(tree: newick.Tree) -> np.ndarray:
+    """
+    Computes a hash of the leaf set of every subtree, as the XOR of leaf keys.
+    Two edges of different trees define the same split
+    if the hash of one is equal to the hash or its complement of the other.
+    """
+    hashes = np.zeros(tree.num_nodes, dtype=np.uint64)
+    for leaf in tree.leaves():
+        hashes[leaf] = _leaf_key(tree.names[leaf])
+
+    parent = tree.parent
+    # children have lower ids than their parents
+    for node in range(tree.num_nodes - 1):
+        hashes[parent[node]] ^= hashes[node]
+    return hashes
+
+
+def node_distance_matrix(tree: newick.Tree) -> np.ndarray:
+    """
+    Computes the node distance between every pair of branches of the tree.
+    A branch is identified by the id of the node below it; the root
+    stands for a zero-length branch above the root. The node distance is
+    the number of nodes on the path between two branches: 0 for the same branch,
+    1 for adjacent branches etc.
+    """
+    num_nodes = tree.num_nodes
+    parent = tree.parent
+    first = tree.first
+
+    # Node-to-node distances in edges. The row of a node is the row of its
+    # parent shifted by one, except for the subtree of the node.
+    distances = np.empty((num_nodes, num_nodes), dtype=np.int32)
+    distances[tree.root] = tree.depth()
+    for node in range(num_nodes - 2, -1, -1):
+        np.add(distances[parent[node]], 1, out=distances[node])
+        distances[node, first[node]:node + 1] -= 2
+
+    # Branches (c1, p1) and (c2, p2) are separated by d(c1, c2) - 1 nodes,
+    # and by d(c1, c2) nodes if one of them is below the other.
+    distances -= 1
+    for node in range(num_nodes):
+        distances[node, first[node]:node] += 1
+        distances[first[node]:node, node] += 1
+    np.fill_diagonal(distances, 0)
+    return distances
+
+
+def _expected_branches(original_tree: newick.Tree, pruned_tree: newick.Tree) -> np.ndarray:
+    """
+    Finds the branches of the pruned tree where the pruned subtree was attached
+    in the original tree. There is one such branch if the pruned subtree was
+    attached to a bifurcating node, and several branches otherwise.
+    """
+    original_hashes = _clade_hashes(original_tree)
+    pruned_hashes = _clade_hashes(pruned_tree)
+    original_total = original_hashes[original_tree.root]
+    pruned_total = pruned_hashes[pruned_tree.root]
+
+    pruned_leaves = set(original_tree.names[leaf] for leaf in original_tree.leaves()) - \
+        set(pruned_tree.names[leaf] for leaf in pruned_tree.leaves())
+    if not pruned_leaves:
+        raise RuntimeError("The pruned tree contains all leaves of the original tree.")
+    pruned_hash = original_total ^ pruned_total
+
+    # Find the parts of the original tree adjacent to the pruned subtree
+    clade = np.flatnonzero(original_hashes == pruned_hash)
+    if len(clade) > 0:
+        node = clade[0]
+        attachment = original_tree.parent[node]
+        parts = [original_hashes[child] for child in original_tree.children(attachment) if child != node]
+        if attachment != original_tree.root:
+            parts.append(original_total ^ original_hashes[attachment])
+    else:
+        # the pruned leaves contain the root of the original tree
+        clade = np.flatnonzero(original_hashes == pruned_total)
+        if len(clade) == 0:
+            raise RuntimeError("Pruned leaves do not form a subtree of the original tree.")
+        parts = [original_hashes[child] for child in original_tree.children(clade[0])]
+
+    # the pruned subtree was a child of a bifurcating root: the remaining part is
+    # the whole pruned tree, so take the branches below its root
+    if len(parts) == 1:
+        node = np.flatnonzero(original_hashes == parts[0])[0]
+        parts = [original_hashes[child] for child in original_tree.children(node)]
+
+    parts = set(int(part) for part in parts)
+    expected = [node for node in range(pruned_tree.num_nodes - 1)
+                if int(pruned_hashes[node]) in parts or int(pruned_total ^ pruned_hashes[node]) in parts]
+    if not expected:
+        raise RuntimeError("Could not find the expected placement in the pruned tree.")
+    return np.array(expected, dtype=np.int32)
+
+
+def build_distances(original_tree_file: str, pruned_tree_file: str, output_file: str) -> None:
+    """
+    Computes the node distance matrix of a pruned tree and the expected placement
+    branches, and saves them to a .npz file.
+    """
+    original_tree = newick.read(original_tree_file)
+    pruned_tree = newick.read(pruned_tree_file)
+
+    with open(output_file, "wb") as f_out:
+        np.savez(f_out,
+                 nd=node_distance_matrix(pruned_tree),
+                 expected=_expected_branches(original_tree, pruned_tree),
+                 clade_hash=_clade_hashes(pruned_tree))
+
+
+@lru_cache(maxsize=16)
+def _load_distances(distances_file: str) -> Tuple[np.ndarray, Dict[int, int]]:
+    """
+    Loads node distances to the expected placement and creates a lookup table
+    from clade hashes to branches of the pruned tree.
+    """
+    with np.load(distances_file) as data:
+        expected_distances = data["nd"][data["expected"]].min(axis=0)
+        clade_hash = data["clade_hash"]
+
+    total = int(clade_hash[-1])
+    branches = {}
+    for node, value in enumerate(clade_hash.tolist()):
+        branches.setdefault(value, node)
+    # a branch of a differently rooted tree may define the complement clade
+    for node, value in enumerate(clade_hash.tolist()):
+        branches.setdefault(total ^ value, node)
+    return expected_distances, branches
+
+
+@lru_cache(maxsize=64)
+def _map_edges(distances_file: str, jplace_tree: str) -> np.ndarray:
+    """
+    Maps edge numbers of a .jplace tree to branches of the pruned tree.
+    """
+    _, branches = _load_distances(distances_file)
+    tree = newick.parse(jplace_tree)
+    hashes = _clade_hashes(tree)
+
+    edge_map = np.full(int(tree.edge_num.max()) + 1, -1, dtype=np.int32)
+    for node in np.flatnonzero(tree.edge_num >= 0):
+        value = int(hashes[node])
+        if value not in branches:
+            raise RuntimeError(f"{distances_file}: the tree of the .jplace file does not match the pruned tree.")
+        edge_map[tree.edge_num[node]] = branches[value]
+    return edge_map
+
+
+def _score_jplace(job: PlacementJob) -> List[str]:
+    """
+    Computes ND and eND of every query of a .jplace file. Returns lines of results.csv.
+    """
+    parser = JplaceParser(job.jplace)
+    columns = parser.read_columns()
+    return _score_columns(job, columns, parser.tree)
+
+
+def _score_columns(job: PlacementJob, columns: PlacementColumns, jplace_tree: str) -> List[str]:
+    """
+    Computes ND and eND of every query of placements read column-wise.
+    """
+    # skip sequences without placements
+    counts = np.diff(columns.offsets)
+    names = [query_names for query_names, count in zip(columns.names, counts) if count > 0]
+    counts = counts[counts > 0]
+    if len(counts) == 0:
+        return []
+
+    weights = columns.like_weight_ratio
+    if np.isnan(weights).all():
+        weights = np.ones(len(weights), dtype=np.float64)
+
+    expected_distances, _ = _load_distances(job.distances)
+    edge_map = _map_edges(job.distances, jplace_tree)
+
+    distances = expected_distances[edge_map[columns.edge_num]].astype(np.float64)
+    starts = np.zeros(len(counts), dtype=np.int64)
+    np.cumsum(counts[:-1], out=starts[1:])
+
+    # ND is the distance of the placement with the highest LWR
+    group = np.repeat(np.arange(len(counts)), counts)
+    order = np.lexsort((-weights, group))
+    best = distances[order[starts]]
+
+    # eND is the LWR-weighted mean distance
+    weight_sums = np.add.reduceat(weights, starts)
+    weight_sums[weight_sums == 0] = 1.0
+    expected = np.add.reduceat(weights * distances, starts) / weight_sums
+
+    values = {_COLUMN_NAMES.get(key, key): value for key, value in job.wildcards.items()}
+    values["software"] = job.software
+    if job.heuristic:
+        values["h"] = job.heuristic[1:]
+
+    lines = []
+    for query_names, nd, e_nd in zip(names, best.tolist(), expected.tolist()):
+        values["nd"] = str(int(nd))
+        values["e_nd"] = f"{e_nd:.6f}"
+        for name in query_names:
+            values["query"] = name
+            lines.append(";".join(values.get(column, _MISSING_VALUE) for column in RESULT_COLUMNS))
+    return lines
+
+
+def get_placement_keys(job: PlacementJob) -> Dict[str, str]:
+    """
+    Returns the key values of a .jplace file in the placement table.
+    """
+    keys = {"software": job.software, "heuristic": job.heuristic or _MISSING_VALUE}
+    keys.update(job.wildcards)
+    return keys
+
+
+def _as_list(value: Any) -> List[Any]:
+    return list(value) if isinstance(value, (list, tuple, range)) else [value]
+
+
+def get_placement_jobs(config: Dict) -> List[PlacementJob]:
+    """
+    Creates a list of all .jplace files produced by the tested software,
+    together with their wildcard values.
+    """
+    jobs = []
+    distances_template = get_node_distance_template(config)
+
+    for software_name in config["test_soft"]:
+        software = PlacementSoftware.get_by_value(software_name)
+        # FIXME: EPA-NG has different templates for different heuristics
+        heuristics = config["config_epang"]["heuristics"] if software == PlacementSoftware.EPANG else [None]
+
+        for heuristic in heuristics:
+            kwargs = {"heuristic": heuristic} if heuristic else {}
+            template = get_output_template(config, software, "jplace", **kwargs)
+            template_args = get_output_template_args(config, software, **kwargs)
+
+            keys = list(dict.fromkeys(name for _, name, _, _ in string.Formatter().parse(template) if name))
+            for values in itertools.product(*(_as_list(template_args[key]) for key in keys)):
+                wildcards = dict(zip(keys, (str(value) for value in values)))
+                jobs.append(PlacementJob(software=software.value,
+                                         heuristic=heuristic,
+                                         jplace=template.format(**wildcards),
+                                         distances=distances_template.format(**wildcards),
+                                         wildcards=wildcards))
+    return jobs
+
+
+def write_partial_results(job: PlacementJob, output_file: str) -> None:
+    """
+    Scores a .jplace file and writes its results in the results.csv format.
+    """
+    with open(output_file, "w") as f_out:
+        print(";".join(RESULT_COLUMNS), file=f_out)
+        for line in _score_jplace(job):
+            print(line, file=f_out)
+
+
+def merge_results(input_files: List[str], output_file: str) -> None:
+    """
+    Concatenates partial results into a single results.csv file.
+    """
+    header = ";".join(RESULT_COLUMNS) + "\n"
+    with open(output_file, "w") as f_out:
+        f_out.write(header)
+        for input_file in input_files:
+            with open(input_file) as f_in:
+                if f_in.readline() != header:
+                    raise RuntimeError(f"{input_file}: wrong header. Expected: {header}")
+                shutil.copyfileobj(f_in, f_out)
+
+
+def score_placement_table(jobs: List[PlacementJob], table_file: str, output_file: str) -> None:
+    """
+    Scores all .jplace files from the placement table and writes results.csv.
+    """
+    table = PlacementTable(table_file)
+    table_jobs = dict((table.get_file(index), index) for index in range(table.num_jobs))
+
+    with open(output_file, "w") as f_out:
+        print(";".join(RESULT_COLUMNS), file=f_out)
+        for job in jobs:
+            if job.jplace not in table_jobs:
+                raise RuntimeError(f"{table_file}: {job.jplace} is not in the placement table.")
+            index = table_jobs[job.jplace]
+            for line in _score_columns(job, table.read_columns(index), table.get_tree(index)):
+                print(line, file=f_out)
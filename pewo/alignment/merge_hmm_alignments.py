@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""
+Merges alignments of query chunks to the same profile in one psiblast alignment.
+Usage: merge_hmm_alignments.py output.psiblast chunk0.pfam [chunk1.pfam ...]
+
+Chunks are hmmalign alignments in the Pfam format. The merged alignment is the one
+hmmalign writes for all sequences at once: insert blocks are as wide as the longest
+insertion of all sequences, and insertions are laid out as in HMMER's tracealign.c:
+the N-terminal one is right-justified, internal ones are split in half between
+the left and right ends of the block, the C-terminal one is left-justified.
+"""
+
+__author__ = "Nikolai Romashchenko"
+__license__ = "MIT"
+
+
+import sys
+from typing import Iterator, List, NamedTuple
+
+
+# Number of alignment columns per block of the psiblast format
+_PSIBLAST_LINE_WIDTH = 60
+
+
+class ProfileAlignment(NamedTuple):
+    """
+    A sequence aligned to a profile of M match states: M match characters
+    and M + 1 insertions, before, between and after match states.
+    """
+    name: str
+    matches: str
+    inserts: List[str]
+
+
+def _read_pfam(input_file: str) -> Iterator[ProfileAlignment]:
+    """
+    Reads sequences of a single-block Stockholm (Pfam) alignment.
+    """
+    rows = []
+    reference = None
+    with open(input_file) as f_in:
+        for line in f_in:
+            if line.startswith("#=GC RF"):
+                reference = line.split()[2]
+            elif line.strip() and not line.startswith("#") and not line.startswith("//"):
+                name, sequence = line.split()
+                rows.append((name, sequence))
+
+    if reference is None:
+        raise RuntimeError(f"{input_file}: no reference annotation of match columns.")
+
+    is_match = [c.isalnum() for c in reference]
+    for name, sequence in rows:
+        matches = []
+        inserts = []
+        insert = []
+        for c, match in zip(sequence, is_match):
+            if match:
+                inserts.append("".join(insert))
+                insert = []
+                matches.append(c.upper() if c.isalpha() else "-")
+            elif c.isalpha():
+                insert.append(c.lower())
+        inserts.append("".join(insert))
+        yield ProfileAlignment(name, "".join(matches), inserts)
+
+
+def _justify(insert: str, k: int, width: int, num_matches: int) -> str:
+    """
+    Lays out the insertion after the match state k in a block of given width.
+    """
+    gaps = "-" * (width - len(insert))
+    if width > 1 and k < num_matches:
+        left = 0 if k == 0 else len(insert) // 2
+        return insert[:left] + gaps + insert[left:]
+    return insert + gaps
+
+
+def merge_alignments(input_files: List[str], output_file: str) -> None:
+    """
+    Merges chunk alignments in the order of input files and writes them in the psiblast format.
+    """
+    alignments = [alignment for input_file in input_files for alignment in _read_pfam(input_file)]
+    if not alignments:
+        raise RuntimeError("No sequences to merge.")
+
+    num_matches = len(alignments[0].matches)
+    if any(len(alignment.matches) != num_matches for alignment in alignments):
+        raise RuntimeError("Chunks are not aligned to the same profile.")
+
+    widths = [max(len(alignment.inserts[k]) for alignment in alignments) for k in range(num_matches + 1)]
+    rows = []
+    for alignment in alignments:
+        row = []
+        for k, insert in enumerate(alignment.inserts):
+            row.append(_justify(insert, k, widths[k], num_matches))
+            if k < num_matches:
+                row.append(alignment.matches[k])
+        rows.append("".join(row))
+
+    name_width = max(len(alignment.name) for alignment in alignments)
+    length = len(rows[0])
+    with open(output_file, "w") as f_out:
+        for start in range(0, length, _PSIBLAST_LINE_WIDTH):
+            if start > 0:
+                f_out.write("\n")
+            for alignment, row in zip(alignments, rows):
+                f_out.write(f"{alignment.name:<{name_width}}  {row[start:start + _PSIBLAST_LINE_WIDTH]}\n")
+
+
+if __name__ == "__main__":
+    merge_alignments(sys.argv[2:], sys.argv[1])
@@ -6,61 +6,100 @@ __license__ = "MIT"
 
 import sys
 import collections
+from typing import Dict, List, Optional, Set, TextIO
+from pewo.io.fasta import FastaReader
 
 
-def psiblast2fasta(input_file: str, output_file: str) -> None:
-    f_in = open(input_file, "r")
-    f_out = open(output_file, "w")
+def _read_psiblast(input_file: str, log: Optional[TextIO] = None) -> Dict[str, List[str]]:
+    """
+    Reads a psiblast alignment block by block. Returns an ordered dict
+    of sequence identifiers and lists of sequence chunks.
+    """
+    log = log or sys.stdout
 
     #dict to see which header has already been found
-    headers=collections.OrderedDict()
+    headers = collections.OrderedDict()
     #when reading all seq ids at 1st block (before 1st empty line)
     #check if duplicate names
-    firstblock=1
-    line_block=0
-    duplicate={} #map(line_block)=new_identifier
-    duplicate_index={} #map(identifier)=#duplicate_envountered_in_block
-    # read psiblast alignment
-    lines = f_in.readlines()
-    for line in lines:
-        #skip empty lines, reset block at empty lines
-        if (len(line.strip())<1):
-            firstblock=0
-            line_block=0
-            continue;
-        #load sequences
-        elts=line.strip().split()
-        #elts=re.split('\s+',line) //ajout '' before \n, for whatever obsure reason
-
-        #identifier never encountered, register it
-        if ( elts[0] not in headers ):
-            headers[elts[0]]=elts[1]
-        else:
-            #if still in block 1
-            if ( (firstblock==1)  and (elts[0] in headers) ):
-                #set counter of how many times we encountered this id
-                if (elts[0] not in duplicate_index):
-                    duplicate_index[elts[0]]=0
-                else:
-                    duplicate_index[elts[0]]=duplicate_index[elts[0]]+1
-                #create new id
-                duplicate[line_block]=elts[0]+'_'+str(duplicate_index[elts[0]])
-                print("duplicate at "+str(line_block)+" id set to "+duplicate[line_block])
-                headers[duplicate[line_block]]=""
-            #add sequence to original or n-th duplicate depending on current block line
-            if (line_block in duplicate):
-                headers[duplicate[line_block]]=headers[duplicate[line_block]]+elts[1]
+    firstblock = 1
+    line_block = 0
+    duplicate = {} #map(line_block)=new_identifier
+    duplicate_index = {} #map(identifier)=#duplicate_envountered_in_block
+
+    with open(input_file, "r") as f_in:
+        for line in f_in:
+            #skip empty lines, reset block at empty lines
+            if len(line.strip()) < 1:
+                firstblock = 0
+                line_block = 0
+                continue
+            #load sequences
+            elts = line.split()
+
+            #identifier never encountered, register it
+            if elts[0] not in headers:
+                headers[elts[0]] = [elts[1]]
             else:
-                headers[elts[0]]=headers[elts[0]]+elts[1]
+                #if still in block 1
+                if firstblock == 1:
+                    #set counter of how many times we encountered this id
+                    if elts[0] not in duplicate_index:
+                        duplicate_index[elts[0]] = 0
+                    else:
+                        duplicate_index[elts[0]] = duplicate_index[elts[0]] + 1
+                    #create new id
+                    duplicate[line_block] = elts[0] + '_' + str(duplicate_index[elts[0]])
+                    print("duplicate at " + str(line_block) + " id set to " + duplicate[line_block], file=log)
+                    headers[duplicate[line_block]] = []
+                #add sequence to original or n-th duplicate depending on current block line
+                if line_block in duplicate:
+                    headers[duplicate[line_block]].append(elts[1])
+                else:
+                    headers[elts[0]].append(elts[1])
+
+            line_block = line_block + 1
+    return headers
+
 
-        line_block=line_block+1
+def psiblast2fasta(input_file: str, output_file: str) -> None:
+    headers = _read_psiblast(input_file)
 
     #write in output file
-    for key in headers.keys():
-        f_out.write(">"+key+"\n"+headers[key]+"\n")
+    with open(output_file, "w") as f_out:
+        for key, chunks in headers.items():
+            f_out.write(">" + key + "\n" + "".join(chunks) + "\n")
+
+
+def _get_queries(input_file: str) -> Set[str]:
+    with FastaReader(input_file) as reader:
+        return set(seq_id for seq_id, _ in reader.iter_records())
+
 
-    f_in.close()
-    f_out.close()
+def psiblast2fasta_split(input_file: str, queries_file: str, output_file: str,
+                         log_file: Optional[str] = None) -> None:
+    """
+    Converts a psiblast alignment to a .fasta alignment and, in the same pass,
+    to the "query only" (output_file + "_queries") and "reference alignment only"
+    (output_file + "_refs") sub-alignments. Queries are the sequences of queries_file.
+    """
+    queries = _get_queries(queries_file)
+
+    if log_file:
+        with open(log_file, "w") as log:
+            headers = _read_psiblast(input_file, log)
+    else:
+        headers = _read_psiblast(input_file)
+
+    with open(output_file, "w") as f_out, \
+            open(output_file + "_queries", "w") as f_queries, \
+            open(output_file + "_refs", "w") as f_refs:
+        for key, chunks in headers.items():
+            record = ">" + key + "\n" + "".join(chunks) + "\n"
+            f_out.write(record)
+            if key in queries:
+                f_queries.write(record)
+            else:
+                f_refs.write(record)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,31 @@
+"""
+Views of an alignment of several query files to a profile.
+
+In the likelihood mode, all queries can be aligned in one run. Placement software
+needs the alignment of a single query file though: the query-only alignment, or
+the full alignment of reference sequences and queries. Both are written from the
+alignment of all queries, with the sequence index of the file.
+"""
+
+__author__ = "Nikolai Romashchenko"
+__license__ = "MIT"
+
+
+from typing import Optional
+from pewo.io.fasta import FastaReader, FastaWriter, get_sequence_index
+
+
+def write_query_alignment(alignment_file: str, queries_file: str, output_file: str,
+                          refs_file: Optional[str] = None) -> None:
+    """
+    Writes the aligned sequences of queries_file found in alignment_file. If refs_file
+    is given, its reference sequences are written first, which makes a full alignment.
+    """
+    query_ids = get_sequence_index(queries_file).ids
+    with FastaReader(alignment_file) as reader, FastaWriter(output_file) as writer:
+        if refs_file:
+            with FastaReader(refs_file) as refs_reader:
+                for _, record in refs_reader.iter_records():
+                    writer.write_record(record)
+        for query_id in query_ids:
+            writer.write(query_id, reader.get(query_id))
@@ -9,30 +9,33 @@ __license__ = "MIT"
 
 
 import sys
-from Bio import SeqIO
-from typing import Dict
+from typing import Set
+from pewo.io.fasta import FastaReader, FastaWriter
 
 
-def _get_queries(input_file: str) -> Dict:
-    queries = {}
-    for record in SeqIO.parse(input_file, "fasta"):
-        queries[record.id] = 1
-    return queries
+def _get_queries(input_file: str) -> Set[str]:
+    with FastaReader(input_file) as reader:
+        return set(seq_id for seq_id, _ in reader.iter_records())
 
 
-if __name__ == "__main__":
+def split_alignment(queries_file: str, alignment_file: str) -> None:
+    """
+    Splits the alignment in alignment_file + "_queries" and alignment_file + "_refs".
+    """
     # set which identifiers are queries
-    input_file = sys.argv[1]
-    queries = _get_queries(input_file)
+    queries = _get_queries(queries_file)
 
     # parse and split alignment
-    with open(sys.argv[2] + "_queries", "w") as output_queries:
-        with open(sys.argv[2] + "_refs", "w") as output_refs:
-            for record in SeqIO.parse(sys.argv[2], "fasta"):
-                if record.id in queries:
-                    output_queries.write('>%s\n' % record.id)
-                    output_queries.write('%s\n' % record.seq)
-                else:
-                    print("REF:", record.id, len(record.seq))
-                    output_refs.write('>%s\n' % record.id)
-                    output_refs.write('%s\n' % record.seq)
+    with FastaReader(alignment_file) as reader, \
+            FastaWriter(alignment_file + "_queries") as output_queries, \
+            FastaWriter(alignment_file + "_refs") as output_refs:
+        for seq_id, sequence in reader.iter_sequences():
+            if seq_id in queries:
+                output_queries.write(seq_id, sequence)
+            else:
+                print("REF:", seq_id, len(sequence))
+                output_refs.write(seq_id, sequence)
+
+
+if __name__ == "__main__":
+    split_alignment(sys.argv[1], sys.argv[2])
@@ -0,0 +1,224 @@
+"""
+A content-addressed cache of expensive outputs, shared between working directories.
+
+Every cache entry is a directory named by a hash of the input files and parameters
+that determine the outputs. Cached files are linked into the working directory
+instead of being recomputed. The least recently used entries are removed
+when the cache grows over its size limit.
+"""
+
+__author__ = "Nikolai Romashchenko"
+__license__ = "MIT"
+
+
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional
+import pewo.config as cfg
+
+
+# Block size used to hash input files
+_HASH_BLOCK_SIZE = 1 << 20
+
+# A file touched every time an entry is used. Its modification time orders entries for eviction
+_STAMP_FILE = ".last_used"
+
+_LINK_TYPES = ("hardlink", "symlink", "copy")
+
+
+@lru_cache(maxsize=256)
+def _hash_file(path: str, size: int, mtime_ns: int) -> str:
+    """
+    Hashes the content of a file. The size and the modification time
+    are part of the lru_cache key, so that modified files are hashed again.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f_in:
+        for block in iter(lambda: f_in.read(_HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_file(input_file: str) -> str:
+    """
+    Returns the SHA-256 hex digest of the content of a file.
+    """
+    path = os.path.abspath(input_file)
+    stat = os.stat(path)
+    return _hash_file(path, stat.st_size, stat.st_mtime_ns)
+
+
+def make_key(kind: str, input_files: List[str], **params) -> str:
+    """
+    Creates a cache key from the content of input files and parameter values.
+    Names of input files do not change the key.
+    """
+    digest = hashlib.sha256(kind.encode("utf-8"))
+    for input_file in input_files:
+        digest.update(hash_file(input_file).encode("ascii"))
+    for name in sorted(params):
+        digest.update(f"\n{name}={params[name]}".encode("utf-8"))
+    return kind + "_" + digest.hexdigest()
+
+
+def _entry_size(entry_dir: str) -> int:
+    size = 0
+    for root, _, files in os.walk(entry_dir):
+        for filename in files:
+            try:
+                size += os.lstat(os.path.join(root, filename)).st_size
+            except FileNotFoundError:
+                pass
+    return size
+
+
+def _remove_file(path: str) -> None:
+    if os.path.lexists(path):
+        os.remove(path)
+
+
+class Cache:
+    """
+    A directory of cache entries. Files are stored and restored
+    in the order of the list of outputs of a rule.
+    """
+    def __init__(self, directory: str, max_size: Optional[int] = None, link: str = "hardlink") -> None:
+        if link not in _LINK_TYPES:
+            raise RuntimeError(f"Wrong cache link type: {link}. Expected one of: {', '.join(_LINK_TYPES)}")
+        self._directory = os.path.abspath(directory)
+        self._max_size = max_size
+        self._link = link
+        os.makedirs(self._directory, exist_ok=True)
+
+    @property
+    def directory(self) -> str:
+        return self._directory
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self._directory, key)
+
+    @staticmethod
+    def _entry_filenames(output_files: List[str]) -> List[str]:
+        # output files of a rule may have the same basename in different directories
+        return [f"{i}_{os.path.basename(output_file)}" for i, output_file in enumerate(output_files)]
+
+    def _link_file(self, source: str, destination: str) -> None:
+        _remove_file(destination)
+        if self._link == "hardlink":
+            try:
+                os.link(source, destination)
+                return
+            except OSError:
+                # the cache and the working directory may be on different file systems
+                pass
+        elif self._link == "symlink":
+            os.symlink(source, destination)
+            return
+        shutil.copyfile(source, destination)
+
+    def restore(self, key: str, output_files: List[str]) -> bool:
+        """
+        Links cached files to the output files. Returns False if the entry is
+        not in the cache, or if it was removed while being restored.
+        """
+        entry_dir = self._entry_dir(key)
+        if not os.path.isdir(entry_dir):
+            return False
+
+        try:
+            for filename, output_file in zip(self._entry_filenames(output_files), output_files):
+                self._link_file(os.path.join(entry_dir, filename), output_file)
+                # restored files must be newer than the inputs of the rule
+                os.utime(output_file)
+            os.utime(os.path.join(entry_dir, _STAMP_FILE))
+        except FileNotFoundError:
+            for output_file in output_files:
+                _remove_file(output_file)
+            return False
+        return True
+
+    def store(self, key: str, output_files: List[str], metadata: Optional[Dict[str, str]] = None) -> None:
+        """
+        Adds the output files to the cache, then removes least recently used
+        entries if the cache is over its size limit. Metadata values
+        are stored with the entry and can be read with get_metadata.
+        """
+        entry_dir = self._entry_dir(key)
+        if os.path.isdir(entry_dir):
+            return
+
+        # the entry becomes visible only when complete
+        tmp_dir = tempfile.mkdtemp(prefix=".tmp_", dir=self._directory)
+        try:
+            for filename, output_file in zip(self._entry_filenames(output_files), output_files):
+                try:
+                    os.link(os.path.realpath(output_file), os.path.join(tmp_dir, filename))
+                except OSError:
+                    shutil.copyfile(output_file, os.path.join(tmp_dir, filename))
+            with open(os.path.join(tmp_dir, _STAMP_FILE), "w") as f_out:
+                for name, value in (metadata or {}).items():
+                    print(f"{name}\t{value}", file=f_out)
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # the same entry was stored concurrently
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            if not os.path.isdir(entry_dir):
+                raise
+
+        self.evict()
+
+    def get_metadata(self, key: str) -> Dict[str, str]:
+        """
+        Returns metadata values stored with an entry.
+        """
+        metadata = {}
+        with open(os.path.join(self._entry_dir(key), _STAMP_FILE)) as f_in:
+            for line in f_in:
+                name, _, value = line.rstrip("\n").partition("\t")
+                metadata[name] = value
+        return metadata
+
+    def evict(self) -> None:
+        """
+        Removes least recently used entries until the cache fits in its size limit.
+        """
+        if self._max_size is None:
+            return
+
+        entries = []
+        for name in os.listdir(self._directory):
+            entry_dir = self._entry_dir(name)
+            stamp_file = os.path.join(entry_dir, _STAMP_FILE)
+            if name.startswith(".") or not os.path.isfile(stamp_file):
+                continue
+            entries.append((os.stat(stamp_file).st_mtime, _entry_size(entry_dir), entry_dir))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry_dir in sorted(entries):
+            if total_size <= self._max_size:
+                break
+            # rename first, so that the entry is never seen partially removed
+            trash_dir = os.path.join(self._directory, f".removed_{os.getpid()}_{time.monotonic_ns()}")
+            try:
+                os.rename(entry_dir, trash_dir)
+            except FileNotFoundError:
+                continue
+            shutil.rmtree(trash_dir, ignore_errors=True)
+            total_size -= size
+
+
+def get_cache(config: Dict, measured: bool = True) -> Optional[Cache]:
+    """
+    Returns the shared cache set in the config file, or None if caching is disabled.
+    The cache is not used for jobs that are measured in the resources and volume modes.
+    """
+    cache_dir = cfg.get_cache_dir(config)
+    if not cache_dir or (measured and cfg.measures_resources(config)):
+        return None
+
+    max_size = cfg.get_cache_max_size(config)
+    return Cache(cache_dir, max_size, config["cache"].get("link", "hardlink"))
@@ -8,14 +8,16 @@ __license__ = "MIT"
 
 
 from enum import Enum
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional
 from pewo.software import PlacementSoftware, AlignmentSoftware, CustomScripts
 
 
 class Mode(Enum):
     ACCURACY = 0,
     LIKELIHOOD = 1,
-    RESOURCES = 2
+    RESOURCES = 2,
+    SCALING = 3,
+    VOLUME = 4
 
 
 def get_work_dir(config: Dict) -> str:
@@ -53,6 +55,243 @@ def get_mode(config: Dict) -> Mode:
     raise RuntimeError(f"PEWO mode not specified in the config file. See config.yaml for details")
 
 
+def measures_resources(config: Dict) -> bool:
+    """
+    Returns if placement jobs are measured with Snakemake benchmarks, as in the
+    resources mode and in the query volume mode.
+    """
+    return get_mode(config) in (Mode.RESOURCES, Mode.VOLUME)
+
+
+def _is_enabled(settings: Dict) -> bool:
+    """
+    Returns if a config section is enabled. Values given with --config are strings.
+    """
+    return str(settings.get("enabled", False)).lower() in ("true", "1", "yes")
+
+
+def get_adaptive_repeats(config: Dict) -> Optional[Dict[str, Any]]:
+    """
+    Returns the settings of adaptive benchmark repeats, or None if they are disabled.
+    """
+    settings = config.get("adaptive_repeats", {})
+    if not _is_enabled(settings):
+        return None
+
+    adaptive = {
+        "min_repeats": int(settings.get("min_repeats", 3)),
+        "max_repeats": int(settings.get("max_repeats", 10)),
+        "tolerance": float(settings.get("tolerance", 0.05)),
+        "confidence": float(settings.get("confidence", 0.95))
+    }
+    assert 1 <= adaptive["min_repeats"] < adaptive["max_repeats"], \
+        f"Wrong adaptive_repeats values: {adaptive['min_repeats']}, {adaptive['max_repeats']}"
+    assert adaptive["tolerance"] > 0, f"Wrong adaptive_repeats tolerance: {adaptive['tolerance']}"
+    assert 0 < adaptive["confidence"] < 1, f"Wrong adaptive_repeats confidence: {adaptive['confidence']}"
+    return adaptive
+
+
+def get_repeats(config: Dict) -> int:
+    """
+    Returns the number of Snakemake benchmark repeats of measured jobs.
+    With adaptive repeats, jobs are run once and repeated by the benchmark harness.
+    """
+    if measures_resources(config) and get_adaptive_repeats(config):
+        return 1
+    return int(config["repeats"])
+
+
+def get_sampling_interval(config: Dict) -> Optional[float]:
+    """
+    Returns the interval in seconds at which measured jobs are sampled,
+    or None if sampling is disabled.
+    """
+    settings = config.get("sampling", {})
+    if not _is_enabled(settings):
+        return None
+
+    interval = float(settings.get("interval", 0.5))
+    assert interval > 0, f"Wrong sampling interval: {interval}"
+    return interval
+
+
+def get_prediction(config: Dict) -> Optional[Dict[str, Any]]:
+    """
+    Returns the settings of resource prediction, or None if it is disabled.
+    """
+    settings = config.get("prediction", {})
+    if not _is_enabled(settings):
+        return None
+
+    history = settings.get("history", [])
+    prediction = {
+        "history": [history] if isinstance(history, str) else list(history),
+        "margin": float(settings.get("margin", 1.2)),
+        "default_mem_mb": int(settings.get("default_mem_mb", 4000))
+    }
+    assert prediction["margin"] >= 1, f"Wrong prediction margin: {prediction['margin']}"
+    assert prediction["default_mem_mb"] > 0, f"Wrong prediction default_mem_mb: {prediction['default_mem_mb']}"
+    return prediction
+
+
+def get_default_runtime(config: Dict) -> int:
+    """
+    Returns the runtime in minutes of jobs which can not be predicted.
+    """
+    runtime = int(config.get("prediction", {}).get("default_runtime", 1440))
+    assert runtime > 0, f"Wrong prediction default_runtime: {runtime}"
+    return runtime
+
+
+def get_placement_server(config: Dict) -> Optional[Dict[str, float]]:
+    """
+    Returns the settings of the RAPPAS and EPIK placement servers, or None if they are disabled.
+    Servers are used in the likelihood mode only: in other modes, every database
+    places a single query file, and a server would only add its load measurement.
+    """
+    settings = config.get("placement_server", {})
+    if get_mode(config) != Mode.LIKELIHOOD or not _is_enabled(settings):
+        return None
+
+    server = {
+        "batch_window": float(settings.get("batch_window", 2.0)),
+        "idle_timeout": float(settings.get("idle_timeout", 60.0))
+    }
+    assert server["batch_window"] >= 0, f"Wrong placement_server batch_window: {server['batch_window']}"
+    assert server["idle_timeout"] > 0, f"Wrong placement_server idle_timeout: {server['idle_timeout']}"
+    return server
+
+
+def get_pruning_seed(config: Dict) -> int:
+    """
+    Returns the random seed of pruning generation.
+    """
+    return int(config.get("pruning_seed", 1))
+
+
+def get_query_shard_size(config: Dict) -> int:
+    """
+    Returns the number of queries placed together in the likelihood mode.
+    0 means that every query is placed separately.
+    """
+    shard_size = int(config.get("query_shard_size", 0))
+    assert shard_size >= 0, f"Wrong query_shard_size value: {shard_size}"
+    return shard_size
+
+
+def aligns_queries_together(config: Dict) -> bool:
+    """
+    Returns if all queries of the likelihood mode are aligned to a profile in one run,
+    instead of one run per query.
+    """
+    return get_mode(config) == Mode.LIKELIHOOD and \
+        str(config.get("batch_query_alignment", False)).lower() in ("true", "1", "yes")
+
+
+def builds_placement_table(config: Dict) -> bool:
+    """
+    Returns if the placements of all .jplace files are consolidated in a single table.
+    """
+    return str(config.get("placement_table", False)).lower() in ("true", "1", "yes")
+
+
+def writes_likelihood_rds(config: Dict) -> bool:
+    """
+    Returns if the combined likelihood values are also written as an R data frame,
+    which is loaded by the plotting script instead of likelihood.csv.
+    """
+    return get_mode(config) == Mode.LIKELIHOOD and \
+        str(config.get("likelihood_rds", False)).lower() in ("true", "1", "yes")
+
+
+def uses_extended_frequencies(config: Dict) -> bool:
+    """
+    Returns if the built-in likelihood evaluator counts GTR frequencies on the reference
+    alignment extended by the query, as raxml-ng does, instead of the reference alignment.
+    """
+    frequencies = str(config.get("lac", {}).get("frequencies", "extended")).lower()
+    if frequencies not in ("extended", "reference"):
+        raise RuntimeError(f"lac.frequencies: expected extended or reference, got {frequencies}.")
+    return frequencies == "extended"
+
+
+def uses_epang_binary(config: Dict) -> bool:
+    """
+    Returns if epa-ng placements load a binary dump of their reference.
+    """
+    epang = config.get("config_epang", {})
+    if int(epang.get("binary", 0)) == 0:
+        return False
+    if int(epang.get("premask", 0)) != 0:
+        raise RuntimeError("epa-ng binary dumps are not compatible with pre-masking, "
+                           "set premask to 0 in the config_epang section.")
+    return True
+
+
+def get_threads(config: Dict, tool: str, default: int = 1) -> int:
+    """
+    Returns the number of threads of a tool set in the "tools" section of the config file.
+    """
+    threads = int(config.get("tools", {}).get(tool, {}).get("threads", default))
+    assert threads >= 1, f"Wrong number of threads of {tool}: {threads}"
+    return threads
+
+
+def get_mem_mb(config: Dict, tool: str, default: int = 0) -> int:
+    """
+    Returns the memory of a tool in MB set in the "tools" section of the config file.
+    0 means no limit.
+    """
+    mem_mb = int(config.get("tools", {}).get(tool, {}).get("mem_mb", default))
+    assert mem_mb >= 0, f"Wrong memory value of {tool}: {mem_mb}"
+    return mem_mb
+
+
+def get_scaling_threads(config: Dict) -> List[int]:
+    """
+    Returns the sorted list of thread counts of the scaling mode.
+    """
+    threads = sorted(set(int(t) for t in config.get("scaling_threads", [1, 2, 4, 8])))
+    assert threads and threads[0] >= 1, f"Wrong scaling_threads value: {threads}"
+    return threads
+
+
+def get_query_counts(config: Dict) -> List[int]:
+    """
+    Returns the sorted list of query counts of the query volume mode.
+    """
+    counts = sorted(set(int(c) for c in config.get("query_counts", [1000, 10000, 100000])))
+    assert counts and counts[0] >= 1, f"Wrong query_counts value: {counts}"
+    return counts
+
+
+def get_query_seed(config: Dict) -> int:
+    """
+    Returns the random seed of query subsampling in the query volume mode.
+    """
+    return int(config.get("query_seed", 1))
+
+
+def get_cache_dir(config: Dict) -> Optional[str]:
+    """
+    Returns the directory of the cache shared between working directories,
+    or None if caching is disabled.
+    """
+    return config.get("cache", {}).get("dir") or None
+
+
+def get_cache_max_size(config: Dict) -> Optional[int]:
+    """
+    Returns the size limit of the shared cache in bytes, or None if not limited.
+    The limit is set in gigabytes in the config file.
+    """
+    max_size = config.get("cache", {}).get("max_size")
+    if max_size is None:
+        return None
+    assert float(max_size) > 0, f"Wrong cache max_size value: {max_size}"
+    return int(float(max_size) * 1024 ** 3)
+
+
 def query_user(config: Dict) -> bool:
     """
     Returns if PEWO should generate reads from the input tree.
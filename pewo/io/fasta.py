@@ -6,12 +6,27 @@ __author__ = "Nikolai Romashchenko"
 __license__ = "MIT"
 
 
+import itertools
+import mmap
 import os
-from Bio import SeqIO
-from typing import List
+from functools import lru_cache
+from typing import Any, Iterator, List, NamedTuple, Optional, Tuple, Union
 
 
-def _seq_id_filter(id: str) -> str:
+# Sequence indices are stored next to .fasta files, with this suffix
+INDEX_SUFFIX = ".pewo_index"
+_INDEX_HEADER = "#pewo_fasta_index"
+
+# Buffer size of FastaWriter
+_WRITE_BUFFER_SIZE = 1 << 20
+
+_WHITESPACE = b" \t\r\n"
+
+# A sequence or a record: a view of a memory-mapped file or bytes
+Sequence = Union[memoryview, bytes]
+
+
+def seq_id_filter(id: str) -> str:
     """
     Replaces underscores and semicolons with dashes in the sequence IDs.
     This is needed to have nice output filename templates with underscore
@@ -21,37 +36,291 @@ def _seq_id_filter(id: str) -> str:
     return result.replace(";", "-")
 
 
+class SequenceIndex(NamedTuple):
+    """
+    IDs of the sequences of a .fasta file and byte offsets of their headers.
+    """
+    ids: List[str]
+    offsets: List[int]
+
+
+def _iter_record_bounds(data: Union[mmap.mmap, bytes], start: int = 0) -> Iterator[Tuple[int, int, int]]:
+    """
+    Finds records of a .fasta file, starting from the given position. Yields positions
+    of the record start ('>'), the end of the header line and the record end.
+    Text before the first header is skipped.
+    """
+    if data[start:start + 1] != b">":
+        start = data.find(b"\n>", start)
+        if start < 0:
+            return
+        start += 1
+
+    while True:
+        header_end = data.find(b"\n", start)
+        if header_end < 0:
+            header_end = len(data)
+        next_start = data.find(b"\n>", header_end)
+        end = len(data) if next_start < 0 else next_start + 1
+        yield start, header_end, end
+        if next_start < 0:
+            return
+        start = next_start + 1
+
+
+def _parse_id(header: bytes) -> str:
+    """
+    Returns the first word of a header line without '>', as Bio.SeqIO does.
+    """
+    words = header[1:].split(None, 1)
+    return words[0].decode("utf-8") if words else ""
+
+
+def _map_file(f_in) -> Union[mmap.mmap, bytes]:
+    # empty files can not be memory-mapped
+    if os.fstat(f_in.fileno()).st_size == 0:
+        return b""
+    return mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _scan_fasta(input_file: str) -> SequenceIndex:
+    """
+    Finds sequence headers of a .fasta file. IDs are the first words
+    of the headers, as in Bio.SeqIO.
+    """
+    ids = []
+    offsets = []
+    with open(input_file, "rb") as f_in:
+        data = _map_file(f_in)
+        for start, header_end, _ in _iter_record_bounds(data):
+            ids.append(_parse_id(data[start:header_end]))
+            offsets.append(start)
+    return SequenceIndex(ids, offsets)
+
+
+class FastaReader:
+    """
+    A reader of .fasta files based on memory-mapped files. Records and sequences
+    are returned as views of the file when possible, without copying:
+    raw records always, sequences if they are written on one line.
+    Views stay valid after the reader is closed; the file is unmapped
+    when the last view is released.
+    """
+    def __init__(self, input_file: str) -> None:
+        self._input_file = input_file
+        self._file = open(input_file, "rb")
+        self._data = _map_file(self._file)
+        self._view = memoryview(self._data)
+        self._offsets = None
+
+    def __enter__(self) -> "FastaReader":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._view = None
+        self._data = None
+        self._file.close()
+
+    def __iter__(self) -> Iterator[Tuple[str, Sequence]]:
+        return self.iter_sequences()
+
+    def iter_records(self) -> Iterator[Tuple[str, memoryview]]:
+        """
+        Yields sequence IDs and raw records: the header and sequence lines.
+        """
+        for start, header_end, end in _iter_record_bounds(self._data):
+            yield _parse_id(self._data[start:header_end]), self._view[start:end]
+
+    def iter_sequences(self) -> Iterator[Tuple[str, Sequence]]:
+        """
+        Yields sequence IDs and sequences.
+        """
+        for start, header_end, end in _iter_record_bounds(self._data):
+            yield _parse_id(self._data[start:header_end]), self._get_sequence(header_end, end)
+
+    def get(self, seq_id: str) -> Sequence:
+        """
+        Returns the sequence by its ID. Uses the sequence index of the file.
+        """
+        if self._offsets is None:
+            index = get_sequence_index(self._input_file)
+            self._offsets = {}
+            for index_id, offset in zip(index.ids, index.offsets):
+                self._offsets.setdefault(index_id, offset)
+
+        if seq_id not in self._offsets:
+            raise KeyError(seq_id)
+        _, header_end, end = next(_iter_record_bounds(self._data, self._offsets[seq_id]))
+        return self._get_sequence(header_end, end)
+
+    def _get_sequence(self, header_end: int, end: int) -> Sequence:
+        start = header_end + 1
+        while end > start and self._data[end - 1] in _WHITESPACE:
+            end -= 1
+        if start >= end:
+            return b""
+        # multi-line sequences must be copied to remove line breaks
+        if self._data.find(b"\n", start, end) >= 0:
+            return b"".join(self._data[start:end].split())
+        return self._view[start:end]
+
+
+class FastaWriter:
+    """
+    A buffered writer of .fasta files.
+    """
+    def __init__(self, output_file: str, buffer_size: int = _WRITE_BUFFER_SIZE) -> None:
+        self._file = open(output_file, "wb", buffering=buffer_size)
+
+    def __enter__(self) -> "FastaWriter":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._file.close()
+
+    def write(self, seq_id: str, sequence: Sequence) -> None:
+        """
+        Writes a sequence on one line.
+        """
+        self._file.write(b">" + seq_id.encode("utf-8") + b"\n")
+        self._file.write(sequence)
+        self._file.write(b"\n")
+
+    def write_record(self, record: Sequence) -> None:
+        """
+        Writes a raw record as returned by FastaReader.iter_records().
+        """
+        self._file.write(record)
+        if len(record) > 0 and record[-1:] != b"\n":
+            self._file.write(b"\n")
+
+
+def _read_index(index_file: str, key: List[str]) -> Optional[SequenceIndex]:
+    """
+    Reads a sequence index. Returns None if the index does not exist
+    or was made for another version of the .fasta file.
+    """
+    try:
+        with open(index_file) as f_in:
+            if f_in.readline().rstrip("\n").split("\t") != [_INDEX_HEADER] + key:
+                return None
+            ids = []
+            offsets = []
+            for line in f_in:
+                seq_id, offset = line.rstrip("\n").split("\t")
+                ids.append(seq_id)
+                offsets.append(int(offset))
+            return SequenceIndex(ids, offsets)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_index(index_file: str, key: List[str], index: SequenceIndex) -> None:
+    """
+    Writes a sequence index. The index is first written in a temporary file
+    so that concurrent readers never see a partial index.
+    """
+    tmp_file = index_file + "." + str(os.getpid())
+    try:
+        with open(tmp_file, "w") as f_out:
+            print("\t".join([_INDEX_HEADER] + key), file=f_out)
+            for seq_id, offset in zip(index.ids, index.offsets):
+                print(seq_id, offset, sep="\t", file=f_out)
+        os.replace(tmp_file, index_file)
+    except OSError:
+        # the directory of the .fasta file is not writable: keep the index in memory only
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+@lru_cache(maxsize=16)
+def _load_index(input_file: str, size: int, mtime: int) -> SequenceIndex:
+    key = [input_file, str(size), str(mtime)]
+    index_file = input_file + INDEX_SUFFIX
+
+    index = _read_index(index_file, key)
+    if index is None:
+        index = _scan_fasta(input_file)
+        _write_index(index_file, key, index)
+    return index
+
+
+def get_sequence_index(input_file: str) -> SequenceIndex:
+    """
+    Returns the sequence index of a .fasta file. The index is stored in a sidecar
+    file next to the .fasta file and is memoized, so the .fasta file is scanned
+    only once. The index is rebuilt when the path, size or modification time
+    of the .fasta file change.
+    """
+    path = os.path.abspath(input_file)
+    stat = os.stat(path)
+    return _load_index(path, stat.st_size, stat.st_mtime_ns)
+
+
 def get_sequence_ids(input_file: str) -> List[str]:
     """
     Retrieves sequence IDs from the input .fasta file.
     """
-    return [_seq_id_filter(record.id) for record in SeqIO.parse(input_file, "fasta")]
+    return [seq_id_filter(seq_id) for seq_id in get_sequence_index(input_file).ids]
 
 
-def _write_fasta(records: List[SeqIO.SeqRecord], filename: str) -> None:
+def _get_shard_id(shard: int) -> str:
+    return "shard" + str(shard)
+
+
+def get_shard_ids(input_file: str, shard_size: int) -> List[str]:
+    """
+    Returns IDs of the shards of the input .fasta file, shard_size sequences per shard.
+    """
+    assert shard_size > 0
+    num_sequences = len(get_sequence_index(input_file).ids)
+    num_shards = (num_sequences + shard_size - 1) // shard_size
+    return [_get_shard_id(shard) for shard in range(num_shards)]
+
+
+def _iter_batches(records: Iterator[Any], batch_size: int) -> Iterator[List[Any]]:
     """
-    Writes a list of fasta records to file.
+    Groups consecutive records in lists of batch_size records.
     """
-    with open(filename, "w") as output:
-        SeqIO.write(records, output, "fasta")
+    while True:
+        batch = list(itertools.islice(records, batch_size))
+        if not batch:
+            return
+        yield batch
 
 
-def split_fasta(input_file: str, output_dir: str) -> List[str]:
+def split_fasta(input_file: str, output_dir: str, shard_size: int = 0) -> List[str]:
     """
     Splits the input .fasta file into multiple .fasta files,
-    one sequence per file. Returns the list of resulting files.
+    one sequence per file, or shard_size sequences per file if shard_size
+    is positive. Records are copied as they are. Returns the list of resulting files.
     """
     files = []
-    for record in SeqIO.parse(input_file, "fasta"):
-
-        #FIXME:
-        # By the convention, _r0 means "variable read length". Adding this
-        # makes implicit dependency on the read file name convention in ALL rules
-        # looking for read files: alignment_hmm, placement_rappas_dbinram etc.
-        output_file = os.path.join(output_dir,
-                                   _seq_id_filter(record.id) + "_r0" + ".fasta")
-        #print(output_file)
-        _write_fasta([record], output_file)
-        files.append(output_file)
+    with FastaReader(input_file) as reader:
+        records = reader.iter_records()
+        if shard_size > 0:
+            batches = ((_get_shard_id(shard), batch) for shard, batch in enumerate(_iter_batches(records, shard_size)))
+        else:
+            batches = ((seq_id_filter(seq_id), [(seq_id, record)]) for seq_id, record in records)
+
+        for file_id, batch in batches:
+
+            #FIXME:
+            # By the convention, _r0 means "variable read length". Adding this
+            # makes implicit dependency on the read file name convention in ALL rules
+            # looking for read files: alignment_hmm, placement_rappas_dbinram etc.
+            output_file = os.path.join(output_dir,
+                                       file_id + "_r0" + ".fasta")
+            #print(output_file)
+            with FastaWriter(output_file) as writer:
+                for _, record in batch:
+                    writer.write_record(record)
+            files.append(output_file)
 
     return files
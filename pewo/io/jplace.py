@@ -0,0 +1,352 @@
+"""
+A reader of .jplace files.
+
+Files are streamed: placements are parsed one by one, or read column-wise
+into arrays, without loading the whole JSON document.
+"""
+
+__author__ = "Nikolai Romashchenko"
+__license__ = "MIT"
+
+
+import array
+import json
+import mmap
+import re
+from typing import Dict, Iterator, List, NamedTuple, Optional, Union
+import numpy as np
+
+
+Number = Union[int, float]
+
+# Size of the text chunks read by the streaming parser
+_CHUNK_SIZE = 1 << 20
+
+_WHITESPACE_RE = re.compile(r"\s*")
+_FIELDS_KEY_RE = re.compile(rb'"fields"\s*:\s*\[')
+
+# Placement fields that are returned as columns by JplaceParser.read_columns()
+COLUMN_FIELDS = ["edge_num", "likelihood", "like_weight_ratio", "distal_length", "pendant_length"]
+
+
+def _make_field_index(fields: List[str]) -> Dict[str, int]:
+    """
+    Maps field names to their positions in placement records.
+    """
+    return dict((field, i) for i, field in enumerate(fields))
+
+
+class PlacementRecord:
+    """
+    A container for a placement record, e.g.
+    Example: [1, -0.1, 0.9, 0.1, 0.0]
+    """
+    __slots__ = ("_values", "_field_index")
+
+    def __init__(self, values: List[Number], fields: Union[List[str], Dict[str, int]]) -> None:
+        self._values = values
+        # Field positions are resolved once per file and shared by all records
+        self._field_index = fields if isinstance(fields, dict) else _make_field_index(fields)
+
+    def __getattr__(self, item: str):
+        """
+        'fields' indicated which fields are reported in the .jplace,
+        so the list of values can be ordered differently. This method returns
+        a value from the list of values by its name.
+        Examples of : "edge_num"
+        """
+        # slots that are not set yet, e.g. while unpickling
+        if item.startswith("_"):
+            raise AttributeError(item)
+
+        index = self._field_index.get(item)
+        if index is None:
+            raise RuntimeError(f"Wrong field: {item}. "
+                               f"Fields listed in the file: {list(self._field_index)}")
+        return self._values[index]
+
+    def __getstate__(self):
+        return self._values, self._field_index
+
+    def __setstate__(self, state) -> None:
+        self._values, self._field_index = state
+
+
+class PlacedSeq:
+    """
+    A container for a placed sequence.
+    """
+    __slots__ = ("_placements", "_names")
+
+    def __init__(self,
+                 # can be one placement (list) or list of placements
+                 placements: Union[PlacementRecord, List[PlacementRecord]],
+                 # can be a list with one name or a list of lists with name multiplicity
+                 names: Union[List[str], List[List[Union[str, int]]]]) -> None:
+        self._placements = placements
+        self._names = names
+
+    @staticmethod
+    def from_dict(placement_dict: Dict, fields: Union[List[str], Dict[str, int]]) -> "PlacedSeq":
+        """
+        Creates a PlacedSeq from a placement dictionary.
+        Example:
+            {
+                "p": [...]
+                "n": [...]
+            }
+        """
+        field_index = fields if isinstance(fields, dict) else _make_field_index(fields)
+        placements = [PlacementRecord(p, field_index) for p in placement_dict["p"]]
+
+        # Sequence name can be in the field "n" or "nm"
+        names_key = "n" if "n" in placement_dict else "nm"
+        assert names_key in placement_dict
+        names = placement_dict[names_key]
+
+        return PlacedSeq(placements, names)
+
+    @property
+    def placements(self):
+        return self._placements
+
+    @property
+    def names(self):
+        return self._names
+
+    @property
+    def sequence_name(self):
+        # if "name multiplicity"
+        if type(self._names[0]) == list:
+            return self._names[0][0]
+        # if just a name
+        else:
+            return self._names[0]
+
+
+class PlacementColumns(NamedTuple):
+    """
+    Placements of a .jplace file stored column-wise. Placements of the i-th
+    placed sequence are rows offsets[i]:offsets[i + 1]. Fields that are not
+    reported in the file are filled with NaN.
+    """
+    names: List[List[str]]
+    offsets: np.ndarray
+    edge_num: np.ndarray
+    likelihood: np.ndarray
+    like_weight_ratio: np.ndarray
+    distal_length: np.ndarray
+    pendant_length: np.ndarray
+
+
+class _JsonStream:
+    """
+    Reads JSON values one by one from a file, keeping only
+    a small chunk of the file in memory.
+    """
+    def __init__(self, input_file) -> None:
+        self._file = input_file
+        self._buffer = ""
+        self._position = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        """
+        Reads the next chunk of the file. Returns False at the end of file.
+        """
+        if self._eof:
+            return False
+        chunk = self._file.read(_CHUNK_SIZE)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._position:] + chunk
+        self._position = 0
+        return True
+
+    def peek(self) -> str:
+        """
+        Skips whitespaces and returns the next character, or an empty string at the end of file.
+        """
+        while True:
+            self._position = _WHITESPACE_RE.match(self._buffer, self._position).end()
+            if self._position < len(self._buffer):
+                return self._buffer[self._position]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise json.JSONDecodeError(f"Expecting '{char}'", self._buffer, self._position)
+        self._position += 1
+
+    def read_value(self):
+        """
+        Decodes the next JSON value.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._position)
+                # a number at the end of the buffer may continue in the next chunk
+                if end < len(self._buffer) or not self._fill():
+                    self._position = end
+                    return value
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+
+
+class JplaceParser:
+    """
+    Parses .jplace file. Placements can be either streamed one by one,
+    loaded in a DOM-like data structure using PlacedSeq and PlacementRecord,
+    or loaded column-wise in NumPy arrays.
+    """
+    def __init__(self, input_file: str) -> None:
+        self._input_file = input_file
+        self._placements = []
+        self._fields = None
+        self._field_index = None
+        self._tree = None
+
+    def parse(self) -> None:
+        """
+        Parser the input file, creating a list of PlacedSeq in self._placements.
+        """
+        self._placements = list(self.iter_placements())
+
+    def iter_placements(self) -> Iterator[PlacedSeq]:
+        """
+        Yields placed sequences one by one without loading the whole file.
+        """
+        for placement_dict in self._iter_placement_dicts():
+            yield PlacedSeq.from_dict(placement_dict, self._field_index)
+
+    def read_columns(self) -> PlacementColumns:
+        """
+        Reads all placements in NumPy columns for vectorized processing.
+        """
+        names = []
+        offsets = array.array("q", [0])
+        edge_num = array.array("q")
+        values = dict((field, array.array("d")) for field in COLUMN_FIELDS[1:])
+
+        for placement_dict in self._iter_placement_dicts():
+            field_index = self._field_index
+            records = placement_dict["p"]
+
+            if "n" in placement_dict:
+                names.append(placement_dict["n"])
+            else:
+                names.append([name for name, _ in placement_dict["nm"]])
+            offsets.append(offsets[-1] + len(records))
+
+            edge_field = field_index["edge_num"]
+            edge_num.extend(record[edge_field] for record in records)
+            for field, column in values.items():
+                index = field_index.get(field)
+                if index is None:
+                    column.extend(float("nan") for _ in records)
+                else:
+                    column.extend(record[index] for record in records)
+
+        return PlacementColumns(names=names,
+                                offsets=np.frombuffer(offsets, dtype=np.int64),
+                                edge_num=np.frombuffer(edge_num, dtype=np.int64).astype(np.int32),
+                                **dict((field, np.frombuffer(column, dtype=np.float64))
+                                       for field, column in values.items()))
+
+    def _set_fields(self, fields: List[str]) -> None:
+        """
+        Checks the "fields" section and resolves the field positions.
+        """
+        # Make sure the most important two fields are present
+        required_fields = ["edge_num", "likelihood"]
+        assert all(field in fields for field in required_fields), "Error while parsing " \
+            f"{self._input_file}: fields must declare {required_fields}"
+        self._fields = fields
+        self._field_index = _make_field_index(fields)
+
+    def _find_fields(self) -> List[str]:
+        """
+        Finds the "fields" section written after the placements
+        by searching from the end of the file.
+        """
+        with open(self._input_file, "rb") as jplace_file:
+            with mmap.mmap(jplace_file.fileno(), 0, access=mmap.ACCESS_READ) as content:
+                position = len(content)
+                while position > 0:
+                    position = content.rfind(b'"fields"', 0, position)
+                    if position < 0:
+                        break
+                    match = _FIELDS_KEY_RE.match(content, position)
+                    if match:
+                        end = content.find(b"]", match.end())
+                        return json.loads(content[match.end() - 1:end + 1].decode("utf-8"))
+
+        # .jplace file has to have "fields" that determines the order of
+        # output fields for each placement. Make sure it is there
+        raise AssertionError(f'{self._input_file} must contain "fields"')
+
+    def _iter_placement_dicts(self) -> Iterator[Dict]:
+        """
+        Streams the top-level object of the file, yielding placement dictionaries.
+        """
+        self._fields = None
+        self._tree = None
+        has_placements = False
+
+        with open(self._input_file) as jplace_file:
+            stream = _JsonStream(jplace_file)
+            stream.expect("{")
+            while stream.peek() != "}":
+                key = stream.read_value()
+                stream.expect(":")
+
+                if key == "placements":
+                    has_placements = True
+                    if self._fields is None:
+                        self._set_fields(self._find_fields())
+
+                    stream.expect("[")
+                    while stream.peek() != "]":
+                        yield stream.read_value()
+                        if stream.peek() == ",":
+                            stream.expect(",")
+                    stream.expect("]")
+                else:
+                    value = stream.read_value()
+                    if key == "fields":
+                        self._set_fields(value)
+                    elif key == "tree":
+                        self._tree = value
+
+                if stream.peek() == ",":
+                    stream.expect(",")
+            stream.expect("}")
+
+        # .jplace file has to have "fields" that determines the order of
+        # output fields for each placement. Make sure it is there
+        assert self._fields is not None, f'{self._input_file} must contain "fields"'
+
+        # check if .jplace has at least one placement
+        assert has_placements, "Error while parsing " \
+            f'{self._input_file}: input file must have the "placements" section.'
+
+    @property
+    def placements(self) -> List[PlacedSeq]:
+        return self._placements
+
+    @property
+    def fields(self) -> Optional[List[str]]:
+        return self._fields
+
+    @property
+    def tree(self) -> Optional[str]:
+        """
+        The newick string of the reference tree. Available once the "tree"
+        section has been read, i.e. after parsing.
+        """
+        return self._tree
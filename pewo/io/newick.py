@@ -0,0 +1,530 @@
+"""
+A module to work with .newick-formatted trees.
+
+Trees are stored as flat arrays indexed by node ids in the post-order DFS,
+which is the order used to number edges in .jplace files.
+"""
+
+__author__ = "Nikolai Romashchenko"
+__license__ = "MIT"
+
+
+import re
+import numpy as np
+from typing import Dict, List, Optional, Union
+
+
+# Newick tokens: structural characters, branch lengths, jplace edge numbers,
+# comments, quoted and unquoted labels.
+_TOKEN_RE = re.compile(r"""
+    \s*(?:
+        (?P<struct>[(),;])
+      | :(?P<length>[^(),;:\[\]{}\s]*)
+      | \{(?P<edge>-?\d+)\}
+      | \[(?P<comment>[^\]]*)\]
+      | '(?P<quoted>(?:[^']|'')*)'
+      | (?P<label>[^(),;:\[\]{}'\s]+)
+    )""", re.VERBOSE)
+
+
+# Structural characters and node attributes of newick strings
+# without quoted labels and comments
+_STRUCT_RE = re.compile(r"([(),;])")
+_ATTRIBUTES_RE = re.compile(r"\s*([^:{}\s]*)\s*(?::\s*([^{}\s]*))?\s*(?:\{(-?\d+)\})?\s*$")
+
+
+class Tree:
+    """
+    An array-based rooted tree. Node ids follow the post-order DFS,
+    so the root is always the last node and every child id is lower
+    than the id of its parent. The subtree of a node is the contiguous
+    range of ids [first(node), node].
+    """
+    def __init__(self,
+                 parent: np.ndarray,
+                 branch_length: np.ndarray,
+                 names: List[str],
+                 edge_num: np.ndarray) -> None:
+        self._parent = parent
+        self._branch_length = branch_length
+        self._names = names
+        self._edge_num = edge_num
+
+        num_nodes = len(parent)
+
+        # children in the CSR layout: children of node i are
+        # self._children[self._child_offsets[i]:self._child_offsets[i + 1]]
+        child_count = np.bincount(parent[:-1], minlength=num_nodes) if num_nodes > 1 \
+            else np.zeros(num_nodes, dtype=np.int64)
+        self._child_offsets = np.zeros(num_nodes + 1, dtype=np.int32)
+        np.cumsum(child_count, out=self._child_offsets[1:])
+        # a stable sort keeps children in the order they appear in the newick
+        self._children = np.argsort(parent[:-1], kind="stable").astype(np.int32)
+
+        # subtree sizes, accumulated bottom-up
+        subtree_size = np.ones(num_nodes, dtype=np.int32)
+        for node in range(num_nodes - 1):
+            subtree_size[parent[node]] += subtree_size[node]
+        self._first = np.arange(num_nodes, dtype=np.int32) - subtree_size + 1
+
+        # built on the first LCA query
+        self._root_distance = None
+        self._euler_entry = None
+        self._euler_table = None
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self._parent)
+
+    @property
+    def root(self) -> int:
+        return len(self._parent) - 1
+
+    @property
+    def parent(self) -> np.ndarray:
+        return self._parent
+
+    @property
+    def branch_length(self) -> np.ndarray:
+        """
+        Branch lengths of the edges leading to nodes. NaN if not set.
+        """
+        return self._branch_length
+
+    @property
+    def names(self) -> List[str]:
+        return self._names
+
+    @property
+    def edge_num(self) -> np.ndarray:
+        """
+        jplace edge numbers of the edges leading to nodes, -1 if not set.
+        """
+        return self._edge_num
+
+    @property
+    def first(self) -> np.ndarray:
+        """
+        The lowest node id of the subtree of every node.
+        """
+        return self._first
+
+    def children(self, node: int) -> np.ndarray:
+        return self._children[self._child_offsets[node]:self._child_offsets[node + 1]]
+
+    def is_leaf(self, node: int) -> bool:
+        return self._child_offsets[node] == self._child_offsets[node + 1]
+
+    def leaves(self) -> np.ndarray:
+        """
+        Returns ids of all leaves in the post-order.
+        """
+        return np.flatnonzero(self._child_offsets[:-1] == self._child_offsets[1:])
+
+    def depth(self) -> np.ndarray:
+        """
+        Returns the number of edges between every node and the root.
+        """
+        depth = np.zeros(self.num_nodes, dtype=np.int32)
+        # parents have greater ids than their children
+        for node in range(self.num_nodes - 2, -1, -1):
+            depth[node] = depth[self._parent[node]] + 1
+        return depth
+
+    def distance_from_root(self) -> np.ndarray:
+        """
+        Returns the sum of branch lengths between every node and the root.
+        Branches without length count as zero.
+        """
+        if self._root_distance is None:
+            branch_length = np.nan_to_num(self._branch_length)
+            distance = np.zeros(self.num_nodes, dtype=np.float64)
+            for node in range(self.num_nodes - 2, -1, -1):
+                distance[node] = distance[self._parent[node]] + branch_length[node]
+            self._root_distance = distance
+        return self._root_distance
+
+    def _build_lca_index(self) -> None:
+        """
+        Builds the Euler tour of the tree and a sparse table of minimum depths
+        over it. The LCA of two nodes is the shallowest node of the tour between
+        their first occurrences, found with two lookups in the table.
+        """
+        num_nodes = self.num_nodes
+        tour = np.empty(2 * num_nodes - 1, dtype=np.int32)
+        entry = np.zeros(num_nodes, dtype=np.int32)
+        next_child = self._child_offsets[:-1].copy()
+
+        # a node is recorded when entered and after each of its children
+        position = 0
+        stack = [self.root]
+        while stack:
+            node = stack[-1]
+            tour[position] = node
+            position += 1
+            if next_child[node] < self._child_offsets[node + 1]:
+                child = self._children[next_child[node]]
+                next_child[node] += 1
+                entry[child] = position
+                stack.append(child)
+            else:
+                stack.pop()
+
+        # row k holds the shallowest node of tour[i:i + 2 ** k]
+        depth = self.depth()
+        num_levels = len(tour).bit_length()
+        table = np.zeros((num_levels, len(tour)), dtype=np.int32)
+        table[0] = tour
+        for level in range(1, num_levels):
+            span = 1 << (level - 1)
+            left = table[level - 1, :len(tour) - 2 * span + 1]
+            right = table[level - 1, span:len(tour) - span + 1]
+            table[level, :len(left)] = np.where(depth[left] <= depth[right], left, right)
+
+        self._euler_entry = entry
+        self._euler_table = (table, depth)
+
+    def lca(self, u: Union[int, np.ndarray], v: Union[int, np.ndarray]) -> Union[int, np.ndarray]:
+        """
+        Returns the lowest common ancestor of nodes u and v, in O(1) after
+        an O(n log n) precomputation. Accepts arrays of nodes.
+        """
+        if self._euler_entry is None:
+            self._build_lca_index()
+        table, depth = self._euler_table
+
+        u_entry, v_entry = self._euler_entry[u], self._euler_entry[v]
+        start, end = np.minimum(u_entry, v_entry), np.maximum(u_entry, v_entry) + 1
+        level = np.floor(np.log2(end - start)).astype(np.int32)
+        left = table[level, start]
+        right = table[level, end - (1 << level)]
+        result = np.where(depth[left] <= depth[right], left, right)
+        return int(result) if np.ndim(result) == 0 else result
+
+    def path_length(self, u: Union[int, np.ndarray], v: Union[int, np.ndarray]) -> Union[float, np.ndarray]:
+        """
+        Returns the sum of branch lengths on the path between nodes u and v,
+        e.g. between two leaves. Accepts arrays of nodes.
+        """
+        distance = self.distance_from_root()
+        result = distance[u] + distance[v] - 2 * distance[self.lca(u, v)]
+        return float(result) if np.ndim(result) == 0 else result
+
+
+def _make_tree(parent: List[int], branch_length: List[float], names: List[str], edge_num: List[int]) -> Tree:
+    return Tree(np.array(parent, dtype=np.int32),
+                np.array(branch_length, dtype=np.float64),
+                names,
+                np.array(edge_num, dtype=np.int32))
+
+
+def _parse_plain(newick: str) -> Tree:
+    """
+    Parses a newick string without quoted labels and comments. The text between
+    two structural characters holds the attributes of one node, so every node is
+    read at once instead of token by token.
+    """
+    parent = []
+    branch_length = []
+    names = []
+    edge_num = []
+
+    stack = [[]]
+    # children of the internal node closed by the last ")"
+    children = None
+    closed = False
+
+    # the split alternates the text before a structural character and the character
+    tokens = _STRUCT_RE.split(newick)
+    for i in range(1, len(tokens), 2):
+        text, token = tokens[i - 1], tokens[i]
+        if token == "(":
+            if text.strip():
+                raise RuntimeError(f"Newick parsing error: unexpected {text.strip()} before (")
+            stack.append([])
+            continue
+
+        node_id = len(names)
+        if "{" in text:
+            match = _ATTRIBUTES_RE.match(text)
+            if not match:
+                raise RuntimeError(f"Newick parsing error: {text}")
+            name, length, edge = match.group(1), match.group(2), match.group(3)
+        else:
+            name, separator, length = text.partition(":")
+            name, length, edge = name.strip(), length if separator else None, None
+        names.append(name)
+        branch_length.append(float(length) if length is not None else np.nan)
+        edge_num.append(int(edge) if edge is not None else -1)
+        parent.append(-1)
+        if children:
+            for child in children:
+                parent[child] = node_id
+        stack[-1].append(node_id)
+        children = None
+
+        if token == ")":
+            if len(stack) < 2:
+                raise RuntimeError("Newick parsing error: unbalanced parentheses.")
+            children = stack.pop()
+        elif token == ";":
+            closed = True
+            break
+
+    # a newick string without the final semicolon
+    if not closed and (children is not None or tokens[-1].strip()):
+        return _parse_plain(newick + ";")
+
+    if len(stack) != 1 or len(stack[0]) != 1:
+        raise RuntimeError("Newick parsing error: the input must contain exactly one rooted tree.")
+
+    return _make_tree(parent, branch_length, names, edge_num)
+
+
+def parse(newick: str) -> Tree:
+    """
+    Parses a newick string. Supports jplace edge numbers in curly braces,
+    quoted labels and comments in square brackets (ignored).
+    """
+    if "'" not in newick and "[" not in newick:
+        return _parse_plain(newick)
+
+    parent = []
+    branch_length = []
+    names = []
+    edge_num = []
+
+    # children of internal nodes that are still open
+    stack = [[]]
+    # attributes of the node being read: [name, length, edge, children]
+    pending = None
+
+    def _finalize(node) -> int:
+        node_id = len(names)
+        name, length, edge, children = node
+        names.append(name)
+        branch_length.append(length)
+        edge_num.append(edge)
+        parent.append(-1)
+        for child in children:
+            parent[child] = node_id
+        return node_id
+
+    position = 0
+    newick = newick.strip()
+    while position < len(newick):
+        match = _TOKEN_RE.match(newick, position)
+        if not match:
+            raise RuntimeError(f"Newick parsing error at position {position}: {newick[position:position + 20]}")
+        position = match.end()
+
+        token = match.group("struct")
+        if token == "(":
+            stack.append([])
+        elif token is not None:
+            if pending is None:
+                pending = ["", np.nan, -1, []]
+            stack[-1].append(_finalize(pending))
+            pending = None
+
+            if token == ")":
+                if len(stack) < 2:
+                    raise RuntimeError("Newick parsing error: unbalanced parentheses.")
+                pending = ["", np.nan, -1, stack.pop()]
+            elif token == ";":
+                break
+        elif match.group("length") is not None:
+            pending = pending or ["", np.nan, -1, []]
+            pending[1] = float(match.group("length"))
+        elif match.group("edge") is not None:
+            pending = pending or ["", np.nan, -1, []]
+            pending[2] = int(match.group("edge"))
+        elif match.group("comment") is not None:
+            continue
+        else:
+            label = match.group("label")
+            if label is None:
+                label = match.group("quoted").replace("''", "'")
+            pending = pending or ["", np.nan, -1, []]
+            pending[0] = label
+
+    # a newick string without the final semicolon
+    if pending is not None:
+        stack[-1].append(_finalize(pending))
+
+    if len(stack) != 1 or len(stack[0]) != 1:
+        raise RuntimeError("Newick parsing error: the input must contain exactly one rooted tree.")
+
+    return _make_tree(parent, branch_length, names, edge_num)
+
+
+def read(input_file: str) -> Tree:
+    """
+    Reads a tree from a .newick file.
+    """
+    with open(input_file) as f_in:
+        return parse(f_in.read())
+
+
+def find_edge_index(tree: Tree) -> np.ndarray:
+    """
+    Creates an array mapping jplace edge numbers to node ids,
+    -1 for edge numbers not present in the tree.
+    """
+    edge_num = tree.edge_num
+    size = int(edge_num.max()) + 1 if len(edge_num) > 0 else 0
+    index = np.full(max(size, 0), -1, dtype=np.int32)
+    labelled = np.flatnonzero(edge_num >= 0)
+    index[edge_num[labelled]] = labelled
+    return index
+
+
+def find_node_index(tree: Tree) -> Dict[str, int]:
+    """
+    Creates a dictionary mapping names of leaves to node ids.
+    """
+    return dict((tree.names[leaf], int(leaf)) for leaf in tree.leaves())
+
+
+# Labels containing these characters must be quoted
+_QUOTED_LABEL_RE = re.compile(r"[\s(),:;\[\]{}']")
+
+
+def _format_label(label: str) -> str:
+    if _QUOTED_LABEL_RE.search(label):
+        return "'" + label.replace("'", "''") + "'"
+    return label
+
+
+def _format_length(length: float) -> str:
+    return repr(float(length))
+
+
+def _serialize(tree: Tree, edge_labels: bool = False):
+    """
+    Creates the newick string of a tree. Also returns, for every node, positions
+    in the string where its subtree starts, where its label ends and where
+    its branch ends.
+    """
+    num_nodes = tree.num_nodes
+    start = [0] * num_nodes
+    label_end = [0] * num_nodes
+    end = [0] * num_nodes
+
+    # the loop reads Python lists, which is much faster than indexing arrays
+    child_list = tree._children.tolist()
+    child_offsets = tree._child_offsets.tolist()
+    labels = [_format_label(name) for name in tree.names]
+    branch_length = tree.branch_length.tolist()
+    edge_num = tree.edge_num.tolist()
+
+    pieces = []
+    position = 0
+
+    # positive values open nodes, negative values ~node close them, None is a comma
+    stack = [tree.root]
+    while stack:
+        item = stack.pop()
+        if item is None:
+            pieces.append(",")
+            position += 1
+            continue
+
+        if item >= 0:
+            node = item
+            start[node] = position
+            first_child, last_child = child_offsets[node], child_offsets[node + 1]
+            if first_child < last_child:
+                pieces.append("(")
+                position += 1
+                stack.append(~node)
+                stack.append(child_list[last_child - 1])
+                for i in range(last_child - 2, first_child - 1, -1):
+                    stack.append(None)
+                    stack.append(child_list[i])
+                continue
+        else:
+            node = ~item
+            pieces.append(")")
+            position += 1
+
+        piece = labels[node]
+        label_end[node] = position + len(piece)
+        length = branch_length[node]
+        # NaN is the only value not equal to itself
+        if length == length:
+            piece += ":" + _format_length(length)
+        if edge_labels and edge_num[node] >= 0:
+            piece += "{" + str(edge_num[node]) + "}"
+        pieces.append(piece)
+        position += len(piece)
+        end[node] = position
+
+    pieces.append(";")
+    return "".join(pieces), start, label_end, end
+
+
+def to_string(tree: Tree, edge_labels: bool = False) -> str:
+    """
+    Creates the newick string of a tree. jplace edge numbers
+    are written only if edge_labels is set.
+    """
+    text, _, _, _ = _serialize(tree, edge_labels)
+    return text
+
+
+def write(tree: Tree, output_file: str, edge_labels: bool = False) -> None:
+    """
+    Writes a tree to a .newick file.
+    """
+    with open(output_file, "w") as f_out:
+        print(to_string(tree, edge_labels), file=f_out)
+
+
+class ExtendedTreeWriter:
+    """
+    Writes trees extended by one leaf. The reference tree is serialized once,
+    and every extended tree is produced by splicing a new branch in the
+    reference newick string, without copying or modifying the tree.
+    """
+    def __init__(self, tree: Tree) -> None:
+        self._tree = tree
+        self._text, self._start, self._label_end, self._end = _serialize(tree)
+
+    def _splice(self, node: int, distal_length: float, pendant_length: float, name: str) -> List[str]:
+        if not 0 <= node < self._tree.num_nodes:
+            raise RuntimeError(str(node) + " not found.")
+
+        text = self._text
+        branch_length = self._tree.branch_length[node]
+        node_branch = "" if np.isnan(branch_length) else ":" + _format_length(branch_length - distal_length)
+        return [
+            text[:self._start[node]],
+            "(",
+            text[self._start[node]:self._label_end[node]],
+            node_branch,
+            ",",
+            _format_label(name), ":", _format_length(pendant_length),
+            "):",
+            _format_length(distal_length),
+            text[self._end[node]:]
+        ]
+
+    def to_string(self, node: int, distal_length: float, pendant_length: float, name: str) -> str:
+        """
+        Creates the newick string of the tree with a new leaf attached to the branch
+        leading to the node. The node keeps its label and the branch length
+        minus distal_length; the new internal node gets the distal_length branch.
+        """
+        return "".join(self._splice(node, distal_length, pendant_length, name))
+
+    def write_to(self, f_out, node: int, distal_length: float, pendant_length: float, name: str) -> None:
+        """
+        Streams the extended tree to an open file, without building its string.
+        """
+        f_out.writelines(self._splice(node, distal_length, pendant_length, name))
+        f_out.write("\n")
+
+    def write(self, output_file: str, node: int, distal_length: float, pendant_length: float, name: str) -> None:
+        with open(output_file, "w") as f_out:
+            self.write_to(f_out, node, distal_length, pendant_length, name)
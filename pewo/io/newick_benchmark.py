@@ -0,0 +1,126 @@
+"""
+A micro-benchmark of pewo.io.newick against the Bio.Phylo trees.
+
+Times the tree operations of the workflow on the example trees of the repository:
+parsing, writing, extending a tree by one placed leaf, finding a node by its
+jplace edge number, and path lengths between leaves. Run from the repository root:
+
+    python -m pewo.io.newick_benchmark [TREE ...]
+"""
+
+__author__ = "Nikolai Romashchenko"
+__license__ = "MIT"
+
+
+import argparse
+import io
+import timeit
+from copy import deepcopy
+from typing import Callable, List, NamedTuple
+import numpy as np
+from Bio import Phylo
+from pewo.io import newick
+from pewo.io.jplace import COLUMN_FIELDS, PlacementRecord
+from pewo.likelihood.extend_tree import extend_tree, get_node_by_id
+
+
+# The 150- and 652-taxon trees of the examples
+DEFAULT_TREES = [
+    "examples/1_fast_test_of_accuracy_procedure/RAxML_bipartitions.150.BEST.WITH",
+    "examples/5_CPU_RAM_requirements_evaluation/tree_652.nwk"
+]
+
+RESULT_COLUMNS = ["tree", "leaves", "operation", "biopython_ms", "pewo_ms", "speedup"]
+
+# Number of random edges and leaf pairs per operation
+_NUM_QUERIES = 100
+
+
+class BenchmarkResult(NamedTuple):
+    operation: str
+    biopython_ms: float
+    pewo_ms: float
+
+
+def _time_ms(function: Callable[[], object], repeats: int) -> float:
+    """
+    Returns the best time of a function call in milliseconds.
+    """
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeats, number=number)) / number * 1000
+
+
+def _write_biopython(tree: Phylo.BaseTree.Tree) -> str:
+    output = io.StringIO()
+    Phylo.write(tree, output, "newick")
+    return output.getvalue()
+
+
+def _extend_biopython(tree: Phylo.BaseTree.Tree, edges: np.ndarray) -> None:
+    for edge in edges:
+        extended_tree = deepcopy(tree)
+        extend_tree(extended_tree, PlacementRecord([int(edge), 0.0, 1.0, 0.0, 0.1], COLUMN_FIELDS), "query")
+        _write_biopython(extended_tree)
+
+
+def _extend_pewo(writer: newick.ExtendedTreeWriter, edges: np.ndarray) -> None:
+    for edge in edges:
+        writer.to_string(int(edge), 0.0, 0.1, "query")
+
+
+def benchmark_tree(tree_file: str, repeats: int = 5, seed: int = 0) -> List[BenchmarkResult]:
+    """
+    Times every operation with both tree implementations on a tree.
+    """
+    with open(tree_file) as f_in:
+        text = f_in.read()
+
+    bio_tree = Phylo.read(io.StringIO(text), "newick")
+    tree = newick.parse(text)
+    writer = newick.ExtendedTreeWriter(tree)
+
+    random = np.random.default_rng(seed)
+    # the distal length 0 is valid for any edge except the root
+    edges = random.integers(0, tree.num_nodes - 1, _NUM_QUERIES)
+    node_index = newick.find_node_index(tree)
+    leaf_names = list(node_index)
+    pairs = random.integers(0, len(leaf_names), (_NUM_QUERIES, 2))
+    pair_names = [(leaf_names[i], leaf_names[j]) for i, j in pairs]
+    u = np.array([node_index[a] for a, _ in pair_names])
+    v = np.array([node_index[b] for _, b in pair_names])
+    # the LCA index is built once per tree
+    tree.path_length(0, 0)
+
+    return [
+        BenchmarkResult("parse",
+                        _time_ms(lambda: Phylo.read(io.StringIO(text), "newick"), repeats),
+                        _time_ms(lambda: newick.parse(text), repeats)),
+        BenchmarkResult("write",
+                        _time_ms(lambda: _write_biopython(bio_tree), repeats),
+                        _time_ms(lambda: newick.to_string(tree), repeats)),
+        BenchmarkResult(f"extend x{_NUM_QUERIES}",
+                        _time_ms(lambda: _extend_biopython(bio_tree, edges), repeats),
+                        _time_ms(lambda: _extend_pewo(writer, edges), repeats)),
+        BenchmarkResult(f"edge lookup x{_NUM_QUERIES}",
+                        _time_ms(lambda: [get_node_by_id(bio_tree, int(edge)).branch_length for edge in edges], repeats),
+                        _time_ms(lambda: tree.branch_length[edges], repeats)),
+        BenchmarkResult(f"leaf path length x{_NUM_QUERIES}",
+                        _time_ms(lambda: [bio_tree.distance(a, b) for a, b in pair_names], repeats),
+                        _time_ms(lambda: tree.path_length(u, v), repeats)),
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compares pewo.io.newick to Bio.Phylo on newick trees.")
+    parser.add_argument("trees", nargs="*", default=DEFAULT_TREES, help="newick files")
+    parser.add_argument("--repeats", type=int, default=5, help="number of timings of every operation")
+    args = parser.parse_args()
+
+    print("\t".join(RESULT_COLUMNS))
+    for tree_file in args.trees:
+        num_leaves = len(newick.read(tree_file).leaves())
+        for result in benchmark_tree(tree_file, args.repeats):
+            print("\t".join([tree_file, str(num_leaves), result.operation,
+                             f"{result.biopython_ms:.3f}", f"{result.pewo_ms:.3f}",
+                             f"{result.biopython_ms / result.pewo_ms:.1f}"]))
@@ -0,0 +1,250 @@
+"""
+A columnar store of the placements of all .jplace files of a working directory.
+
+Every .jplace file is read once and its placements are appended to a single
+table, with the key values of the file: software, pruning, and the wildcards
+of its placement parameters. Consumers scan this table instead of parsing
+thousands of JSON files.
+
+The table is an uncompressed .npz file, so every column is a contiguous
+array in the file, which is memory-mapped on reading. Placements of a file
+are consecutive rows, read as slices of the mapped columns without a copy.
+Strings (key values, sequence names, trees) are stored once in dictionaries
+and referenced by integer codes.
+"""
+
+__author__ = "Nikolai Romashchenko"
+__license__ = "MIT"
+
+
+import struct
+import zipfile
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+import numpy as np
+from pewo.io.jplace import COLUMN_FIELDS, JplaceParser, PlacementColumns
+
+
+# Row columns: the rank of a placement for its sequence, in the order of the .jplace file
+ROW_COLUMNS = ["rank"] + COLUMN_FIELDS
+
+_MISSING_VALUE = "NA"
+
+# Size of the local file header of a .zip entry
+_ZIP_HEADER_SIZE = 30
+
+
+class _Dictionary:
+    """
+    Assigns integer codes to strings in the order of their first appearance.
+    """
+    def __init__(self) -> None:
+        self._codes = {}
+
+    def encode(self, value: str) -> int:
+        return self._codes.setdefault(value, len(self._codes))
+
+    def values(self) -> np.ndarray:
+        return np.array(list(self._codes), dtype=np.str_)
+
+
+def write_placement_table(jobs: Iterable[Tuple[Dict[str, str], str]], output_file: str) -> None:
+    """
+    Reads .jplace files and writes their placements in a single table. jobs are pairs
+    of key values of a .jplace file, e.g. {"software": "epang", "pruning": "0", "g": "0.99"},
+    and the .jplace file. Keys missing for a file get the NA value.
+    """
+    jobs = list(jobs)
+    keys = list(dict.fromkeys(key for job_keys, _ in jobs for key in job_keys))
+    dictionaries = dict((key, _Dictionary()) for key in keys + ["file", "tree", "name"])
+
+    job_codes = dict((key, []) for key in keys + ["file", "tree"])
+    job_offsets = [0]
+    sequence_offsets = [0]
+    name_offsets = [0]
+    names = []
+    columns = dict((column, []) for column in ROW_COLUMNS)
+
+    for job_keys, jplace_file in jobs:
+        parser = JplaceParser(jplace_file)
+        placements = parser.read_columns()
+
+        for key in keys:
+            job_codes[key].append(dictionaries[key].encode(str(job_keys.get(key, _MISSING_VALUE))))
+        job_codes["file"].append(dictionaries["file"].encode(jplace_file))
+        job_codes["tree"].append(dictionaries["tree"].encode(parser.tree or ""))
+
+        counts = np.diff(placements.offsets)
+        columns["rank"].append(np.arange(len(placements.edge_num), dtype=np.int32) -
+                               np.repeat(placements.offsets[:-1], counts).astype(np.int32))
+        for field in COLUMN_FIELDS:
+            columns[field].append(getattr(placements, field))
+        for sequence_names in placements.names:
+            names.extend(dictionaries["name"].encode(name) for name in sequence_names)
+            name_offsets.append(len(names))
+        sequence_offsets.extend((sequence_offsets[-1] + placements.offsets[1:]).tolist())
+        job_offsets.append(len(sequence_offsets) - 1)
+
+    arrays = {
+        "job_offsets": np.array(job_offsets, dtype=np.int64),
+        "sequence_offsets": np.array(sequence_offsets, dtype=np.int64),
+        "name_offsets": np.array(name_offsets, dtype=np.int64),
+        "name": np.array(names, dtype=np.int32),
+        "keys": np.array(keys, dtype=np.str_)
+    }
+    for key, codes in job_codes.items():
+        arrays["job_" + key] = np.array(codes, dtype=np.int32)
+    for key, dictionary in dictionaries.items():
+        arrays["values_" + key] = dictionary.values()
+    for column, chunks in columns.items():
+        arrays[column] = np.concatenate(chunks) if chunks else np.empty(0)
+
+    # np.savez does not compress arrays, which keeps them memory-mappable
+    with open(output_file, "wb") as f_out:
+        np.savez(f_out, **arrays)
+
+
+def _map_npz(input_file: str) -> Dict[str, np.ndarray]:
+    """
+    Memory-maps the arrays of an uncompressed .npz file.
+    """
+    arrays = {}
+    with zipfile.ZipFile(input_file) as archive, open(input_file, "rb") as f_in:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise RuntimeError(f"{input_file}: {info.filename} is compressed and can not be memory-mapped.")
+
+            # the data of an entry follows its local header, which may differ from the central directory
+            f_in.seek(info.header_offset)
+            header = struct.unpack("<4s5H3L2H", f_in.read(_ZIP_HEADER_SIZE))
+            f_in.seek(info.header_offset + _ZIP_HEADER_SIZE + header[-2] + header[-1])
+
+            version = np.lib.format.read_magic(f_in)
+            read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) \
+                else np.lib.format.read_array_header_2_0
+            shape, fortran_order, dtype = read_header(f_in)
+            name = info.filename[:-len(".npy")]
+            if int(np.prod(shape)) == 0:
+                arrays[name] = np.empty(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(input_file, dtype=dtype, mode="r", offset=f_in.tell(),
+                                         shape=shape, order="F" if fortran_order else "C")
+    return arrays
+
+
+class PlacementTable:
+    """
+    A memory-mapped table of placements written by write_placement_table.
+    Jobs are the .jplace files of the table, identified by their index.
+    """
+    def __init__(self, input_file: str) -> None:
+        self._input_file = input_file
+        self._arrays = _map_npz(input_file)
+        self._keys = self._arrays["keys"].tolist()
+
+    @property
+    def keys(self) -> List[str]:
+        return self._keys
+
+    @property
+    def num_jobs(self) -> int:
+        return len(self._arrays["job_offsets"]) - 1
+
+    def _get_value(self, key: str, job: int) -> str:
+        return str(self._arrays["values_" + key][self._arrays["job_" + key][job]])
+
+    def get_keys(self, job: int) -> Dict[str, str]:
+        """
+        Returns the key values of a job.
+        """
+        return dict((key, self._get_value(key, job)) for key in self._keys)
+
+    def get_file(self, job: int) -> str:
+        return self._get_value("file", job)
+
+    def get_tree(self, job: int) -> str:
+        """
+        Returns the tree of the .jplace file of a job, with edge numbers.
+        """
+        return self._get_value("tree", job)
+
+    def find_jobs(self, **filters: Union[str, Iterable[str]]) -> List[int]:
+        """
+        Returns the jobs with the given key values. A filter is a value, or a list
+        of accepted values, e.g. find_jobs(software="epang", g=["0.99", "0.999"]).
+        Filters are applied to the small job table, placements are not scanned.
+        """
+        selected = np.ones(self.num_jobs, dtype=bool)
+        for key, accepted in filters.items():
+            if key not in self._keys:
+                raise RuntimeError(f"{self._input_file}: unknown key {key}. Keys: {self._keys}")
+            accepted = {accepted} if isinstance(accepted, str) else set(str(value) for value in accepted)
+            values = self._arrays["values_" + key]
+            codes = [code for code, value in enumerate(values.tolist()) if value in accepted]
+            selected &= np.isin(self._arrays["job_" + key], codes)
+        return np.flatnonzero(selected).tolist()
+
+    def _get_rows(self, job: int) -> Tuple[int, int, int, int]:
+        job_offsets = self._arrays["job_offsets"]
+        first_sequence, last_sequence = int(job_offsets[job]), int(job_offsets[job + 1])
+        sequence_offsets = self._arrays["sequence_offsets"]
+        return first_sequence, last_sequence, int(sequence_offsets[first_sequence]), \
+            int(sequence_offsets[last_sequence])
+
+    def get_column(self, job: int, column: str) -> np.ndarray:
+        """
+        Returns a column of the placements of a job, as a view of the mapped file.
+        """
+        assert column in ROW_COLUMNS, f"Wrong column: {column}"
+        _, _, start, end = self._get_rows(job)
+        return self._arrays[column][start:end]
+
+    def get_names(self, job: int) -> List[List[str]]:
+        """
+        Returns the names of every placed sequence of a job.
+        """
+        first_sequence, last_sequence, _, _ = self._get_rows(job)
+        name_offsets = self._arrays["name_offsets"][first_sequence:last_sequence + 1]
+        values = self._arrays["values_name"]
+        codes = self._arrays["name"][name_offsets[0]:name_offsets[-1]]
+        names = values[codes].tolist()
+        base = int(name_offsets[0])
+        return [names[start - base:end - base] for start, end in zip(name_offsets[:-1].tolist(),
+                                                                    name_offsets[1:].tolist())]
+
+    def read_columns(self, job: int) -> PlacementColumns:
+        """
+        Returns the placements of a job as JplaceParser.read_columns does.
+        Columns are views of the mapped file; offsets are copied.
+        """
+        first_sequence, last_sequence, start, end = self._get_rows(job)
+        offsets = np.array(self._arrays["sequence_offsets"][first_sequence:last_sequence + 1]) - start
+        return PlacementColumns(names=self.get_names(job),
+                                offsets=offsets,
+                                **dict((field, self._arrays[field][start:end]) for field in COLUMN_FIELDS))
+
+    def iter_jobs(self, **filters: Union[str, Iterable[str]]) -> Iterator[Tuple[int, PlacementColumns]]:
+        """
+        Yields the jobs with the given key values and their placements.
+        """
+        for job in self.find_jobs(**filters):
+            yield job, self.read_columns(job)
+
+    def read(self, columns: Optional[List[str]] = None,
+             **filters: Union[str, Iterable[str]]) -> Dict[str, np.ndarray]:
+        """
+        Returns columns of the placements of the jobs with the given key values,
+        and the job of every placement. A single job is returned without a copy.
+        """
+        columns = columns or ROW_COLUMNS
+        jobs = self.find_jobs(**filters)
+        ranges = [self._get_rows(job)[2:] for job in jobs]
+        result = {"job": np.repeat(np.array(jobs, dtype=np.int32),
+                                   [end - start for start, end in ranges])}
+        for column in columns:
+            assert column in ROW_COLUMNS, f"Wrong column: {column}"
+            chunks = [self._arrays[column][start:end] for start, end in ranges]
+            if len(chunks) == 1:
+                result[column] = chunks[0]
+            else:
+                result[column] = np.concatenate(chunks) if chunks else np.empty(0, self._arrays[column].dtype)
+        return result
@@ -0,0 +1,147 @@
+"""
+A writer of R data frames in the .rds format.
+
+The plotting scripts load results with read.csv, which guesses the type of every
+column from text. An .rds file stores the data frame itself: every column is a typed
+vector, loaded by readRDS without parsing. Files are written uncompressed,
+in the XDR serialization format version 2, readable by R >= 2.3.
+"""
+
+__author__ = "Nikolai Romashchenko"
+__license__ = "MIT"
+
+
+import struct
+from typing import BinaryIO, Dict, List, Optional
+import numpy as np
+
+
+# SEXP types
+_SYMSXP = 1
+_LISTSXP = 2
+_CHARSXP = 9
+_INTSXP = 13
+_REALSXP = 14
+_STRSXP = 16
+_VECSXP = 19
+_NILVALUE_SXP = 254
+
+# Flags of serialized objects
+_IS_OBJECT = 1 << 8
+_HAS_ATTR = 1 << 9
+_HAS_TAG = 1 << 10
+_UTF8 = 1 << 3 << 12
+_ASCII = 1 << 6 << 12
+
+_NA_INTEGER = -2 ** 31
+_NA_REAL = 0x7FF00000000007A2
+_NA_STRING = "NA"
+
+# R version written in the header and the oldest version able to read the file
+_R_VERSION = (3 << 16) + (6 << 8) + 0
+_MIN_R_VERSION = (2 << 16) + (3 << 8) + 0
+
+
+def _write_int(f_out: BinaryIO, value: int) -> None:
+    f_out.write(struct.pack(">i", value))
+
+
+def _write_string(f_out: BinaryIO, value: Optional[str]) -> None:
+    if value is None:
+        _write_int(f_out, _CHARSXP)
+        _write_int(f_out, -1)
+        return
+    data = value.encode("utf-8")
+    _write_int(f_out, _CHARSXP | (_ASCII if data.isascii() else _UTF8))
+    _write_int(f_out, len(data))
+    f_out.write(data)
+
+
+def _write_strings(f_out: BinaryIO, values: List[Optional[str]]) -> None:
+    _write_int(f_out, _STRSXP)
+    _write_int(f_out, len(values))
+    for value in values:
+        _write_string(f_out, value)
+
+
+def _write_attributes(f_out: BinaryIO, attributes: Dict[str, object]) -> None:
+    """
+    Writes attributes of an object as a pairlist of tagged values.
+    """
+    for name, value in attributes.items():
+        _write_int(f_out, _LISTSXP | _HAS_TAG)
+        _write_int(f_out, _SYMSXP)
+        _write_string(f_out, name)
+        if isinstance(value, np.ndarray):
+            _write_int(f_out, _INTSXP)
+            _write_int(f_out, len(value))
+            f_out.write(value.astype(">i4").tobytes())
+        else:
+            _write_strings(f_out, value)
+    _write_int(f_out, _NILVALUE_SXP)
+
+
+def _parse_column(values: List[str]) -> np.ndarray:
+    """
+    Converts a text column as read.csv does: integers if all values are
+    32-bit integers, real numbers if all values are numbers. NA and empty
+    values are missing. Raises ValueError for other columns.
+    """
+    missing = np.array([value in ("", _NA_STRING) for value in values], dtype=bool)
+    numbers = np.array(["0" if is_missing else value for value, is_missing in zip(values, missing)])
+    try:
+        column = numbers.astype(np.int64)
+        if np.all(np.abs(column) < 2 ** 31 - 1):
+            column[missing] = _NA_INTEGER
+            return column.astype(np.int32)
+    except (ValueError, OverflowError):
+        pass
+    column = numbers.astype(np.float64)
+    column.view(np.uint64)[missing] = _NA_REAL
+    return column
+
+
+def _write_column(f_out: BinaryIO, values: List[str]) -> None:
+    """
+    Writes a text column as an integer, a numeric or a factor vector.
+    """
+    try:
+        column = _parse_column(values)
+    except ValueError:
+        # strings are factors, as read.csv makes them in R < 4.0
+        levels = sorted(set(value for value in values if value != _NA_STRING))
+        codes = dict((level, i + 1) for i, level in enumerate(levels))
+        column = np.array([codes.get(value, _NA_INTEGER) for value in values], dtype=np.int32)
+        _write_int(f_out, _INTSXP | _IS_OBJECT | _HAS_ATTR)
+        _write_int(f_out, len(column))
+        f_out.write(column.astype(">i4").tobytes())
+        _write_attributes(f_out, {"levels": levels, "class": ["factor"]})
+        return
+
+    _write_int(f_out, _INTSXP if column.dtype == np.int32 else _REALSXP)
+    _write_int(f_out, len(column))
+    f_out.write(column.astype(">i4" if column.dtype == np.int32 else ">f8").tobytes())
+
+
+def write_data_frame(columns: Dict[str, List[str]], output_file: str) -> None:
+    """
+    Writes text columns of equal length as an R data frame, with the column types
+    read.csv would guess for them.
+    """
+    num_rows = len(next(iter(columns.values()))) if columns else 0
+    assert all(len(values) == num_rows for values in columns.values()), "Columns must have the same length"
+
+    with open(output_file, "wb") as f_out:
+        f_out.write(b"X\n")
+        _write_int(f_out, 2)
+        _write_int(f_out, _R_VERSION)
+        _write_int(f_out, _MIN_R_VERSION)
+
+        _write_int(f_out, _VECSXP | _IS_OBJECT | _HAS_ATTR)
+        _write_int(f_out, len(columns))
+        for values in columns.values():
+            _write_column(f_out, values)
+        # compact row names: 1..num_rows
+        _write_attributes(f_out, {"names": list(columns),
+                                  "class": ["data.frame"],
+                                  "row.names": np.array([_NA_INTEGER, -num_rows], dtype=np.int32)})
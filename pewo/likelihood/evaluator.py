@@ -0,0 +1,598 @@
+"""
+Computes the likelihood of extended trees without running an external program,
+for fixed model parameters and branch lengths (lac.optimization: OFF).
+
+Partial likelihood vectors of the reference tree are computed once with
+the Felsenstein pruning algorithm, in both directions of every branch.
+A tree extended by one query differs from the reference tree only
+at the insertion point, so its likelihood is obtained by combining the two
+vectors of the insertion branch with the query sequence.
+
+By default, GTR frequencies are counted on the extended alignment, as raxml-ng does.
+They depend on the query, so a query has its own lower vectors, cached and shared by all
+placements of the query. Its upper vectors are computed on the paths from the root to
+insertion branches only. With the frequencies of the reference alignment, all queries
+share the vectors of the reference tree.
+"""
+
+__author__ = "Nikolai Romashchenko"
+__license__ = "MIT"
+
+
+import math
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple, Union
+import numpy as np
+from pewo.io import newick
+from pewo.io.fasta import FastaReader
+from pewo.io.jplace import JplaceParser
+
+
+_DNA_STATES = "ACGT"
+# PAML order of amino acids
+_AMINO_STATES = "ARNDCQEGHILKMFPSTWYV"
+
+_DNA_AMBIGUITIES = {
+    "U": "T", "R": "AG", "Y": "CT", "S": "CG", "W": "AT", "K": "GT", "M": "AC",
+    "B": "CGT", "D": "AGT", "H": "ACT", "V": "ACG"
+}
+_AMINO_AMBIGUITIES = {"B": "DN", "Z": "EQ", "J": "IL"}
+
+# Supported values of phylo_params.model
+_DNA_MODELS = ("GTR+G",)
+_AMINO_MODELS = ("JTT+G", "WAG+G", "LG+G")
+
+# Parameters used by raxml-ng when the model is not optimized
+_DEFAULT_ALPHA = 1.0
+_MIN_FREQUENCY = 1.0e-3
+_MIN_BRANCH_LENGTH = 1.0e-6
+_MAX_BRANCH_LENGTH = 100.0
+
+# Memory limit of the partial likelihood vectors cached for queries
+_CACHE_MB = 1024
+
+_NUMBER_RE = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+
+
+def _make_state_table(states: str, ambiguities: Dict[str, str]) -> np.ndarray:
+    """
+    Creates a lookup table from characters to tip vectors. Gaps and unknown
+    characters are fully undetermined.
+    """
+    table = np.ones((256, len(states)), dtype=np.float64)
+    codes = dict((state, state) for state in states)
+    codes.update(ambiguities)
+    for char, code in codes.items():
+        vector = np.array([state in code for state in states], dtype=np.float64)
+        table[ord(char)] = vector
+        table[ord(char.lower())] = vector
+    return table
+
+
+def _regularized_gamma(a: float, x: float) -> float:
+    """
+    Computes the regularized lower incomplete gamma function P(a, x).
+    """
+    if x <= 0.0:
+        return 0.0
+    log_prefix = a * math.log(x) - x - math.lgamma(a)
+
+    if x < a + 1.0:
+        # series expansion
+        term = total = 1.0 / a
+        n = a
+        while abs(term) > abs(total) * 1e-15:
+            n += 1.0
+            term *= x / n
+            total += term
+        return total * math.exp(log_prefix)
+
+    # continued fraction for the upper function
+    tiny = 1e-300
+    b = x + 1.0 - a
+    c = 1.0 / tiny
+    d = 1.0 / b
+    h = d
+    i = 1
+    while True:
+        an = -i * (i - a)
+        b += 2.0
+        d = an * d + b
+        d = tiny if abs(d) < tiny else d
+        c = b + an / c
+        c = tiny if abs(c) < tiny else c
+        d = 1.0 / d
+        delta = d * c
+        h *= delta
+        i += 1
+        if abs(delta - 1.0) < 1e-15 or i > 10000:
+            break
+    return 1.0 - math.exp(log_prefix) * h
+
+
+def _gamma_quantile(a: float, p: float) -> float:
+    """
+    Finds x such that P(a, x) = p by bisection.
+    """
+    low, high = 0.0, max(1.0, a)
+    while _regularized_gamma(a, high) < p:
+        high *= 2.0
+    for _ in range(200):
+        middle = (low + high) / 2.0
+        if _regularized_gamma(a, middle) < p:
+            low = middle
+        else:
+            high = middle
+    return (low + high) / 2.0
+
+
+def gamma_rates(alpha: float, categories: int) -> np.ndarray:
+    """
+    Computes the mean rates of the discrete gamma model (Yang, 1994).
+    """
+    if categories == 1:
+        return np.ones(1, dtype=np.float64)
+
+    bounds = [_gamma_quantile(alpha, i / categories) for i in range(1, categories)]
+    # the mean of the rate in the category is expressed with the gamma(alpha + 1) CDF
+    cdf = [0.0] + [_regularized_gamma(alpha + 1.0, bound) for bound in bounds] + [1.0]
+    rates = np.diff(cdf) * categories
+    return rates / rates.mean()
+
+
+def read_paml_model(input_file: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reads exchangeabilities and frequencies of an amino acid model
+    from a PAML-formatted file, e.g. lg.dat.
+    """
+    with open(input_file) as f_in:
+        numbers = [float(value) for value in _NUMBER_RE.findall(f_in.read())]
+
+    num_states = len(_AMINO_STATES)
+    num_rates = num_states * (num_states - 1) // 2
+    if len(numbers) < num_rates + num_states:
+        raise RuntimeError(f"{input_file}: not a PAML model file.")
+
+    exchangeabilities = np.zeros((num_states, num_states), dtype=np.float64)
+    exchangeabilities[np.tril_indices(num_states, -1)] = numbers[:num_rates]
+    exchangeabilities += exchangeabilities.T
+
+    frequencies = np.array(numbers[num_rates:num_rates + num_states], dtype=np.float64)
+    return exchangeabilities, frequencies / frequencies.sum()
+
+
+class SubstitutionModel:
+    """
+    A time-reversible substitution model with discrete gamma rate heterogeneity.
+    """
+    def __init__(self,
+                 exchangeabilities: np.ndarray,
+                 frequencies: np.ndarray,
+                 alpha: float,
+                 categories: int) -> None:
+        self._exchangeabilities = exchangeabilities
+        self._frequencies = frequencies
+        self._rates = gamma_rates(alpha, categories)
+
+        rate_matrix = exchangeabilities * frequencies[np.newaxis, :]
+        np.fill_diagonal(rate_matrix, 0.0)
+        np.fill_diagonal(rate_matrix, -rate_matrix.sum(axis=1))
+        rate_matrix /= -np.dot(frequencies, np.diag(rate_matrix))
+
+        # the rate matrix is similar to a symmetric matrix
+        sqrt_frequencies = np.sqrt(frequencies)
+        symmetric = rate_matrix * sqrt_frequencies[:, np.newaxis] / sqrt_frequencies[np.newaxis, :]
+        eigenvalues, eigenvectors = np.linalg.eigh((symmetric + symmetric.T) / 2.0)
+        self._eigenvalues = eigenvalues
+        self._left = eigenvectors / sqrt_frequencies[:, np.newaxis]
+        self._right = eigenvectors.T * sqrt_frequencies[np.newaxis, :]
+
+    @property
+    def exchangeabilities(self) -> np.ndarray:
+        return self._exchangeabilities
+
+    @property
+    def frequencies(self) -> np.ndarray:
+        return self._frequencies
+
+    @property
+    def num_categories(self) -> int:
+        return len(self._rates)
+
+    def transition_matrices(self, lengths: np.ndarray) -> np.ndarray:
+        """
+        Computes transposed transition probability matrices for every branch length
+        and every rate category. Returns an array of shape (lengths, categories, states, states).
+        """
+        lengths = np.clip(np.asarray(lengths, dtype=np.float64), _MIN_BRANCH_LENGTH, _MAX_BRANCH_LENGTH)
+        exponents = np.exp(lengths[:, np.newaxis, np.newaxis] * self._rates[np.newaxis, :, np.newaxis] *
+                           self._eigenvalues[np.newaxis, np.newaxis, :])
+        matrices = np.einsum("is,lks,sj->lkij", self._left, exponents, self._right)
+        np.clip(matrices, 0.0, None, out=matrices)
+        return matrices.transpose(0, 1, 3, 2)
+
+
+def _normalize(partials: np.ndarray, scalers: np.ndarray) -> None:
+    """
+    Rescales partial likelihood vectors of every site to avoid underflows,
+    adding logarithms of scaling factors to scalers.
+    """
+    maximum = partials.max(axis=(0, 2))
+    maximum[maximum <= 0.0] = 1.0
+    partials /= maximum[np.newaxis, :, np.newaxis]
+    scalers += np.log(maximum)
+
+
+class _Partials:
+    """
+    Partial likelihood vectors of the reference tree for a set of site patterns.
+    Arrays have the shape (nodes, categories, patterns, states).
+    lower[node] is the likelihood of the subtree of the node, conditional on
+    the state of the node. upper[node] is the likelihood of the rest of the tree,
+    conditional on the state of the parent of the node. If upper is False,
+    upper vectors are computed on demand by compute_path.
+    """
+    def __init__(self, tree: newick.Tree, matrices: np.ndarray, tips: np.ndarray, upper: bool = True) -> None:
+        num_nodes = tree.num_nodes
+        num_categories = matrices.shape[1]
+        _, num_patterns, num_states = tips.shape
+        shape = (num_nodes, num_categories, num_patterns, num_states)
+
+        self._tree = tree
+        self._matrices = matrices
+        self.lower = np.empty(shape, dtype=np.float64)
+        self.lower_scalers = np.zeros((num_nodes, num_patterns), dtype=np.float64)
+        self.upper = np.empty(shape, dtype=np.float64)
+        self.upper_scalers = np.zeros((num_nodes, num_patterns), dtype=np.float64)
+        self._has_upper = np.full(num_nodes, upper, dtype=bool)
+
+        # post-order: children before parents
+        leaves = iter(range(len(tips)))
+        for node in range(num_nodes):
+            if tree.is_leaf(node):
+                self.lower[node] = tips[next(leaves)][np.newaxis, :, :]
+                continue
+            self.lower[node] = 1.0
+            for child in tree.children(node):
+                self.lower[node] *= self.lower[child] @ matrices[child]
+                self.lower_scalers[node] += self.lower_scalers[child]
+            _normalize(self.lower[node], self.lower_scalers[node])
+
+        if not upper:
+            return
+
+        # pre-order: parents before children
+        for node in range(num_nodes - 1, -1, -1):
+            children = tree.children(node)
+            if len(children) == 0:
+                continue
+
+            messages = [self.lower[child] @ matrices[child] for child in children]
+            if node != tree.root:
+                above = self.upper[node] @ matrices[node]
+                above_scalers = self.upper_scalers[node]
+            else:
+                above = np.ones(shape[1:], dtype=np.float64)
+                above_scalers = np.zeros(num_patterns, dtype=np.float64)
+
+            for i, child in enumerate(children):
+                self.upper[child] = above
+                self.upper_scalers[child] = above_scalers
+                for j, sibling in enumerate(children):
+                    if i != j:
+                        self.upper[child] *= messages[j]
+                        self.upper_scalers[child] += self.lower_scalers[sibling]
+                _normalize(self.upper[child], self.upper_scalers[child])
+
+    @property
+    def nbytes(self) -> int:
+        return self.lower.nbytes + self.upper.nbytes
+
+    def compute_path(self, target: int) -> None:
+        """
+        Computes upper vectors of the target node and of its ancestors, if not computed yet.
+        """
+        tree = self._tree
+        path = []
+        node = target
+        while node != tree.root and not self._has_upper[node]:
+            path.append(node)
+            node = tree.parent[node]
+
+        for node in reversed(path):
+            parent = tree.parent[node]
+            if parent != tree.root:
+                self.upper[node] = self.upper[parent] @ self._matrices[parent]
+                self.upper_scalers[node] = self.upper_scalers[parent]
+            else:
+                self.upper[node] = 1.0
+                self.upper_scalers[node] = 0.0
+            for sibling in tree.children(parent):
+                if sibling != node:
+                    self.upper[node] *= self.lower[sibling] @ self._matrices[sibling]
+                    self.upper_scalers[node] += self.lower_scalers[sibling]
+            _normalize(self.upper[node], self.upper_scalers[node])
+            self._has_upper[node] = True
+
+
+class LikelihoodEvaluator:
+    """
+    Evaluates the log-likelihood of the reference tree extended by one query sequence.
+    """
+    def __init__(self,
+                 tree: newick.Tree,
+                 reference_alignment: Dict[str, str],
+                 model: str,
+                 categories: int,
+                 model_file: Optional[str] = None,
+                 extended_frequencies: bool = True,
+                 cache_mb: int = _CACHE_MB) -> None:
+        if model in _DNA_MODELS:
+            self._state_table = _make_state_table(_DNA_STATES, _DNA_AMBIGUITIES)
+        elif model in _AMINO_MODELS:
+            self._state_table = _make_state_table(_AMINO_STATES, _AMINO_AMBIGUITIES)
+            if not model_file:
+                raise RuntimeError(f"{model}: the PAML file of the model must be set in lac.model_file.")
+        else:
+            raise RuntimeError(f"{model} is not supported by the likelihood evaluator.")
+
+        self._tree = tree
+        self._leaf_names = [tree.names[leaf] for leaf in tree.leaves()]
+
+        patterns, counts = self._find_patterns(reference_alignment)
+        # the pattern of columns inserted in the reference alignment by query insertions
+        gap_pattern = b"-" * len(self._leaf_names)
+        if gap_pattern not in patterns:
+            patterns.append(gap_pattern)
+            counts = np.append(counts, 0)
+        self._pattern_index = dict((pattern, i) for i, pattern in enumerate(patterns))
+
+        # GTR with equal exchangeabilities and empirical frequencies,
+        # which are the values of a non-optimized GTR model in raxml-ng
+        self._query_frequencies = extended_frequencies and model in _DNA_MODELS
+        if model in _DNA_MODELS:
+            self._state_counts = self._count_states(patterns, counts)
+            frequencies = self._make_frequencies(self._state_counts)
+            exchangeabilities = np.ones((len(frequencies), len(frequencies)), dtype=np.float64)
+        else:
+            exchangeabilities, frequencies = read_paml_model(model_file)
+        self._model = SubstitutionModel(exchangeabilities, frequencies, _DEFAULT_ALPHA, categories)
+
+        self._patterns = patterns
+        self._partials = self._compute_partials(patterns, self._model)
+
+        # models and partials of queries changing the frequencies, by state counts of queries.
+        # Queries are not evicted, so that placements of a query by all software share them
+        self._query_cache = {}
+        self._cache_bytes = 0
+        self._cache_limit = cache_mb * 1024 * 1024
+
+    def _encode(self, sequences: List[bytes]) -> np.ndarray:
+        """
+        Converts sequences of the same length to tip vectors of shape (sequences, sites, states).
+        """
+        codes = np.frombuffer(b"".join(sequences), dtype=np.uint8).reshape(len(sequences), -1)
+        return self._state_table[codes]
+
+    def _get_reference_rows(self, alignment: Dict[str, str]) -> List[bytes]:
+        rows = []
+        for name in self._leaf_names:
+            if name not in alignment:
+                raise RuntimeError(f"{name} is not found in the alignment.")
+            rows.append(alignment[name].upper().replace(".", "-").encode("ascii"))
+        return rows
+
+    def _find_patterns(self, alignment: Dict[str, str]) -> Tuple[List[bytes], np.ndarray]:
+        """
+        Finds distinct columns of the reference sequences and their counts.
+        """
+        rows = self._get_reference_rows(alignment)
+        matrix = np.frombuffer(b"".join(rows), dtype=np.uint8).reshape(len(rows), -1)
+        columns, counts = np.unique(np.ascontiguousarray(matrix.T), axis=0, return_counts=True)
+        return [column.tobytes() for column in columns], counts
+
+    def _count_states(self, patterns: List[bytes], counts: np.ndarray) -> np.ndarray:
+        """
+        Counts states in columns. Ambiguous characters are counted
+        as fractions of their states; gaps and unknown characters are ignored.
+        """
+        tips = self._encode(patterns)
+        num_states = tips.shape[2]
+        determined = tips.sum(axis=2)
+        weights = np.where(determined < num_states, 1.0 / determined, 0.0) * counts[:, np.newaxis]
+        return np.einsum("psx,ps->x", tips, weights)
+
+    @staticmethod
+    def _make_frequencies(state_counts: np.ndarray) -> np.ndarray:
+        """
+        Computes empirical state frequencies from state counts.
+        """
+        num_states = len(state_counts)
+        if state_counts.sum() == 0:
+            return np.full(num_states, 1.0 / num_states)
+        frequencies = np.maximum(state_counts / state_counts.sum(), _MIN_FREQUENCY)
+        return frequencies / frequencies.sum()
+
+    def _get_query_key(self, query: bytes) -> Optional[bytes]:
+        """
+        Returns the key of the model of the reference alignment extended by the query,
+        or None if the query does not change the model of the reference alignment.
+        """
+        if not self._query_frequencies:
+            return None
+        # states of the query are counted as a single column
+        query_counts = self._count_states([query], np.ones(1))
+        if query_counts.sum() == 0:
+            return None
+        return query_counts.tobytes()
+
+    def _get_query_partials(self, key: bytes) -> Tuple[SubstitutionModel, _Partials]:
+        """
+        Returns the model and partials of the reference patterns for a query key.
+        """
+        if key in self._query_cache:
+            return self._query_cache[key]
+
+        query_counts = np.frombuffer(key, dtype=np.float64)
+        frequencies = self._make_frequencies(self._state_counts + query_counts)
+        model = SubstitutionModel(self._model.exchangeabilities, frequencies, _DEFAULT_ALPHA,
+                                  self._model.num_categories)
+        partials = self._compute_partials(self._patterns, model, upper=False)
+        if self._cache_bytes + partials.nbytes <= self._cache_limit:
+            self._query_cache[key] = model, partials
+            self._cache_bytes += partials.nbytes
+        return model, partials
+
+    def _compute_partials(self, patterns: List[bytes], model: SubstitutionModel,
+                          upper: bool = True) -> _Partials:
+        # tips of shape (leaves, patterns, states)
+        tips = self._encode(patterns).transpose(1, 0, 2)
+        matrices = model.transition_matrices(np.nan_to_num(self._tree.branch_length))
+        return _Partials(self._tree, matrices, tips, upper)
+
+    def log_likelihood(self,
+                       alignment: Dict[str, str],
+                       query_name: str,
+                       node: int,
+                       distal_length: float,
+                       pendant_length: float) -> float:
+        """
+        Computes the log-likelihood of the reference tree with the query attached
+        to the branch leading to the node, as written by pewo.io.newick.ExtendedTreeWriter.
+        alignment contains the reference sequences and the aligned query.
+        """
+        return self.log_likelihoods(alignment, [(query_name, node, distal_length, pendant_length)])[0]
+
+    def log_likelihoods(self,
+                        alignment: Dict[str, str],
+                        placements: List[Tuple[str, int, float, float]]) -> List[float]:
+        """
+        Computes log-likelihoods of the reference tree extended by one query at a time.
+        placements are tuples (query name, node, distal length, pendant length) of queries
+        aligned to the reference in the alignment.
+        """
+        rows = self._get_reference_rows(alignment)
+        num_sites = len(rows[0])
+        matrix = np.frombuffer(b"".join(rows), dtype=np.uint8).reshape(len(rows), -1)
+        columns = [column.tobytes() for column in np.ascontiguousarray(matrix.T)]
+
+        # columns that are not in the reference alignment are evaluated separately
+        known = np.array([column in self._pattern_index for column in columns], dtype=bool)
+        indices = np.array([self._pattern_index[column] for column, is_known in zip(columns, known)
+                            if is_known], dtype=np.int64)
+        unknown = [column for column, is_known in zip(columns, known) if not is_known]
+        # partials of these columns by query key, computed once for the alignment
+        unknown_partials = {}
+
+        likelihoods = []
+        for query_name, node, distal_length, pendant_length in placements:
+            if not 0 <= node < self._tree.root:
+                raise RuntimeError(str(node) + " not found.")
+            if query_name not in alignment:
+                raise RuntimeError(f"{query_name} is not found in the alignment.")
+            query = alignment[query_name].upper().encode("ascii")
+            if len(query) != num_sites:
+                raise RuntimeError(f"{query_name}: the query is not aligned to reference sequences.")
+
+            key = self._get_query_key(query)
+            if key is None:
+                model, partials = self._model, self._partials
+            else:
+                model, partials = self._get_query_partials(key)
+                partials.compute_path(node)
+            if unknown and key not in unknown_partials:
+                unknown_partials[key] = self._compute_partials(unknown, model, upper=key is None)
+            query_unknown_partials = unknown_partials.get(key)
+            if query_unknown_partials is not None:
+                query_unknown_partials.compute_path(node)
+
+            lengths = [self._tree.branch_length[node] - distal_length, distal_length, pendant_length]
+            matrices = model.transition_matrices(lengths)
+            query_tips = self._encode([query])
+
+            total = 0.0
+            if len(indices) > 0:
+                total += self._sum_sites(model, partials, node, indices, query_tips[:, known], matrices)
+            if query_unknown_partials is not None:
+                total += self._sum_sites(model, query_unknown_partials, node, np.arange(len(unknown)),
+                                         query_tips[:, ~known], matrices)
+            likelihoods.append(total)
+        return likelihoods
+
+    @staticmethod
+    def _sum_sites(model: SubstitutionModel,
+                   partials: _Partials,
+                   node: int,
+                   indices: np.ndarray,
+                   query_tips: np.ndarray,
+                   matrices: np.ndarray) -> float:
+        """
+        Sums site log-likelihoods at the new node inserted on the branch leading to the node.
+        matrices are the transition matrices of the lower part of the branch, of its upper part
+        and of the pendant branch.
+        """
+        node_matrix, parent_matrix, pendant_matrix = matrices
+        below = partials.lower[node][:, indices] @ node_matrix
+        above = partials.upper[node][:, indices] @ parent_matrix
+        query = query_tips @ pendant_matrix
+        site_likelihoods = ((below * above * query) @ model.frequencies).mean(axis=0)
+        with np.errstate(divide="ignore"):
+            log_likelihoods = np.log(site_likelihoods)
+        return float(log_likelihoods.sum() + partials.lower_scalers[node][indices].sum() +
+                     partials.upper_scalers[node][indices].sum())
+
+
+def _read_alignment(input_file: str) -> Dict[str, str]:
+    with FastaReader(input_file) as reader:
+        return dict((seq_id, bytes(sequence).decode("ascii")) for seq_id, sequence in reader)
+
+
+@lru_cache(maxsize=4)
+def get_evaluator(tree_file: str,
+                  alignment_file: str,
+                  model: str,
+                  categories: int,
+                  model_file: Optional[str] = None,
+                  extended_frequencies: bool = True) -> LikelihoodEvaluator:
+    """
+    Creates an evaluator for a reference tree and alignment. Evaluators are cached,
+    so that partial likelihoods are computed once for all jobs of a workflow
+    using the same reference.
+    """
+    return LikelihoodEvaluator(newick.read(tree_file), _read_alignment(alignment_file),
+                               model, categories, model_file, extended_frequencies)
+
+
+def calculate_likelihoods(evaluator: LikelihoodEvaluator,
+                          jplace_files: List[str],
+                          alignment_files: Union[str, List[str]]) -> List[List[Tuple[str, float]]]:
+    """
+    Computes the log-likelihood of the reference tree extended by the best placement
+    of every sequence of every .jplace file. Placed sequences must be aligned
+    to the reference in the corresponding alignment file, or in a single alignment
+    of all sequences. Returns pairs of sequence names and log-likelihoods for every .jplace file.
+    """
+    if isinstance(alignment_files, str):
+        alignment_files = [alignment_files] * len(jplace_files)
+    assert len(jplace_files) == len(alignment_files)
+
+    results = []
+    alignments = {}
+    for jplace_file, alignment_file in zip(jplace_files, alignment_files):
+        names = []
+        placements = []
+        for placement in JplaceParser(jplace_file).iter_placements():
+            best_record = placement.placements[0]
+            names.append(placement.sequence_name)
+            placements.append((placement.sequence_name,
+                               best_record.edge_num,
+                               best_record.distal_length,
+                               best_record.pendant_length))
+
+        # a shared alignment is read once
+        if alignment_file not in alignments:
+            alignments = {alignment_file: _read_alignment(alignment_file)}
+        likelihoods = evaluator.log_likelihoods(alignments[alignment_file], placements)
+        results.append(list(zip(names, likelihoods)))
+    return results
@@ -9,124 +9,9 @@ import json
 import sys
 from copy import deepcopy
 from Bio import Phylo
-from typing import Dict, List, Union
-
-
-Number = Union[int, float]
-
-
-class PlacementRecord:
-    """
-    A container for a placement record, e.g.
-    Example: [1, -0.1, 0.9, 0.1, 0.0]
-    """
-    def __init__(self, values: List[Number], fields: List[str]) -> None:
-        self._values = values
-        self._fields = fields
-
-    def __getattr__(self, item: str):
-        """
-        'fields' indicated which fields are reported in the .jplace,
-        so the list of values can be ordered differently. This method returns
-        a value from the list of values by its name.
-        Examples of : "edge_num"
-        """
-        if item not in self._fields:
-            raise RuntimeError(f"Wrong field: {item}. "
-                               f"Fields listed in the file: {self._fields}")
-
-        return self._values[self._fields.index(item)]
-
-
-class PlacedSeq:
-    """
-    A container for a placed sequence.
-    """
-    def __init__(self,
-                 # can be one placement (list) or list of placements
-                 placements: Union[PlacementRecord, List[PlacementRecord]],
-                 # can be a list with one name or a list of lists with name multiplicity
-                 names: Union[List[str], List[List[Union[str, int]]]]) -> None:
-        self._placements = placements
-        self._names = names
-
-    @staticmethod
-    def from_dict(placement_dict: Dict, fields: List[str]) -> "PlacedSeq":
-        """
-        Creates a PlacedSeq from a placement dictionary.
-        Example:
-            {
-                "p": [...]
-                "n": [...]
-            }
-        """
-        placements = [PlacementRecord(p, fields) for p in placement_dict["p"]]
-
-        # Sequence name can be in the field "n" or "nm"
-        names_key = "n" if "n" in placement_dict else "nm"
-        assert names_key in placement_dict
-        names = placement_dict[names_key]
-
-        return PlacedSeq(placements, names)
-
-    @property
-    def placements(self):
-        return self._placements
-
-    @property
-    def names(self):
-        return self._names
-
-    @property
-    def sequence_name(self):
-        # if "name multiplicity"
-        if type(self._names[0]) == list:
-            return self._names[0][0]
-        # if just a name
-        else:
-            return self._names[0]
-
-
-class JplaceParser:
-    """
-    Parses .jplace file, creating a DOM-like data structure using
-    PlacedSeq and PlacementRecord.
-    """
-    def __init__(self, input_file: str) -> None:
-        self._input_file = input_file
-        self._placements = []
-
-    def parse(self) -> None:
-        """
-        Parser the input file, creating a list of PlacedSeq in self._placements.
-        WARNING: It parser only "edge_num" and "likelihood" fields.
-        """
-
-        self._placements = []
-        with open(self._input_file) as jplace_file:
-            content = json.load(jplace_file)
-
-            # .jplace file has to have "fields" that determines the order of
-            # output fields for each placement. Make sure it is there
-            assert "fields" in content, f'{self._input_file} must contain "fields"'
-            fields = content["fields"]
-
-            # Make sure the most important two fields are present
-            required_fields = ["edge_num", "likelihood"]
-            assert all(field in fields for field in required_fields), "Error while parsing " \
-                f"{self._input_file}: fields must declare {required_fields}"
-
-            # check if .jplace has at least one placement
-            assert "placements" in content,  "Error while parsing " \
-                f'{self.input_file}: input file must have the "placements" section.'
-
-            for placement_dict in content["placements"]:
-                placed_seq = PlacedSeq.from_dict(placement_dict, fields)
-                self._placements.append(placed_seq)
-
-    @property
-    def placements(self) -> List[PlacedSeq]:
-        return self._placements
+from typing import Iterator, List, Tuple
+from pewo.io import newick
+from pewo.io.jplace import JplaceParser, PlacementRecord
 
 
 def get_node_by_id(tree: Phylo.BaseTree, postorder_node_id: int) -> Phylo.BaseTree.Clade:
@@ -163,32 +48,47 @@ def extend_tree(tree: Phylo.BaseTree, placement: PlacementRecord, node_name: str
     x.name = ''
 
 
-def make_extended_tree(input_file: str, output_file: str, jplace_file: str) -> None:
-    try:
-        # parse the .jplace file
-        parser = JplaceParser(jplace_file)
-        parser.parse()
-
-        # we assume there was only one sequence placed.
-        placement = parser.placements[0]
-        # get the best placement reported
+def iter_extended_trees(writer: newick.ExtendedTreeWriter, jplace_file: str) -> Iterator[Tuple[str, str]]:
+    """
+    Extends the reference tree by every sequence of a .jplace file, one sequence
+    at a time, using the best placement reported. Yields pairs of
+    the sequence name and the newick string of the extended tree.
+    """
+    for placement in JplaceParser(jplace_file).iter_placements():
         best_record = placement.placements[0]
+        yield placement.sequence_name, writer.to_string(best_record.edge_num,
+                                                        best_record.distal_length,
+                                                        best_record.pendant_length,
+                                                        placement.sequence_name)
 
-        # get the placed sequence id
-        seq_name = placement.sequence_name
 
-        # read the tree
-        tree = Phylo.read(input_file, "newick")
+def make_extended_trees(input_file: str, jplace_files: List[str], output_files: List[str]) -> None:
+    """
+    Extends the reference tree by the placed sequences of every .jplace file.
+    The reference tree is parsed only once for all files. If a .jplace file
+    contains several placed sequences (e.g. a shard of queries), the output file
+    contains one extended tree per line, in the order of the .jplace file.
+    """
+    assert len(jplace_files) == len(output_files)
 
-        # extend the tree with the placed sequence
-        extend_tree(tree, best_record, seq_name)
+    # .jplace edge numbers are post-order node ids, which are
+    # the node ids of pewo.io.newick trees
+    writer = newick.ExtendedTreeWriter(newick.read(input_file))
 
-        # output the modified tree
-        Phylo.write(tree, output_file, "newick")
+    for jplace_file, output_file in zip(jplace_files, output_files):
+        try:
+            # output the modified trees
+            with open(output_file, "w") as f_out:
+                for _, extended_tree in iter_extended_trees(writer, jplace_file):
+                    print(extended_tree, file=f_out)
 
-    except json.JSONDecodeError as e:
-        print("Error: Invalid JSON file ", jplace_file)
-        print(e.msg)
+        except json.JSONDecodeError as e:
+            print("Error: Invalid JSON file ", jplace_file)
+            print(e.msg)
+
+
+def make_extended_tree(input_file: str, output_file: str, jplace_file: str) -> None:
+    make_extended_trees(input_file, [jplace_file], [output_file])
 
 
 if __name__ == "__main__":
@@ -1,18 +1,114 @@
+"""
+Combines the likelihood values of all queries in a single table.
 
+Every likelihood job writes a small .csv file. Files are aggregated by streaming
+their rows to the output: the header of every distinct schema is checked once,
+and rows are copied as text, reordered only if their columns differ from the output.
+Files are read by a pool of threads.
+"""
 
 __author__ = "Nikolai Romashchenko"
 __license__ = "MIT"
 
-import pandas as pd
-from typing import List
 
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+from pewo.io.rds import write_data_frame
 
-def combine_csv(input_files: List[str], output_file: str) -> None:
-    l = []
-    for f in input_files:
-        print(f)
-        l.append(pd.read_csv(f, delimiter=";"))
 
-    df = pd.concat(l)
-    df.to_csv(output_file, sep=";", index=False)
+_DELIMITER = ";"
 
+# Number of threads reading input files, and number of files read by one batch
+_READ_THREADS = 8
+_BATCH_SIZE = 4096
+
+
+def _read_header(input_file: str) -> str:
+    with open(input_file) as f_in:
+        return f_in.readline().rstrip("\n")
+
+
+def _read_file(input_file: str) -> Tuple[str, List[str]]:
+    """
+    Returns the header and non-empty rows of a .csv file.
+    """
+    with open(input_file) as f_in:
+        header = f_in.readline().rstrip("\n")
+        return header, [line.rstrip("\n") for line in f_in if line.strip()]
+
+
+def _iter_files(input_files: List[str], threads: int) -> Iterator[Tuple[str, str, List[str]]]:
+    """
+    Reads files in parallel and yields them in the input order. Files are read in batches,
+    which bounds the number of files held in memory.
+    """
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for start in range(0, len(input_files), _BATCH_SIZE):
+            batch = input_files[start:start + _BATCH_SIZE]
+            for input_file, (header, rows) in zip(batch, executor.map(_read_file, batch)):
+                yield input_file, header, rows
+
+
+def _get_columns(input_file: str, header: str) -> List[str]:
+    """
+    Checks the header of a schema and returns its columns.
+    """
+    columns = header.split(_DELIMITER)
+    if not header or len(set(columns)) != len(columns):
+        raise RuntimeError(f"{input_file}: wrong header: {header}")
+    return columns
+
+
+def combine_csv(input_files: List[str], output_file: str, rds_file: Optional[str] = None,
+                threads: int = _READ_THREADS) -> None:
+    """
+    Combines .csv files in a single file. Columns of the output are the union of
+    input columns in the order of their appearance; values of missing columns are empty.
+    If rds_file is given, the table is also written as a typed R data frame.
+    """
+    input_files = list(input_files)
+
+    # schemas are defined by the headers of files
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        headers = list(executor.map(_read_header, input_files))
+    schemas = {}
+    for input_file, header in zip(input_files, headers):
+        if header not in schemas:
+            schemas[header] = _get_columns(input_file, header)
+    output_columns = list(dict.fromkeys(column for columns in schemas.values() for column in columns))
+    num_columns = len(output_columns)
+    column_index = dict((column, i) for i, column in enumerate(output_columns))
+
+    # positions of schema columns in the output, None if they are the same
+    positions = dict((header, None if columns == output_columns else [column_index[c] for c in columns])
+                     for header, columns in schemas.items())
+    table = [[] for _ in output_columns] if rds_file else None
+
+    with open(output_file, "w") as f_out:
+        print(_DELIMITER.join(output_columns), file=f_out)
+        for input_file, header, rows in _iter_files(input_files, threads):
+            if header not in positions:
+                raise RuntimeError(f"{input_file}: the header has changed during reading.")
+            schema_positions = positions[header]
+            num_fields = len(schemas[header])
+
+            for row in rows:
+                values = row.split(_DELIMITER)
+                if len(values) != num_fields:
+                    raise RuntimeError(f"{input_file}: expected {num_fields} values: {row}")
+
+                if schema_positions is not None:
+                    output_values = [""] * num_columns
+                    for position, value in zip(schema_positions, values):
+                        output_values[position] = value
+                    values = output_values
+                    row = _DELIMITER.join(values)
+
+                f_out.write(row)
+                f_out.write("\n")
+                if table is not None:
+                    for column, value in zip(table, values):
+                        column.append(value)
+
+    if rds_file:
+        write_data_frame(dict(zip(output_columns, table)), rds_file)
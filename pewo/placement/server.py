@@ -0,0 +1,320 @@
+"""
+A local placement server for alignment-free placement software.
+
+RAPPAS and EPIK load their whole database before placing queries, and a separate
+run per query file (per query in the likelihood mode) reloads the database every time.
+A server is started for every placement command, i.e. database and placement parameters.
+Placement rules are thin clients, which send their query files to the server over a Unix
+socket. Queries received within a short window are placed in a single run, as both tools
+take several query files, so the database is loaded once per batch instead of once per
+query file. The server stops when no client has used it for a while.
+
+The load time of the database is measured once by the server, with a placement of a single
+query. Every batch loads the database once, and clients write their share of the load time
+apart from their share of the placement time. The peak memory of a batch is the one
+of its placement process tree, without the memory of the server.
+"""
+
+__author__ = "Nikolai Romashchenko"
+__license__ = "MIT"
+
+
+import argparse
+import csv
+import fcntl
+import hashlib
+import json
+import os
+import queue
+import shlex
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional
+import pewo.config as cfg
+from pewo.io import fasta
+from pewo.resources.harness import run_command
+
+
+# Columns of the reports written by clients
+REPORT_COLUMNS = ["queries", "batch_queries", "batch_requests", "load_s", "batch_s",
+                  "placement_s", "per_query_s", "max_rss"]
+
+# Name of the query file used to measure the load time
+_WARMUP_NAME = "pewo-server-warmup.fasta"
+
+# Time to wait for a starting server, in seconds
+_START_TIMEOUT = 60
+
+
+class _Request(NamedTuple):
+    queries: List[str]
+    query_count: int
+    connection: socket.socket
+
+
+def get_socket_path(command: str) -> str:
+    """
+    Returns the socket of the server of a placement command. Sockets are in the
+    temporary directory, as socket paths are limited to about a hundred characters.
+    """
+    digest = hashlib.sha1(command.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(tempfile.gettempdir(), f"pewo-placement-{digest}.sock")
+
+
+def _send(connection: socket.socket, message: Dict) -> None:
+    connection.sendall((json.dumps(message) + "\n").encode("utf-8"))
+
+
+def _receive(connection: socket.socket) -> Optional[Dict]:
+    data = b""
+    while not data.endswith(b"\n"):
+        chunk = connection.recv(65536)
+        if not chunk:
+            return None
+        data += chunk
+    return json.loads(data)
+
+
+def _format_command(command: str, queries: List[str], separator: str) -> str:
+    """
+    Replaces {queries} by query files. RAPPAS takes a comma-separated list
+    of files, EPIK takes files as separate arguments.
+    """
+    return command.format(queries=separator.join(shlex.quote(query) for query in queries))
+
+
+class PlacementServer:
+    """
+    Places query files of clients in batches with a placement command,
+    in which {queries} is replaced by the query files of a batch.
+    """
+    def __init__(self, command: str, output_dir: str, socket_path: str,
+                 batch_window: float, idle_timeout: float, separator: str = " "):
+        self._command = command
+        self._separator = separator
+        self._output_dir = output_dir
+        self._socket_path = socket_path
+        self._batch_window = batch_window
+        self._idle_timeout = idle_timeout
+        self._requests = queue.Queue()
+        self._load_s = None
+        self._batch = 0
+
+    def _accept(self, listener: socket.socket) -> None:
+        while True:
+            try:
+                connection, _ = listener.accept()
+            except OSError:
+                # the listener is closed
+                return
+            message = _receive(connection)
+            if not message:
+                connection.close()
+                continue
+            query_count = sum(len(fasta.get_sequence_index(query).ids) for query in message["queries"])
+            self._requests.put(_Request(message["queries"], query_count, connection))
+
+    def _measure_load(self, query_file: str) -> None:
+        """
+        Measures the load time of the database with a placement of a single query.
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            warmup_file = os.path.join(tmp_dir, _WARMUP_NAME)
+            with fasta.FastaReader(query_file) as reader, fasta.FastaWriter(warmup_file) as writer:
+                for _, record in reader.iter_records():
+                    writer.write_record(record)
+                    break
+            code, run = run_command(_format_command(self._command, [warmup_file], self._separator))
+        warmup_output = os.path.join(self._output_dir, "placements_" + _WARMUP_NAME + ".jplace")
+        if os.path.exists(warmup_output):
+            os.remove(warmup_output)
+        self._load_s = run.s if code == 0 else 0.0
+        print(f"Database loaded in {self._load_s:.3f} s", flush=True)
+
+    def _place(self, batch: List[_Request]) -> None:
+        if self._load_s is None:
+            self._measure_load(batch[0].queries[0])
+
+        self._batch += 1
+        queries = [query for request in batch for query in request.queries]
+        batch_queries = sum(request.query_count for request in batch)
+        print(f"Batch {self._batch}: {len(batch)} requests, {batch_queries} queries", flush=True)
+        code, run = run_command(_format_command(self._command, queries, self._separator))
+
+        # the load measured by the warm-up can exceed a short batch
+        load_s = min(self._load_s, run.s)
+        placement_s = run.s - load_s
+        for request in batch:
+            share = request.query_count / batch_queries if batch_queries else 1 / len(batch)
+            try:
+                _send(request.connection, {
+                    "code": code,
+                    "queries": request.query_count,
+                    "batch_queries": batch_queries,
+                    "batch_requests": len(batch),
+                    "load_s": load_s * share,
+                    "batch_s": run.s,
+                    "placement_s": placement_s * share,
+                    "max_rss": run.max_rss
+                })
+            except OSError:
+                pass
+            request.connection.close()
+
+    def serve(self) -> None:
+        """
+        Places batches of requests until no request is received for idle_timeout seconds.
+        """
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self._socket_path)
+        listener.listen()
+        threading.Thread(target=self._accept, args=(listener,), daemon=True).start()
+        try:
+            while True:
+                try:
+                    batch = [self._requests.get(timeout=self._idle_timeout)]
+                except queue.Empty:
+                    break
+                time.sleep(self._batch_window)
+                while not self._requests.empty():
+                    batch.append(self._requests.get())
+                self._place(batch)
+        finally:
+            os.remove(self._socket_path)
+            listener.close()
+        # requests accepted during shutdown are refused, clients start a new server
+        while not self._requests.empty():
+            self._requests.get().connection.close()
+
+
+def _connect(socket_path: str) -> Optional[socket.socket]:
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(socket_path)
+        return connection
+    except (FileNotFoundError, ConnectionRefusedError):
+        connection.close()
+        return None
+
+
+def _start_server(command: str, output_dir: str, socket_path: str, batch_window: float,
+                  idle_timeout: float, separator: str) -> socket.socket:
+    """
+    Connects to the server of a command, and starts it if needed. A lock file
+    prevents concurrent clients from starting several servers.
+    """
+    with open(socket_path + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        connection = _connect(socket_path)
+        if connection:
+            return connection
+
+        # a socket left by a killed server
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+        with open(socket_path + ".log", "a") as log:
+            subprocess.Popen([sys.executable, "-m", "pewo.placement.server", "serve",
+                              "--command", command,
+                              "--output-dir", output_dir,
+                              "--socket", socket_path,
+                              "--batch-window", str(batch_window),
+                              "--idle-timeout", str(idle_timeout),
+                              "--separator", separator],
+                             stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+                             start_new_session=True)
+
+        start = time.monotonic()
+        while time.monotonic() - start < _START_TIMEOUT:
+            connection = _connect(socket_path)
+            if connection:
+                return connection
+            time.sleep(0.1)
+    raise RuntimeError(f"The placement server did not start, see {socket_path}.log")
+
+
+def place(command: str, queries: List[str], output_dir: str, report_file: str,
+          batch_window: float, idle_timeout: float, separator: str = " ") -> int:
+    """
+    Places query files with the server of a command and writes the shares of the load
+    and placement times of the batch. Returns the exit code of the placement.
+    """
+    socket_path = get_socket_path(command)
+    reply = None
+    # the server may stop between the connection and the request
+    for _ in range(2):
+        connection = _start_server(command, output_dir, socket_path, batch_window, idle_timeout, separator)
+        with connection:
+            try:
+                _send(connection, {"queries": [os.path.abspath(query) for query in queries]})
+                reply = _receive(connection)
+            except ConnectionError:
+                reply = None
+        if reply:
+            break
+    if not reply:
+        raise RuntimeError(f"The placement server did not reply, see {socket_path}.log")
+
+    with open(report_file, "w", newline="") as f_out:
+        writer = csv.DictWriter(f_out, fieldnames=REPORT_COLUMNS, delimiter="\t", lineterminator="\n")
+        writer.writeheader()
+        writer.writerow({
+            "queries": str(reply["queries"]),
+            "batch_queries": str(reply["batch_queries"]),
+            "batch_requests": str(reply["batch_requests"]),
+            "load_s": f"{reply['load_s']:.4f}",
+            "batch_s": f"{reply['batch_s']:.4f}",
+            "placement_s": f"{reply['placement_s']:.4f}",
+            "per_query_s": f"{reply['placement_s'] / reply['queries']:.6f}" if reply["queries"] else "NA",
+            "max_rss": f"{reply['max_rss']:.2f}"
+        })
+    print(f"Placed {reply['queries']} queries in a batch of {reply['batch_queries']}: "
+          f"load {reply['load_s']:.3f} s, placement {reply['placement_s']:.3f} s. Server log: {socket_path}.log")
+    return reply["code"]
+
+
+def client_command(config: Dict, command: str, queries: str, output_dir: str, report_file: str,
+                   separator: str = " ") -> str:
+    """
+    Returns the shell command of a rule which places queries with a placement server.
+    The command must have a {{queries}} placeholder, as it is formatted by Snakemake first.
+    Query files of a batch are joined with the separator.
+    """
+    settings = cfg.get_placement_server(config)
+    return " ".join([shlex.quote(sys.executable), "-m", "pewo.placement.server", "place",
+                     "--command", shlex.quote(command),
+                     "--output-dir", output_dir,
+                     "--report", report_file,
+                     "--batch-window", str(settings["batch_window"]),
+                     "--idle-timeout", str(settings["idle_timeout"]),
+                     "--separator", shlex.quote(separator),
+                     queries])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="A local placement server and its client.")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    for action in ("serve", "place"):
+        subparser = subparsers.add_parser(action)
+        subparser.add_argument("--command", required=True, help="placement command with a {queries} placeholder")
+        subparser.add_argument("--output-dir", required=True, help="output directory of the placement software")
+        subparser.add_argument("--batch-window", type=float, default=2.0,
+                               help="seconds to wait for other requests before a placement")
+        subparser.add_argument("--idle-timeout", type=float, default=60.0,
+                               help="seconds without requests after which the server stops")
+        subparser.add_argument("--separator", default=" ", help="separator of query files in the command")
+    subparsers.choices["serve"].add_argument("--socket", required=True, help="socket of the server")
+    subparsers.choices["place"].add_argument("--report", required=True, help="output file of load and placement times")
+    subparsers.choices["place"].add_argument("queries", nargs="+", help="query files")
+    args = parser.parse_args()
+
+    if args.action == "serve":
+        PlacementServer(args.command, args.output_dir, args.socket, args.batch_window, args.idle_timeout,
+                        args.separator).serve()
+    else:
+        sys.exit(place(args.command, args.queries, args.output_dir, args.report, args.batch_window, args.idle_timeout,
+                       args.separator))
@@ -0,0 +1,156 @@
+"""
+Generates prunings of the reference tree for the accuracy mode.
+
+A pruning removes a random clade from the reference tree and the alignment.
+Leaves of the pruned clade are used to simulate reads, which are then placed
+on the pruned tree. Every pruning is generated independently: the pruned clade
+of pruning i depends only on the tree, the seed and i, so that prunings can be
+generated in parallel and adding prunings does not change existing ones.
+"""
+
+__author__ = "Benjamin Linard, Nikolai Romashchenko"
+__license__ = "MIT"
+
+
+from typing import Dict, Iterator, List, Tuple
+import numpy as np
+from pewo.io import fasta, newick
+
+
+# Pruned trees keep at least this number of leaves
+_MIN_LEAVES = 3
+
+_GAPS = b"-."
+
+
+def get_prunable_nodes(tree: newick.Tree) -> np.ndarray:
+    """
+    Returns the nodes that can be pruned: all nodes except the root,
+    if the pruned tree keeps enough leaves.
+    """
+    is_leaf = np.zeros(tree.num_nodes, dtype=np.int64)
+    is_leaf[tree.leaves()] = 1
+    # leaves of the subtree of every node, as the subtree ids are contiguous
+    leaf_count = np.concatenate(([0], np.cumsum(is_leaf)))
+    subtree_leaves = leaf_count[np.arange(tree.num_nodes) + 1] - leaf_count[tree.first]
+
+    total = subtree_leaves[tree.root]
+    nodes = np.flatnonzero(total - subtree_leaves >= _MIN_LEAVES)
+    return nodes[nodes != tree.root]
+
+
+def get_pruned_node(tree: newick.Tree, index: int, seed: int) -> int:
+    """
+    Returns the node pruned in the pruning number index. Nodes follow a random
+    permutation defined by the seed, so different prunings never prune the same node.
+    """
+    nodes = np.random.default_rng(seed).permutation(get_prunable_nodes(tree))
+    if index >= len(nodes):
+        raise RuntimeError(f"Pruning {index} requested, but the tree has only {len(nodes)} prunable nodes.")
+    return int(nodes[index])
+
+
+def _add_lengths(first: float, second: float) -> float:
+    if np.isnan(first) and np.isnan(second):
+        return np.nan
+    return float(np.nansum([first, second]))
+
+
+def prune(tree: newick.Tree, node: int) -> newick.Tree:
+    """
+    Removes the subtree of a node. If the parent of the node is left with one child,
+    the parent is removed and its branch is merged with the branch of the child.
+    Edge numbers are not kept.
+    """
+    if node == tree.root:
+        raise RuntimeError("The root can not be pruned.")
+
+    keep = np.ones(tree.num_nodes, dtype=bool)
+    keep[tree.first[node]:node + 1] = False
+    parent = tree.parent.copy()
+    branch_length = tree.branch_length.copy()
+
+    attachment = tree.parent[node]
+    siblings = [child for child in tree.children(attachment) if child != node]
+    if len(siblings) == 1:
+        sibling = siblings[0]
+        keep[attachment] = False
+        if attachment == tree.root:
+            parent[sibling] = -1
+            branch_length[sibling] = np.nan
+        else:
+            parent[sibling] = tree.parent[attachment]
+            branch_length[sibling] = _add_lengths(branch_length[sibling], branch_length[attachment])
+
+    # removing nodes keeps the post-order
+    new_ids = np.cumsum(keep) - 1
+    kept = np.flatnonzero(keep)
+    kept_parent = parent[kept]
+    return newick.Tree(np.where(kept_parent >= 0, new_ids[kept_parent], -1).astype(np.int32),
+                       branch_length[kept],
+                       [tree.names[i] for i in kept],
+                       np.full(len(kept), -1, dtype=np.int32))
+
+
+def simulate_reads(sequence: bytes, length: int, rng: np.random.Generator,
+                   length_sd: float = 0.0, coverage: float = 1.0) -> Iterator[Tuple[int, int]]:
+    """
+    Yields start and end positions of reads sampled uniformly from an unaligned sequence,
+    so that every position is covered by coverage reads on average.
+    Sequences shorter than the read length give a single read.
+    """
+    size = len(sequence)
+    if size <= length:
+        yield 0, size
+        return
+
+    for _ in range(max(1, int(round(coverage * size / length)))):
+        read_length = length if length_sd == 0 else int(np.clip(round(rng.normal(length, length_sd)), 1, size))
+        start = int(rng.integers(0, size - read_length + 1))
+        yield start, start + read_length
+
+
+def generate_pruning(alignment_file: str, tree_file: str, index: int,
+                     alignment_output: str, tree_output: str, pruned_output: str,
+                     read_outputs: Dict[int, str], seed: int,
+                     length_sd: float = 0.0, coverage: float = 1.0) -> List[str]:
+    """
+    Generates the pruning number index: the pruned tree and alignment, unaligned sequences
+    of the pruned leaves and reads simulated from them for every read length.
+    Reads are written as they are simulated. Returns the names of pruned leaves.
+    """
+    tree = newick.read(tree_file)
+    node = get_pruned_node(tree, index, seed)
+    newick.write(prune(tree, node), tree_output)
+
+    pruned_leaves = set(tree.names[leaf] for leaf in tree.leaves()
+                        if tree.first[node] <= leaf <= node)
+    found = set()
+
+    # every read length has its own random generator, so that adding
+    # read lengths does not change reads of other lengths
+    generators = {length: np.random.default_rng([seed, index, length]) for length in read_outputs}
+    read_writers = {length: fasta.FastaWriter(output_file) for length, output_file in read_outputs.items()}
+    try:
+        with fasta.FastaReader(alignment_file) as reader, \
+                fasta.FastaWriter(alignment_output) as alignment_writer, \
+                fasta.FastaWriter(pruned_output) as pruned_writer:
+            for (seq_id, record), (_, sequence) in zip(reader.iter_records(), reader.iter_sequences()):
+                if seq_id not in pruned_leaves:
+                    alignment_writer.write_record(record)
+                    continue
+
+                found.add(seq_id)
+                unaligned = bytes(sequence).translate(None, _GAPS)
+                pruned_writer.write(seq_id, unaligned)
+                for length, writer in read_writers.items():
+                    reads = simulate_reads(unaligned, length, generators[length], length_sd, coverage)
+                    for i, (start, end) in enumerate(reads):
+                        writer.write(f"{seq_id}_r{length}_{i}", unaligned[start:end])
+    finally:
+        for writer in read_writers.values():
+            writer.close()
+
+    if found != pruned_leaves:
+        raise RuntimeError(f"{alignment_file}: sequences not found: {', '.join(sorted(pruned_leaves - found))}")
+    return sorted(pruned_leaves)
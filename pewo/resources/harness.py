@@ -0,0 +1,321 @@
+"""
+An adaptive benchmark harness for the resources and volume modes.
+
+Instead of a fixed number of Snakemake benchmark repeats, a measured command
+is repeated by the harness within the job until the confidence intervals of its
+wall time and peak memory are narrow enough, or until a maximum number of runs.
+The first run is reported separately as the cold run, as file system caches are
+not filled yet. Warm runs far from the median are flagged as outliers and do not
+count in the statistics.
+
+Every run is written to a file next to the Snakemake benchmark file,
+with the _adaptive.tsv suffix instead of _benchmark.tsv. If sampling is enabled,
+the harness samples the process tree of the cold run itself, instead of being wrapped
+in the sampler, so that runs do not measure the sampler.
+"""
+
+__author__ = "Nikolai Romashchenko"
+__license__ = "MIT"
+
+
+import argparse
+import contextlib
+import csv
+import math
+import os
+import re
+import shlex
+import subprocess
+import sys
+import time
+from statistics import NormalDist
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+import numpy as np
+import pewo.config as cfg
+from pewo.resources.sampler import ProcessTree, SampleWriter, get_sample_file, sampled_command
+from pewo.resources.scaling import Measurement, read_benchmark
+
+
+# Columns of the run files written by the harness
+RUN_COLUMNS = ["run", "type", "s", "cpu_s", "max_rss", "outlier"]
+
+# Columns of the statistics table, consumed by the plotting scripts
+STATS_COLUMNS = ["benchmark", "runs", "warm_runs", "outliers", "converged",
+                 "cold_s", "mean_s", "median_s", "ci_low_s", "ci_high_s",
+                 "cold_max_rss", "mean_max_rss", "median_max_rss", "ci_low_max_rss", "ci_high_max_rss"]
+
+# Modified z-score above which a warm run is an outlier (Iglewicz and Hoaglin)
+_OUTLIER_THRESHOLD = 3.5
+
+_MISSING_VALUE = "NA"
+
+# Interval at which the memory of the process tree of a run is polled, in seconds
+_POLL_INTERVAL = 0.05
+
+
+class Run(NamedTuple):
+    """
+    A measured run of a command. Memory is in MB, as in Snakemake benchmarks.
+    """
+    s: float
+    cpu_s: float
+    max_rss: float
+
+
+def t_quantile(p: float, df: int) -> float:
+    """
+    Returns the p-quantile of the Student's t-distribution with df degrees of freedom.
+    Exact for one and two degrees of freedom, a Cornish-Fisher expansion otherwise.
+    """
+    if df == 1:
+        return math.tan(math.pi * (p - 0.5))
+    if df == 2:
+        return (2 * p - 1) / math.sqrt(2 * p * (1 - p))
+    z = NormalDist().inv_cdf(p)
+    return (z + (z ** 3 + z) / (4 * df)
+            + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2)
+            + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * df ** 3))
+
+
+def confidence_interval(values: np.ndarray, confidence: float) -> Tuple[float, float]:
+    """
+    Returns the confidence interval of the mean of values.
+    """
+    mean = float(np.mean(values))
+    if len(values) < 2:
+        return math.nan, math.nan
+    half_width = t_quantile((1 + confidence) / 2, len(values) - 1) * np.std(values, ddof=1) / math.sqrt(len(values))
+    return mean - half_width, mean + half_width
+
+
+def find_outliers(values: np.ndarray) -> np.ndarray:
+    """
+    Returns a mask of outliers, based on the median absolute deviation.
+    """
+    median = np.median(values)
+    mad = np.median(np.abs(values - median))
+    if mad == 0:
+        return np.zeros(len(values), dtype=bool)
+    return 0.6745 * np.abs(values - median) / mad > _OUTLIER_THRESHOLD
+
+
+def is_precise(runs: List[Run], tolerance: float, confidence: float) -> bool:
+    """
+    Checks if the confidence intervals of wall time and peak memory of warm runs,
+    outliers excluded, are within the relative tolerance of their means.
+    """
+    warm = runs[1:]
+    times = np.array([run.s for run in warm])
+    kept = ~find_outliers(times)
+    if kept.sum() < 2:
+        return False
+
+    for values in (times[kept], np.array([run.max_rss for run in warm])[kept]):
+        low, high = confidence_interval(values, confidence)
+        if (high - low) / 2 > tolerance * abs(np.mean(values)):
+            return False
+    return True
+
+
+def run_command(command: str, sample_file: Optional[str] = None, interval: float = 0.5) -> Tuple[int, Run]:
+    """
+    Runs a shell command. Returns its exit code and its measurements: CPU time
+    of all processes started by the command, and peak memory of the process tree.
+    As in Snakemake benchmarks, the memory of the command and its descendants
+    is summed at every poll, so concurrent processes of a pipeline add up.
+    Peaks between polls are bounded below by the largest peak of a single polled
+    process; the memory of the caller, inherited by the forked shell, is not counted.
+    If a sample file is given, resources of the process tree are also written to it
+    every interval seconds, as by the sampler.
+    """
+    start = time.monotonic()
+    process = subprocess.Popen(["bash", "-c", "set -euo pipefail; " + command])
+    tree = ProcessTree(process.pid)
+    max_rss = 0.0
+    with SampleWriter(process.pid, sample_file, interval) if sample_file else contextlib.nullcontext() as writer:
+        while True:
+            time_s = time.monotonic() - start
+            max_rss = max(max_rss, tree.poll(time_s).rss_mb)
+            if writer:
+                writer.poll(time_s)
+            pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+            if pid:
+                break
+            time.sleep(min(_POLL_INTERVAL, interval) if writer else _POLL_INTERVAL)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    wall_time = time.monotonic() - start
+    max_rss = max(max_rss, tree.peak_process_rss_mb)
+    return process.returncode, Run(wall_time, usage.ru_utime + usage.ru_stime, max_rss)
+
+
+def _write_runs(runs: List[Run], output_file: str) -> None:
+    outliers = np.zeros(len(runs), dtype=bool)
+    if len(runs) > 1:
+        outliers[1:] = find_outliers(np.array([run.s for run in runs[1:]]))
+
+    with open(output_file, "w", newline="") as f_out:
+        writer = csv.DictWriter(f_out, fieldnames=RUN_COLUMNS, delimiter="\t", lineterminator="\n")
+        writer.writeheader()
+        for i, (run, outlier) in enumerate(zip(runs, outliers)):
+            writer.writerow({
+                "run": str(i + 1),
+                "type": "cold" if i == 0 else "warm",
+                "s": f"{run.s:.4f}",
+                "cpu_s": f"{run.cpu_s:.4f}",
+                "max_rss": f"{run.max_rss:.2f}",
+                "outlier": str(bool(outlier)).upper()
+            })
+
+
+def run_adaptive(command: str, output_file: str, min_repeats: int, max_repeats: int,
+                 tolerance: float, confidence: float,
+                 sample_file: Optional[str] = None, interval: float = 0.5) -> int:
+    """
+    Runs a command once cold, then repeats it until at least min_repeats warm runs
+    are precise enough, or max_repeats runs in total are done. If a sample file
+    is given, the cold run is sampled. Returns the exit code of the first failed run, or 0.
+    """
+    runs = []
+    while len(runs) < max_repeats:
+        code, run = run_command(command, sample_file if not runs else None, interval)
+        if code != 0:
+            return code
+        runs.append(run)
+        _write_runs(runs, output_file)
+
+        if len(runs) - 1 >= min_repeats and is_precise(runs, tolerance, confidence):
+            break
+    return 0
+
+
+def read_runs(benchmark_file: str) -> List[Run]:
+    """
+    Reads runs of a harness run file, or repeats of a Snakemake benchmark file.
+    The first line of both is the cold run.
+    """
+    runs = []
+    with open(benchmark_file) as f_in:
+        for row in csv.DictReader(f_in, delimiter="\t"):
+            max_rss = row["max_rss"]
+            runs.append(Run(float(row["s"]),
+                            float(row.get("cpu_s") or row.get("cpu_time") or math.nan),
+                            float(max_rss) if max_rss not in ("", "-", "NA") else math.nan))
+    if not runs:
+        raise RuntimeError(f"{benchmark_file}: no measurements found.")
+    return runs
+
+
+def _format(value: float, digits: int = 4) -> str:
+    return _MISSING_VALUE if not math.isfinite(value) else f"{value:.{digits}f}"
+
+
+def summarize(runs: List[Run], tolerance: float, confidence: float) -> Dict[str, str]:
+    """
+    Returns statistics of warm runs, outliers excluded, and the cold run. A single
+    run is reported as both cold and warm.
+    """
+    warm = runs[1:] or runs
+    times = np.array([run.s for run in warm])
+    memory = np.array([run.max_rss for run in warm])
+    kept = ~find_outliers(times)
+
+    row = {
+        "runs": str(len(runs)),
+        "warm_runs": str(len(runs) - 1),
+        "outliers": str(int((~kept).sum())),
+        "converged": str(len(runs) > 2 and is_precise(runs, tolerance, confidence)).upper(),
+        "cold_s": _format(runs[0].s),
+        "cold_max_rss": _format(runs[0].max_rss, 2)
+    }
+    for name, values, digits in (("s", times[kept], 4), ("max_rss", memory[kept], 2)):
+        low, high = confidence_interval(values, confidence)
+        row.update({
+            f"mean_{name}": _format(float(np.mean(values)), digits),
+            f"median_{name}": _format(float(np.median(values)), digits),
+            f"ci_low_{name}": _format(low, digits),
+            f"ci_high_{name}": _format(high, digits)
+        })
+    return row
+
+
+def get_run_file(benchmark_file: str) -> str:
+    """
+    Returns the name of the harness run file of a Snakemake benchmark file.
+    """
+    return re.sub(r"_benchmark\.tsv$", "_adaptive.tsv", benchmark_file)
+
+
+def read_measurement(benchmark_file: str, adaptive: bool) -> Measurement:
+    """
+    Reads wall times and peak memory of a benchmark. With adaptive repeats,
+    the warm runs of the harness run file are read, outliers excluded.
+    """
+    run_file = get_run_file(benchmark_file)
+    if not adaptive or not os.path.exists(run_file):
+        return read_benchmark(benchmark_file)
+
+    runs = read_runs(run_file)
+    warm = runs[1:] or runs
+    times = np.array([run.s for run in warm])
+    kept = ~find_outliers(times)
+    return Measurement(times[kept], max(run.max_rss for run, keep in zip(warm, kept) if keep))
+
+
+def write_stats(config: Dict, benchmark_files: Iterable[str], output_file: str) -> None:
+    """
+    Writes statistics of every benchmark. With adaptive repeats,
+    runs are read from the harness run files.
+    """
+    settings = cfg.get_adaptive_repeats(config)
+    with open(output_file, "w", newline="") as f_out:
+        writer = csv.DictWriter(f_out, fieldnames=STATS_COLUMNS, delimiter="\t", lineterminator="\n")
+        writer.writeheader()
+        for benchmark_file in benchmark_files:
+            run_file = get_run_file(benchmark_file)
+            runs = read_runs(run_file if settings and os.path.exists(run_file) else benchmark_file)
+            row = summarize(runs, settings["tolerance"] if settings else 0.05,
+                            settings["confidence"] if settings else 0.95)
+            row["benchmark"] = os.path.basename(benchmark_file)
+            writer.writerow(row)
+
+
+def measured_command(config: Dict, command: str, benchmark_template: str,
+                     modes: Iterable[cfg.Mode] = (cfg.Mode.RESOURCES, cfg.Mode.VOLUME)) -> str:
+    """
+    Wraps a shell command of a rule measured in given modes: in the harness, if adaptive
+    repeats are enabled, which also samples the cold run if sampling is enabled;
+    in the sampler otherwise. Files of the harness and of the sampler are named after
+    the benchmark template of the rule, in which wildcards are replaced by {wildcards.name}.
+    """
+    settings = cfg.get_adaptive_repeats(config)
+    if not settings or cfg.get_mode(config) not in modes:
+        return sampled_command(config, command, benchmark_template, modes)
+
+    run_template = re.sub(r"\{(\w+)\}", r"{wildcards.\1}", get_run_file(benchmark_template))
+    arguments = [shlex.quote(sys.executable), "-m", "pewo.resources.harness",
+                 "--output", run_template,
+                 "--min-repeats", str(settings["min_repeats"]),
+                 "--max-repeats", str(settings["max_repeats"]),
+                 "--tolerance", str(settings["tolerance"]),
+                 "--confidence", str(settings["confidence"])]
+    interval = cfg.get_sampling_interval(config)
+    if interval:
+        sample_template = re.sub(r"\{(\w+)\}", r"{wildcards.\1}", get_sample_file(benchmark_template))
+        arguments.extend(["--samples", sample_template, "--interval", str(interval)])
+    return " ".join(arguments + ["--", shlex.quote(command)])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Repeats a shell command until its measurements are precise.")
+    parser.add_argument("--output", required=True, help="output file of measured runs")
+    parser.add_argument("--min-repeats", type=int, default=3, help="minimal number of warm runs")
+    parser.add_argument("--max-repeats", type=int, default=10, help="maximal number of runs, the cold one included")
+    parser.add_argument("--tolerance", type=float, default=0.05,
+                        help="maximal half-width of confidence intervals, relative to the mean")
+    parser.add_argument("--confidence", type=float, default=0.95, help="confidence level")
+    parser.add_argument("--samples", help="output file of samples of the cold run")
+    parser.add_argument("--interval", type=float, default=0.5, help="sampling interval in seconds")
+    parser.add_argument("command", help="shell command")
+    args = parser.parse_args()
+    sys.exit(run_adaptive(args.command, args.output, args.min_repeats, args.max_repeats,
+                          args.tolerance, args.confidence, args.samples, args.interval))
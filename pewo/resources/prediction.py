@@ -0,0 +1,259 @@
+"""
+Predicts memory and runtime of jobs from benchmarks of previous runs.
+
+Every resources run writes resources_history.tsv: the measurements of its
+benchmarks with the features of the jobs, i.e. the number of taxa and sites
+of the reference alignment, the number of queries, k, omega and threads.
+With "prediction: enabled", the history files listed in the config file are
+used to fit a log-linear model per operation, which fills the mem_mb and runtime
+resources of jobs when the DAG is built. The prediction is the largest measurement
+explained by the model, times a safety margin, and it grows with the attempt number
+of restarted jobs. Operations without enough history fall back to default values.
+"""
+
+__author__ = "Nikolai Romashchenko"
+__license__ = "MIT"
+
+
+import csv
+import glob
+import math
+import os
+import re
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+import numpy as np
+import pewo.config as cfg
+from pewo.io import fasta
+from pewo.resources.harness import read_measurement
+
+
+# Job features, and their transformation in the model
+FEATURES = ["taxa", "sites", "queries", "k", "omega", "threads"]
+_LOG_FEATURES = ("taxa", "sites", "queries", "omega", "threads")
+
+HISTORY_COLUMNS = ["operation"] + FEATURES + ["max_rss", "s"]
+
+# Parameters of benchmark file names used as features
+_NAME_FEATURES = {"k": "k", "o": "omega", "threads": "threads"}
+
+_MISSING_VALUE = "NA"
+
+
+def get_operation(benchmark_file: str) -> Tuple[str, Dict[str, str]]:
+    """
+    Returns the operation of a benchmark file, e.g. rappas-placement, and the parameters
+    of its name, e.g. {"k": "8", "o": "1.5"}. The software of ancestral reconstructions
+    is a part of their operation, e.g. ansrec-PHYML.
+    """
+    fields = os.path.basename(benchmark_file).split("_")
+    operation = fields[-2]
+    parameters = {}
+    for field in fields[1:-2]:
+        match = re.fullmatch(r"([a-z]+)(.+)", field)
+        if match:
+            parameters[match.group(1)] = match.group(2)
+
+    if operation == "ansrec" and "ar" in parameters:
+        operation += "-" + parameters["ar"]
+    return operation, parameters
+
+
+@lru_cache(maxsize=64)
+def _get_alignment_shape(alignment_file: str, mtime: int) -> Tuple[int, int]:
+    with fasta.FastaReader(alignment_file) as reader:
+        _, sequence = next(reader.iter_sequences())
+        return len(fasta.get_sequence_index(alignment_file).ids), len(sequence)
+
+
+def get_alignment_shape(alignment_file: str) -> Tuple[int, int]:
+    """
+    Returns the number of taxa and sites of an alignment.
+    """
+    return _get_alignment_shape(os.path.abspath(alignment_file), os.stat(alignment_file).st_mtime_ns)
+
+
+def count_queries(query_file: str) -> int:
+    return len(fasta.get_sequence_index(query_file).ids)
+
+
+def _to_float(value: Optional[str]) -> float:
+    return float(value) if value not in (None, "", "-", _MISSING_VALUE) else math.nan
+
+
+def write_history(config: Dict, benchmark_files: Iterable[str], output_file: str) -> None:
+    """
+    Writes measurements of benchmarks of the resources workflow with the features of their jobs.
+    """
+    work_dir = cfg.get_work_dir(config)
+    taxa, sites = get_alignment_shape(os.path.join(work_dir, "A", "0.align"))
+    adaptive = cfg.get_adaptive_repeats(config) is not None
+
+    with open(output_file, "w", newline="") as f_out:
+        writer = csv.DictWriter(f_out, fieldnames=HISTORY_COLUMNS, delimiter="\t", lineterminator="\n")
+        writer.writeheader()
+        for benchmark_file in sorted(benchmark_files):
+            operation, parameters = get_operation(benchmark_file)
+            query_file = os.path.join(work_dir, "R", f"0_r{parameters['length']}.fasta") \
+                if "length" in parameters else None
+            measurement = read_measurement(benchmark_file, adaptive)
+
+            row = {name: _MISSING_VALUE for name in FEATURES}
+            row.update({name: parameters[key] for key, name in _NAME_FEATURES.items() if key in parameters})
+            row.update({
+                "operation": operation,
+                "taxa": str(taxa),
+                "sites": str(sites),
+                "max_rss": f"{measurement.max_rss:.2f}",
+                "s": f"{float(measurement.times.mean()):.4f}"
+            })
+            if "threads" not in parameters:
+                row["threads"] = "1"
+            if query_file and os.path.exists(query_file):
+                row["queries"] = str(count_queries(query_file))
+            writer.writerow(row)
+
+
+class ResourceModel(NamedTuple):
+    """
+    A log-linear model of a resource of an operation. Features missing
+    at prediction are replaced by their mean in the history.
+    """
+    features: List[str]
+    coefficients: np.ndarray
+    means: np.ndarray
+    max_residual: float
+
+    def predict(self, features: Dict[str, float]) -> float:
+        x = np.array([_transform(name, features.get(name, math.nan)) for name in self.features])
+        x = np.where(np.isfinite(x), x, self.means)
+        return math.exp(self.coefficients[0] + x @ self.coefficients[1:] + self.max_residual)
+
+
+def _transform(name: str, value: float) -> float:
+    if name in _LOG_FEATURES:
+        return math.log(value) if value > 0 else math.nan
+    return value
+
+
+def fit_model(rows: List[Dict[str, float]], target: str) -> Optional[ResourceModel]:
+    """
+    Fits a model of a target column of history rows. Features missing in a row or constant
+    in the history are not used. Returns None if there are less rows than coefficients.
+    """
+    rows = [row for row in rows if row[target] > 0]
+    y = np.log([row[target] for row in rows])
+    columns = {name: np.array([_transform(name, row[name]) for row in rows]) for name in FEATURES}
+    features = [name for name, values in columns.items()
+                if np.all(np.isfinite(values)) and np.ptp(values) > 0]
+    if len(rows) < len(features) + 2:
+        return None
+
+    x = np.column_stack([np.ones(len(rows))] + [columns[name] for name in features])
+    coefficients, _, _, _ = np.linalg.lstsq(x, y, rcond=None)
+    residuals = y - x @ coefficients
+    return ResourceModel(features, coefficients, x[:, 1:].mean(axis=0), max(0.0, float(residuals.max())))
+
+
+class Predictor:
+    """
+    Predicts resources of operations from history files. Models are fitted on first use.
+    """
+    def __init__(self, history_files: Iterable[str], margin: float):
+        self._margin = margin
+        self._rows = {}
+        self._models = {}
+        for history_file in history_files:
+            with open(history_file) as f_in:
+                for row in csv.DictReader(f_in, delimiter="\t"):
+                    values = {name: _to_float(row[name]) for name in FEATURES + ["max_rss", "s"]}
+                    self._rows.setdefault(row["operation"], []).append(values)
+
+    def predict(self, operation: str, target: str, features: Dict[str, float]) -> Optional[float]:
+        """
+        Returns the prediction of a target column for an operation, or None without history.
+        Without enough history for a model, the largest measurement is used.
+        """
+        rows = [row for row in self._rows.get(operation, []) if math.isfinite(row[target])]
+        if not rows:
+            return None
+
+        key = (operation, target)
+        if key not in self._models:
+            self._models[key] = fit_model(rows, target)
+        model = self._models[key]
+        value = model.predict(features) if model else max(row[target] for row in rows)
+        return value * self._margin
+
+
+@lru_cache(maxsize=4)
+def _load_predictor(history_files: Tuple[str, ...], margin: float) -> Predictor:
+    return Predictor(history_files, margin)
+
+
+def get_predictor(config: Dict) -> Optional[Predictor]:
+    """
+    Returns the predictor of the config file, or None if prediction is disabled.
+    """
+    settings = cfg.get_prediction(config)
+    if not settings:
+        return None
+
+    history_files = sorted(set(path for pattern in settings["history"] for path in glob.glob(pattern)))
+    return _load_predictor(tuple(history_files), settings["margin"])
+
+
+def get_job_features(config: Dict, wildcards, threads: int) -> Dict[str, float]:
+    """
+    Returns features of a job. The alignment of the pruning is used if it already exists,
+    the input alignment otherwise. The number of queries is known only when it does not
+    depend on the pruning.
+    """
+    work_dir = cfg.get_work_dir(config)
+    alignment = os.path.join(work_dir, "A", f"{wildcards.pruning}.align") if "pruning" in wildcards.keys() else None
+    taxa, sites = get_alignment_shape(alignment if alignment and os.path.exists(alignment)
+                                      else config["dataset_align"])
+
+    features = {"taxa": taxa, "sites": sites, "threads": threads}
+    if "k" in wildcards.keys():
+        features["k"] = float(wildcards.k)
+    if "o" in wildcards.keys():
+        features["omega"] = float(wildcards.o)
+    if cfg.get_mode(config) == cfg.Mode.VOLUME and "length" in wildcards.keys():
+        features["queries"] = int(wildcards.length)
+    elif cfg.measures_resources(config) and cfg.query_user(config):
+        features["queries"] = count_queries(config["query_user"])
+    return features
+
+
+def predicted_mem_mb(config: Dict, tool: str, operation: str, default: int = 0) -> Union[int, Callable]:
+    """
+    Returns the mem_mb resource of a rule. A memory set in the "tools" section
+    of the config file has priority over predictions.
+    """
+    predictor = get_predictor(config)
+    if not predictor or cfg.get_mem_mb(config, tool) > 0:
+        return cfg.get_mem_mb(config, tool, default)
+
+    fallback = default or cfg.get_prediction(config)["default_mem_mb"]
+
+    def mem_mb(wildcards, threads, attempt):
+        value = predictor.predict(operation, "max_rss", get_job_features(config, wildcards, threads))
+        return attempt * (math.ceil(value) if value else fallback)
+    return mem_mb
+
+
+def predicted_runtime(config: Dict, operation: str) -> Union[int, Callable]:
+    """
+    Returns the runtime resource of a rule, in minutes.
+    """
+    predictor = get_predictor(config)
+    if not predictor:
+        return cfg.get_default_runtime(config)
+
+    fallback = cfg.get_default_runtime(config)
+
+    def runtime(wildcards, threads, attempt):
+        value = predictor.predict(operation, "s", get_job_features(config, wildcards, threads))
+        return attempt * (math.ceil(value / 60) if value else fallback)
+    return runtime
@@ -0,0 +1,299 @@
+"""
+A resource sampler for measured jobs of the resources and volume modes.
+
+Snakemake benchmarks give one peak memory and one CPU time per run. The sampler
+runs a command and polls its process tree at a fixed interval, which shows how
+memory, CPU load, disk I/O and threads evolve during the job: e.g. the memory peak
+of a database load, or the memory growth with the number of queries.
+
+Samples are written to a file next to the Snakemake benchmark file,
+with the _samples.tsv suffix instead of _benchmark.tsv. If a job is repeated
+by Snakemake, the file holds the samples of its last run. With adaptive repeats,
+the harness samples the process tree itself, and the file holds the samples of the cold run.
+"""
+
+__author__ = "Nikolai Romashchenko"
+__license__ = "MIT"
+
+
+import argparse
+import csv
+import os
+import re
+import shlex
+import subprocess
+import sys
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional
+import psutil
+import pewo.config as cfg
+
+
+# Columns of the sample files
+SAMPLE_COLUMNS = ["time_s", "rss_mb", "cpu_percent", "read_mb", "write_mb", "threads", "processes", "command"]
+
+# Columns of the phase summary
+PHASE_COLUMNS = ["job", "operation", "command", "activity", "duration_s", "share",
+                 "peak_rss_mb", "mean_cpu_percent", "read_mb", "write_mb"]
+
+# CPU load from which a sample is a computation, in percents of a core
+_COMPUTE_CPU_PERCENT = 50.0
+
+_MB = 1024 * 1024
+
+
+class Sample(NamedTuple):
+    """
+    Resources used by a process tree at a time. Read and written data are cumulative.
+    command is the name of the process of the tree using most memory.
+    """
+    time_s: float
+    rss_mb: float
+    cpu_percent: float
+    read_mb: float
+    write_mb: float
+    threads: int
+    processes: int
+    command: str
+
+
+def _read_peak_rss(pid: int) -> int:
+    """
+    Returns the peak resident set size of a process since its last exec, in bytes.
+    Returns 0 where it is not available, e.g. outside Linux.
+    """
+    try:
+        with open(f"/proc/{pid}/status") as f_in:
+            for line in f_in:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+class ProcessTree:
+    """
+    Polls a process and its descendants. Processes are kept between polls,
+    as their CPU load is measured since the previous poll.
+    """
+    def __init__(self, pid: int):
+        self._root = psutil.Process(pid)
+        self._processes = {}
+        self._io = {}
+        self._read_bytes = 0
+        self._write_bytes = 0
+        self._peak_process_rss = 0
+
+    @property
+    def peak_process_rss_mb(self) -> float:
+        """
+        The largest peak memory of a single polled process. Peaks between polls are
+        included, so it is a lower bound of the peak memory of the tree.
+        """
+        return self._peak_process_rss / _MB
+
+    def poll(self, time_s: float) -> Sample:
+        try:
+            current = [self._root] + self._root.children(recursive=True)
+        except psutil.NoSuchProcess:
+            current = []
+
+        rss, cpu_percent, threads, processes = 0, 0.0, 0, 0
+        command, command_rss = "", -1
+        for process in current:
+            process = self._processes.setdefault(process.pid, process)
+            try:
+                with process.oneshot():
+                    process_rss = process.memory_info().rss
+                    process_cpu = process.cpu_percent()
+                    process_threads = process.num_threads()
+                    name = process.name()
+                    io = process.io_counters() if hasattr(process, "io_counters") else None
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                continue
+
+            rss += process_rss
+            self._peak_process_rss = max(self._peak_process_rss, process_rss, _read_peak_rss(process.pid))
+            cpu_percent += process_cpu
+            threads += process_threads
+            processes += 1
+            if process_rss > command_rss:
+                command, command_rss = name, process_rss
+
+            # I/O counters of a process are lost when it ends, their increments are accumulated
+            if io:
+                last_read, last_write = self._io.get(process.pid, (0, 0))
+                self._read_bytes += max(0, io.read_bytes - last_read)
+                self._write_bytes += max(0, io.write_bytes - last_write)
+                self._io[process.pid] = (io.read_bytes, io.write_bytes)
+
+        return Sample(time_s, rss / _MB, cpu_percent, self._read_bytes / _MB, self._write_bytes / _MB,
+                      threads, processes, command)
+
+
+def _write_sample(writer: csv.DictWriter, sample: Sample) -> None:
+    writer.writerow({
+        "time_s": f"{sample.time_s:.3f}",
+        "rss_mb": f"{sample.rss_mb:.2f}",
+        "cpu_percent": f"{sample.cpu_percent:.1f}",
+        "read_mb": f"{sample.read_mb:.2f}",
+        "write_mb": f"{sample.write_mb:.2f}",
+        "threads": str(sample.threads),
+        "processes": str(sample.processes),
+        "command": sample.command
+    })
+
+
+class SampleWriter:
+    """
+    Writes samples of a process tree to a file, at most one per interval.
+    """
+    def __init__(self, pid: int, output_file: str, interval: float) -> None:
+        self._tree = ProcessTree(pid)
+        self._interval = interval
+        self._next_time_s = 0.0
+        self._file = open(output_file, "w", newline="")
+        self._writer = csv.DictWriter(self._file, fieldnames=SAMPLE_COLUMNS, delimiter="\t", lineterminator="\n")
+        self._writer.writeheader()
+
+    def __enter__(self) -> "SampleWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self._file.close()
+
+    def poll(self, time_s: float) -> Optional[Sample]:
+        """
+        Writes a sample if the interval has passed since the previous one.
+        """
+        if time_s < self._next_time_s:
+            return None
+        self._next_time_s = time_s + self._interval
+        sample = self._tree.poll(time_s)
+        if sample.processes > 0:
+            _write_sample(self._writer, sample)
+        return sample
+
+
+def sample_command(command: str, output_file: str, interval: float) -> int:
+    """
+    Runs a shell command and writes resources of its process tree every interval
+    seconds. Returns the exit code of the command.
+    """
+    start = time.monotonic()
+    process = subprocess.Popen(["bash", "-c", "set -euo pipefail; " + command])
+
+    with SampleWriter(process.pid, output_file, interval) as writer:
+        while True:
+            writer.poll(time.monotonic() - start)
+            try:
+                return process.wait(timeout=interval)
+            except subprocess.TimeoutExpired:
+                pass
+
+
+def read_samples(sample_file: str) -> List[Sample]:
+    with open(sample_file) as f_in:
+        return [Sample(float(row["time_s"]), float(row["rss_mb"]), float(row["cpu_percent"]),
+                       float(row["read_mb"]), float(row["write_mb"]), int(row["threads"]),
+                       int(row["processes"]), row["command"])
+                for row in csv.DictReader(f_in, delimiter="\t")]
+
+
+def get_activity(previous: Sample, sample: Sample) -> str:
+    """
+    Returns the activity of a process tree between two samples: a computation,
+    disk I/O, or waiting.
+    """
+    if sample.cpu_percent >= _COMPUTE_CPU_PERCENT:
+        return "compute"
+    if sample.read_mb > previous.read_mb or sample.write_mb > previous.write_mb:
+        return "io"
+    return "wait"
+
+
+def get_operation(sample_file: str) -> str:
+    """
+    Returns the operation of a sample file, e.g. rappas-placement,
+    the field before the suffix as in benchmark files.
+    """
+    return os.path.basename(sample_file).split("_")[-2]
+
+
+def summarize_phases(samples: List[Sample]) -> Dict[tuple, Dict[str, float]]:
+    """
+    Returns the duration, peak memory, mean CPU load and I/O of every phase of a job.
+    A phase is a pair of the main command and its activity.
+    """
+    phases = {}
+    for previous, sample in zip(samples, samples[1:]):
+        key = (sample.command, get_activity(previous, sample))
+        phase = phases.setdefault(key, {"duration_s": 0.0, "peak_rss_mb": 0.0, "cpu_percent_s": 0.0,
+                                        "read_mb": 0.0, "write_mb": 0.0})
+        duration = sample.time_s - previous.time_s
+        phase["duration_s"] += duration
+        phase["peak_rss_mb"] = max(phase["peak_rss_mb"], sample.rss_mb)
+        phase["cpu_percent_s"] += sample.cpu_percent * duration
+        phase["read_mb"] += sample.read_mb - previous.read_mb
+        phase["write_mb"] += sample.write_mb - previous.write_mb
+    return phases
+
+
+def write_phases(sample_files: Iterable[str], output_file: str) -> None:
+    """
+    Writes the phases of every sampled job.
+    """
+    with open(output_file, "w", newline="") as f_out:
+        writer = csv.DictWriter(f_out, fieldnames=PHASE_COLUMNS, delimiter="\t", lineterminator="\n")
+        writer.writeheader()
+        for sample_file in sorted(sample_files):
+            phases = summarize_phases(read_samples(sample_file))
+            total = sum(phase["duration_s"] for phase in phases.values())
+            for (command, activity), phase in sorted(phases.items(), key=lambda item: -item[1]["duration_s"]):
+                writer.writerow({
+                    "job": re.sub(r"_samples\.tsv$", "", os.path.basename(sample_file)),
+                    "operation": get_operation(sample_file),
+                    "command": command,
+                    "activity": activity,
+                    "duration_s": f"{phase['duration_s']:.3f}",
+                    "share": f"{phase['duration_s'] / total:.4f}" if total > 0 else "NA",
+                    "peak_rss_mb": f"{phase['peak_rss_mb']:.2f}",
+                    "mean_cpu_percent": f"{phase['cpu_percent_s'] / phase['duration_s']:.1f}" if phase["duration_s"] > 0 else "NA",
+                    "read_mb": f"{phase['read_mb']:.2f}",
+                    "write_mb": f"{phase['write_mb']:.2f}"
+                })
+
+
+def get_sample_file(benchmark_file: str) -> str:
+    """
+    Returns the name of the sample file of a Snakemake benchmark file.
+    """
+    return re.sub(r"_benchmark\.tsv$", "_samples.tsv", benchmark_file)
+
+
+def sampled_command(config: Dict, command: str, benchmark_template: str,
+                    modes: Iterable[cfg.Mode] = (cfg.Mode.RESOURCES, cfg.Mode.VOLUME)) -> str:
+    """
+    Wraps a shell command of a rule to be run by the sampler, if sampling is enabled
+    and the rule is measured in the current mode. The sample file is named after
+    the benchmark template of the rule, in which wildcards are replaced by {wildcards.name}.
+    """
+    interval = cfg.get_sampling_interval(config)
+    if not interval or cfg.get_mode(config) not in modes:
+        return command
+
+    sample_template = re.sub(r"\{(\w+)\}", r"{wildcards.\1}", get_sample_file(benchmark_template))
+    return " ".join([shlex.quote(sys.executable), "-m", "pewo.resources.sampler",
+                     "--output", sample_template,
+                     "--interval", str(interval),
+                     "--", shlex.quote(command)])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Samples resources used by a shell command.")
+    parser.add_argument("--output", required=True, help="output file of samples")
+    parser.add_argument("--interval", type=float, default=0.5, help="sampling interval in seconds")
+    parser.add_argument("command", help="shell command")
+    args = parser.parse_args()
+    sys.exit(sample_command(args.command, args.output, args.interval))
@@ -0,0 +1,95 @@
+"""
+Computes the speedup and the parallel efficiency of tools in the scaling mode.
+
+Every tool is run with several thread counts on the same inputs, and every
+run is measured by a Snakemake benchmark file. The run with the smallest
+number of threads is the baseline of the speedup of a tool.
+"""
+
+__author__ = "Nikolai Romashchenko"
+__license__ = "MIT"
+
+
+import csv
+from typing import Dict, Iterable, List, NamedTuple
+import numpy as np
+
+
+# Columns of scaling.tsv, consumed by scripts/R/eval_scaling_plots.R
+RESULT_COLUMNS = ["tool", "threads", "repeats", "mean_s", "sd_s", "max_rss", "speedup", "efficiency"]
+
+
+class ScalingJob(NamedTuple):
+    """
+    A benchmark file of a tool run with a number of threads.
+    """
+    tool: str
+    threads: int
+    benchmark: str
+
+
+class Measurement(NamedTuple):
+    """
+    Wall-clock times of every repeat of a run, in seconds, and the peak memory in MB.
+    """
+    times: np.ndarray
+    max_rss: float
+
+
+def read_benchmark(benchmark_file: str) -> Measurement:
+    """
+    Reads a benchmark file written by Snakemake. Every line is a repeat of the run.
+    """
+    times = []
+    max_rss = 0.0
+    with open(benchmark_file) as f_in:
+        for row in csv.DictReader(f_in, delimiter="\t"):
+            times.append(float(row["s"]))
+            # not measured for very short jobs
+            if row["max_rss"] not in ("", "-", "NA"):
+                max_rss = max(max_rss, float(row["max_rss"]))
+
+    if not times:
+        raise RuntimeError(f"{benchmark_file}: no measurements found.")
+    return Measurement(np.array(times), max_rss)
+
+
+def compute_scaling(jobs: Iterable[ScalingJob]) -> List[Dict[str, str]]:
+    """
+    Returns rows of the scaling table, ordered by tool and number of threads.
+    The speedup of t threads is T(t0) / T(t), where t0 is the smallest number
+    of threads measured for the tool and T is the mean time. The efficiency
+    is the speedup divided by t / t0.
+    """
+    tools = {}
+    for job in jobs:
+        tools.setdefault(job.tool, {})[job.threads] = read_benchmark(job.benchmark)
+
+    rows = []
+    for tool, measurements in sorted(tools.items()):
+        baseline_threads = min(measurements)
+        baseline_time = measurements[baseline_threads].times.mean()
+        for threads, measurement in sorted(measurements.items()):
+            mean_time = measurement.times.mean()
+            speedup = baseline_time / mean_time if mean_time > 0 else np.nan
+            rows.append({
+                "tool": tool,
+                "threads": str(threads),
+                "repeats": str(len(measurement.times)),
+                "mean_s": f"{mean_time:.4f}",
+                "sd_s": f"{measurement.times.std(ddof=1) if len(measurement.times) > 1 else 0.0:.4f}",
+                "max_rss": f"{measurement.max_rss:.2f}",
+                "speedup": f"{speedup:.4f}",
+                "efficiency": f"{speedup * baseline_threads / threads:.4f}"
+            })
+    return rows
+
+
+def write_scaling(jobs: Iterable[ScalingJob], output_file: str) -> None:
+    """
+    Writes the scaling table of benchmark files.
+    """
+    with open(output_file, "w", newline="") as f_out:
+        writer = csv.DictWriter(f_out, fieldnames=RESULT_COLUMNS, delimiter="\t", lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(compute_scaling(jobs))
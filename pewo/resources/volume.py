@@ -0,0 +1,177 @@
+"""
+Measures how placement tools scale with the number of queries in the volume mode.
+
+Queries are subsampled to a ladder of query counts. Databases, hmm profiles and
+reference packages are built once, and every tool places every subsample.
+The placement time of every tool configuration is fitted with a linear model
+t(n) = overhead + n * per_query, which gives the number of queries at which
+alignment-free tools, with their expensive database build, become faster than
+alignment-based tools.
+"""
+
+__author__ = "Nikolai Romashchenko"
+__license__ = "MIT"
+
+
+import csv
+import math
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+import numpy as np
+from pewo.io import fasta
+from pewo.resources.harness import read_measurement
+
+
+# Columns of the output tables
+VOLUME_COLUMNS = ["software", "configuration", "queries", "build_s", "placement_s", "total_s",
+                  "queries_per_s", "max_rss"]
+SUMMARY_COLUMNS = ["software", "configuration", "alignment_free", "build_s", "overhead_s",
+                   "per_query_s", "mem_per_query_mb", "amortized_queries"]
+BREAK_EVEN_COLUMNS = ["alignment_free", "alignment_free_configuration",
+                      "alignment_based", "alignment_based_configuration", "break_even_queries"]
+
+_MISSING_VALUE = "NA"
+
+
+def subsample_queries(query_file: str, output_file: str, count: int, seed: int) -> None:
+    """
+    Writes count random queries of a .fasta file, in the order of the input file.
+    Subsamples of the same seed are nested: smaller subsamples are subsets of larger ones.
+    """
+    with fasta.FastaReader(query_file) as reader:
+        total = sum(1 for _ in reader.iter_records())
+        if count > total:
+            raise RuntimeError(f"{query_file}: {count} queries requested, but the file has only {total}.")
+
+        selected = np.zeros(total, dtype=bool)
+        selected[np.random.default_rng(seed).permutation(total)[:count]] = True
+        with fasta.FastaWriter(output_file) as writer:
+            for i, (_, record) in enumerate(reader.iter_records()):
+                if selected[i]:
+                    writer.write_record(record)
+
+
+class VolumeConfiguration(NamedTuple):
+    """
+    Benchmark files of a tool with fixed parameters: the build stages,
+    done once, and the placement stages of every query count.
+    """
+    software: str
+    configuration: str
+    alignment_free: bool
+    build: List[str]
+    placement: Dict[int, List[str]]
+
+
+class Fit(NamedTuple):
+    """
+    A linear model of the placement time and memory as functions of the query count.
+    """
+    build_s: float
+    overhead_s: float
+    per_query_s: float
+    mem_per_query_mb: float
+
+
+def _fit_line(x: np.ndarray, y: np.ndarray) -> Tuple[float, float]:
+    """
+    Returns the intercept and the slope of the least squares line.
+    A single point gives a line through the origin.
+    """
+    if len(x) == 1:
+        return 0.0, float(y[0] / x[0])
+    slope, intercept = np.polyfit(x, y, 1)
+    return float(intercept), float(slope)
+
+
+def _sum_times(benchmark_files: Iterable[str], adaptive: bool) -> Tuple[float, float]:
+    """
+    Returns the sum of mean times of consecutive stages, and their peak memory.
+    """
+    measurements = [read_measurement(benchmark_file, adaptive) for benchmark_file in benchmark_files]
+    return (sum(float(m.times.mean()) for m in measurements),
+            max((m.max_rss for m in measurements), default=0.0))
+
+
+def _format(value: Optional[float], digits: int = 4) -> str:
+    if value is None or not math.isfinite(value):
+        return _MISSING_VALUE
+    return f"{value:.{digits}f}"
+
+
+def _break_even(free: Fit, based: Fit) -> Optional[float]:
+    """
+    Returns the query count from which an alignment-free tool is faster,
+    build included, or None if it never is.
+    """
+    fixed_difference = (free.build_s + free.overhead_s) - (based.build_s + based.overhead_s)
+    if fixed_difference <= 0:
+        return 0.0 if free.per_query_s <= based.per_query_s else None
+    if free.per_query_s >= based.per_query_s:
+        return None
+    return math.ceil(fixed_difference / (based.per_query_s - free.per_query_s))
+
+
+def write_volume_report(configurations: Iterable[VolumeConfiguration], volume_file: str,
+                        summary_file: str, break_even_file: str, adaptive: bool = False) -> None:
+    """
+    Writes the measurements of every tool configuration and query count, the fitted
+    costs per query, and the break-even query counts of alignment-free tools against
+    alignment-based tools. A database is amortized when its build time is below
+    the placement time of the queries. With adaptive repeats, the runs of the harness are used.
+    """
+    configurations = list(configurations)
+    fits = []
+    with open(volume_file, "w", newline="") as f_volume, open(summary_file, "w", newline="") as f_summary:
+        volume_writer = csv.DictWriter(f_volume, fieldnames=VOLUME_COLUMNS, delimiter="\t", lineterminator="\n")
+        summary_writer = csv.DictWriter(f_summary, fieldnames=SUMMARY_COLUMNS, delimiter="\t", lineterminator="\n")
+        volume_writer.writeheader()
+        summary_writer.writeheader()
+
+        for configuration in configurations:
+            build_s, _ = _sum_times(configuration.build, adaptive)
+            counts = np.array(sorted(configuration.placement), dtype=float)
+            times, memory = zip(*(_sum_times(configuration.placement[int(n)], adaptive) for n in counts))
+
+            for n, placement_s, max_rss in zip(counts, times, memory):
+                volume_writer.writerow({
+                    "software": configuration.software,
+                    "configuration": configuration.configuration,
+                    "queries": str(int(n)),
+                    "build_s": _format(build_s),
+                    "placement_s": _format(placement_s),
+                    "total_s": _format(build_s + placement_s),
+                    "queries_per_s": _format(n / placement_s if placement_s > 0 else None, 2),
+                    "max_rss": _format(max_rss, 2)
+                })
+
+            overhead_s, per_query_s = _fit_line(counts, np.array(times))
+            _, mem_per_query = _fit_line(counts, np.array(memory)) if len(counts) > 1 else (0.0, None)
+            fit = Fit(build_s, overhead_s, per_query_s, mem_per_query)
+            fits.append(fit)
+            summary_writer.writerow({
+                "software": configuration.software,
+                "configuration": configuration.configuration,
+                "alignment_free": str(configuration.alignment_free).upper(),
+                "build_s": _format(build_s),
+                "overhead_s": _format(overhead_s),
+                "per_query_s": _format(per_query_s, 8),
+                "mem_per_query_mb": _format(mem_per_query, 8),
+                "amortized_queries": _format(math.ceil(build_s / per_query_s) if per_query_s > 0 else None, 0)
+            })
+
+    with open(break_even_file, "w", newline="") as f_out:
+        writer = csv.DictWriter(f_out, fieldnames=BREAK_EVEN_COLUMNS, delimiter="\t", lineterminator="\n")
+        writer.writeheader()
+        for free, free_fit in zip(configurations, fits):
+            if not free.alignment_free:
+                continue
+            for based, based_fit in zip(configurations, fits):
+                if based.alignment_free:
+                    continue
+                writer.writerow({
+                    "alignment_free": free.software,
+                    "alignment_free_configuration": free.configuration,
+                    "alignment_based": based.software,
+                    "alignment_based_configuration": based.configuration,
+                    "break_even_queries": _format(_break_even(free_fit, based_fit), 0)
+                })
@@ -92,6 +92,14 @@ def get_experiment_log_dir_template(config: Dict, software: Software) -> str:
     return os.path.join(cfg.get_work_dir(config), "logs", software_name, "{pruning}")
 
 
+def get_query_batch_alignment_template(config: Dict) -> str:
+    """
+    Returns a name template, without extension, of the alignment of all queries
+    of the likelihood mode to a profile, if queries are aligned together.
+    """
+    return os.path.join(get_software_dir(config, AlignmentSoftware.HMMER), "{pruning}", "queries")
+
+
 def get_name_prefix(config: Dict) -> str:
     return "query" if cfg.get_mode(config) == cfg.Mode.LIKELIHOOD else "pruning"
 
@@ -123,10 +131,13 @@ def get_common_template_args(config: Dict) -> Dict[str, Any]:
     """
 
     if cfg.get_mode(config) == cfg.Mode.LIKELIHOOD:
+        # queries are placed one by one, or by shards of several queries
+        shard_size = cfg.get_query_shard_size(config)
         return {
             "pruning": ["0"],
             "length": ["0"],
-            "query": fasta.get_sequence_ids(config["query_user"])
+            "query": fasta.get_shard_ids(config["query_user"], shard_size) if shard_size > 0
+                     else fasta.get_sequence_ids(config["query_user"])
         }
     else:
         return {
@@ -275,12 +286,14 @@ def join_kwargs(**kwargs) -> str:
 def get_benchmark_template(config: Dict, software: Software, **kwargs) -> str:
     """
     Creates a name template of .tsv output files produced by specific software.
+    Keyword arguments are wildcard names, except for rule_name and threads.
     """
     rule_name = kwargs.get("rule_name", "rule_name keyword argument must be provided")
     assert rule_name
 
     template_args = kwargs.copy()
     template_args.pop("rule_name")
+    threads = template_args.pop("threads", None)
 
     heuristic = kwargs.get("heuristic", None)
     if heuristic:
@@ -289,9 +302,13 @@ def get_benchmark_template(config: Dict, software: Software, **kwargs) -> str:
     # Skip the first character assuming to keep the name convention as
     # {pruning}_arg1{arg1}_arg2{arg2}, not p{pruning}_arg1{arg1}...
     filename_template = join_kwargs(**template_args)[1:]
+    # the number of threads is a constant, not a wildcard
+    if threads is not None:
+        filename_template += f"_threads{threads}"
 
     software_name = software.name.lower()
-    if software == PlacementSoftware.EPANG:
+    # rules of EPA-ng independent of the heuristic, e.g. the binary dump, have none
+    if software == PlacementSoftware.EPANG and rule_name == "placement":
         valid_heuristics = ("h1", "h2", "h3", "h4")
         assert heuristic and heuristic in valid_heuristics, f"{heuristic} is not a valid heuristic."
         software_name = software.name.lower() + f"-{heuristic}"
@@ -345,3 +362,25 @@ def get_ar_output_templates(config: Dict, arsoft: str) -> List[str]:
         raise RuntimeError(f"Unknown ancestral reconstruction soft: {arsoft}")
 
     return [os.path.join(output_dir, filename) for filename in output_filenames]
+
+
+def get_optimisation_record_template(config: Dict) -> str:
+    """
+    Returns the name template of records of the optimisation cache, one per pruning.
+    """
+    return os.path.join(cfg.get_work_dir(config), "benchmarks", "{pruning}_optimisation_cache.tsv")
+
+
+def get_placement_table(config: Dict) -> str:
+    """
+    Returns the .npz file of the placements of all .jplace files of the working directory.
+    """
+    return os.path.join(cfg.get_work_dir(config), "placements.npz")
+
+
+def get_node_distance_template(config: Dict) -> str:
+    """
+    Returns a name template of .npz files containing node distances between
+    branches of pruned trees, computed in the accuracy mode.
+    """
+    return os.path.join(cfg.get_work_dir(config), "T", "{pruning}_nodedistance.npz")
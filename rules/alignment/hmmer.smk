@@ -9,17 +9,28 @@ __license__ = "MIT"
 import os
 import pewo.config as cfg
 from pewo.software import AlignmentSoftware, CustomScripts
+from pewo.alignment.psiblast2fasta import psiblast2fasta_split
+from pewo.alignment.query_alignment import write_query_alignment
+from pewo.resources.harness import measured_command
+from pewo.resources.prediction import predicted_mem_mb, predicted_runtime
 from pewo.templates import get_software_dir, get_experiment_log_dir_template, \
-    get_common_queryname_template, get_benchmark_template, get_common_template_args
+    get_common_queryname_template, get_benchmark_template, get_common_template_args, \
+    get_query_batch_alignment_template
 
 
 _work_dir = cfg.get_work_dir(config)
 _alignment_dir = get_software_dir(config, AlignmentSoftware.HMMER)
 
 
+_hmmer_benchmark_build_template = get_benchmark_template(config, AlignmentSoftware.HMMER,
+                                                         p="pruning",
+                                                         threads=cfg.get_threads(config, "hmmbuild"),
+                                                         rule_name="build") if cfg.measures_resources(config) else ""
 _hmmer_benchmark_align_template = get_benchmark_template(config, AlignmentSoftware.HMMER,
                                                          p="pruning", length="length",
-                                                         rule_name="align") if cfg.get_mode(config) == cfg.Mode.RESOURCES else ""
+                                                         threads=cfg.get_threads(config, "hmmalign"),
+                                                         rule_name="align") if cfg.measures_resources(config) else ""
+hmmer_build_benchmark_templates = [_hmmer_benchmark_build_template]
 hmmer_benchmark_templates = [_hmmer_benchmark_align_template]
 hmmer_benchmark_template_args = [get_common_template_args(config)]
 
@@ -37,14 +48,26 @@ rule hmm_build:
                      "{pruning}.log")
     params:
         states = ["dna"] if config["states"] == 0 else ["amino"]
-    threads: 1
+    threads: cfg.get_threads(config, "hmmbuild")
+    resources:
+        mem_mb = predicted_mem_mb(config, "hmmbuild", "hmmer-build"),
+        runtime = predicted_runtime(config, "hmmer-build")
     shell:
-        "hmmbuild --cpu {threads} --{params.states} {output.hmm} {input.alignment} &> {log}"
+        measured_command(config, "hmmbuild --cpu {threads} --{params.states} {output.hmm} {input.alignment} &> {log}",
+                         _hmmer_benchmark_build_template, modes=[cfg.Mode.VOLUME])
+
+# profiles are measured in the volume mode only, where their build cost is amortized over query counts
+if cfg.get_mode(config) == cfg.Mode.VOLUME:
+    rule hmm_build:
+        benchmark:
+            repeat(_hmmer_benchmark_build_template, cfg.get_repeats(config))
 
 
 rule hmm_align:
     """
-    Aligns a query to a profile.
+    Aligns a query to a profile. With several threads, the query file is split
+    in chunks aligned by parallel hmmalign processes, and merged into the alignment
+    a single process writes.
     """
     input:
         hmm = os.path.join(_alignment_dir, "{pruning}.hmm"),
@@ -62,52 +85,136 @@ rule hmm_align:
 
     params:
         states = ["dna"] if config["states"] == 0 else ["amino"],
+    threads: cfg.get_threads(config, "hmmalign")
+    resources:
+        mem_mb = predicted_mem_mb(config, "hmmalign", "hmmer-align"),
+        runtime = predicted_runtime(config, "hmmer-align")
+    # queries are aligned in parallel chunks if several threads are allowed
     shell:
-        "hmmalign --{params.states} --outformat PSIBLAST -o {output.psiblast} " +
-        "--mapali {input.alignment} {input.hmm} {input.query} &> {log}"
-
-if cfg.get_mode(config) == cfg.Mode.RESOURCES:
+        measured_command(config,
+                         "hmmalign --{params.states} --outformat PSIBLAST -o {output.psiblast} " +
+                         "--mapali {input.alignment} {input.hmm} {input.query} &> {log}"
+                         if cfg.get_threads(config, "hmmalign") == 1 else
+                         "scripts/shell/hmmalign_parallel.sh {params.states} {threads} {input.hmm} {input.alignment} " +
+                         "{input.query} {output.psiblast} &> {log}",
+                         _hmmer_benchmark_align_template)
+
+if cfg.measures_resources(config):
     rule hmm_align:
         benchmark:
-            repeat(_hmmer_benchmark_align_template, config["repeats"])
+            repeat(_hmmer_benchmark_align_template, cfg.get_repeats(config))
 
 rule psiblast_to_fasta:
     """
-    Converts psiblast to fasta format.
+    Converts psiblast to fasta format and splits the alignment in "query only"
+    and "reference alignment only" sub-alignments in a single pass.
+    Contrary to other placement software, the split input is required by epa-ng
     """
     input:
         psiblast = os.path.join(_alignment_dir,
                                 "{pruning}",
-                                get_common_queryname_template(config) + ".psiblast")
+                                get_common_queryname_template(config) + ".psiblast"),
+        reads = os.path.join(_work_dir,
+                             "R",
+                             get_common_queryname_template(config) + ".fasta")
     output:
         alignment = os.path.join(_alignment_dir,
                                  "{pruning}",
-                                 get_common_queryname_template(config) + ".fasta")
+                                 get_common_queryname_template(config) + ".fasta"),
+        queries = os.path.join(_alignment_dir,
+                               "{pruning}",
+                               get_common_queryname_template(config) + ".fasta_queries"),
+        refs = os.path.join(_alignment_dir,
+                            "{pruning}",
+                            get_common_queryname_template(config) + ".fasta_refs")
     log:
         os.path.join(get_experiment_log_dir_template(config, CustomScripts.PSIBLAST_2_FASTA),
                      get_common_queryname_template(config) + ".log")
-    shell:
-        "pewo/alignment/psiblast2fasta.py {input.psiblast} {output.alignment} &> {log}"
-
-
-rule split_alignment:
-    """
-    Splits hmm alignment results in "query only" and "reference alignment only" sub-alignments.
-    Contrary to other placement software, such input is required by epa-ng
-    """
-    input:
-        align = os.path.join(_alignment_dir,
-                            "{pruning}",
-                             get_common_queryname_template(config) + ".fasta"),
-        reads = os.path.join(_work_dir,
-                            "R",
-                             get_common_queryname_template(config) + ".fasta"),
-    output:
-          os.path.join(_alignment_dir,
-                       "{pruning}",
-                        get_common_queryname_template(config) + ".fasta_queries"),
-          os.path.join(_alignment_dir,
-                       "{pruning}",
-                        get_common_queryname_template(config) + ".fasta_refs"),
-    shell:
-        "pewo/alignment/split_hmm_alignment.py {input.reads} {input.align}"
+    run:
+        psiblast2fasta_split(input.psiblast, input.reads, output.alignment, log[0])
+
+
+# In the likelihood mode, all queries can be aligned in one run: the profile and the reference
+# alignment are loaded once, and reference sequences are written once instead of once per query.
+# Query-only and full alignments of a query are then slices of this alignment, written only
+# for software which needs them. epa-ng and apples read the shared reference sequences directly.
+if cfg.aligns_queries_together(config):
+    _query_batch_alignment_template = get_query_batch_alignment_template(config)
+
+    rule hmm_align_queries:
+        """
+        Aligns all queries to a profile.
+        """
+        input:
+            hmm = os.path.join(_alignment_dir, "{pruning}.hmm"),
+            alignment = os.path.join(_work_dir, "A", "{pruning}.align"),
+            query = config["query_user"]
+        output:
+            psiblast = _query_batch_alignment_template + ".psiblast"
+        log:
+            os.path.join(get_experiment_log_dir_template(config, AlignmentSoftware.HMMER), "queries.log")
+        params:
+            states = ["dna"] if config["states"] == 0 else ["amino"],
+        threads: cfg.get_threads(config, "hmmalign")
+        resources:
+            mem_mb = predicted_mem_mb(config, "hmmalign", "hmmer-align"),
+            runtime = predicted_runtime(config, "hmmer-align")
+        shell:
+            ("hmmalign --{params.states} --outformat PSIBLAST -o {output.psiblast} " +
+             "--mapali {input.alignment} {input.hmm} {input.query} &> {log}"
+             if cfg.get_threads(config, "hmmalign") == 1 else
+             "scripts/shell/hmmalign_parallel.sh {params.states} {threads} {input.hmm} {input.alignment} " +
+             "{input.query} {output.psiblast} &> {log}")
+
+    rule psiblast_to_fasta_queries:
+        """
+        Converts the alignment of all queries to fasta format and splits it
+        in "query only" and "reference alignment only" sub-alignments.
+        """
+        input:
+            psiblast = _query_batch_alignment_template + ".psiblast",
+            reads = config["query_user"]
+        output:
+            alignment = _query_batch_alignment_template + ".fasta",
+            queries = _query_batch_alignment_template + ".fasta_queries",
+            refs = _query_batch_alignment_template + ".fasta_refs"
+        log:
+            os.path.join(get_experiment_log_dir_template(config, CustomScripts.PSIBLAST_2_FASTA), "queries.log")
+        run:
+            psiblast2fasta_split(input.psiblast, input.reads, output.alignment, log[0])
+
+    rule slice_query_alignment:
+        """
+        Writes the "query only" alignment of a query file from the alignment of all queries.
+        """
+        input:
+            alignment = _query_batch_alignment_template + ".fasta_queries",
+            reads = os.path.join(_work_dir,
+                                 "R",
+                                 get_common_queryname_template(config) + ".fasta")
+        output:
+            queries = os.path.join(_alignment_dir,
+                                   "{pruning}",
+                                   get_common_queryname_template(config) + ".fasta_queries")
+        run:
+            write_query_alignment(input.alignment, input.reads, output.queries)
+
+    rule query_alignment_view:
+        """
+        Writes the full alignment of a query file, for software which does not take
+        reference sequences and queries separately.
+        """
+        input:
+            alignment = _query_batch_alignment_template + ".fasta_queries",
+            refs = _query_batch_alignment_template + ".fasta_refs",
+            reads = os.path.join(_work_dir,
+                                 "R",
+                                 get_common_queryname_template(config) + ".fasta")
+        output:
+            alignment = os.path.join(_alignment_dir,
+                                     "{pruning}",
+                                     get_common_queryname_template(config) + ".fasta")
+        run:
+            write_query_alignment(input.alignment, input.reads, output.alignment, input.refs)
+
+    ruleorder: slice_query_alignment > query_alignment_view > psiblast_to_fasta
@@ -9,9 +9,33 @@ __license__ = "MIT"
 
 from pewo.software import get_ar_binary
 from pewo.templates import get_ar_output_templates
+from pewo.cache import get_cache, make_key
+from pewo.resources.harness import measured_command
+from pewo.resources.prediction import predicted_mem_mb, predicted_runtime
 import pewo.config as cfg
 
 
+def _get_ar_cache_key(input, arsoft: str) -> str:
+    """
+    Returns the shared cache key of an ancestral reconstruction. The extended alignment
+    and tree depend only on the pruned alignment, the pruned tree and the reduction ratio.
+    """
+    return make_key("ar", [input.a, input.t],
+                    arsoft=arsoft,
+                    states=config["states"],
+                    model=config["phylo_params"]["model"],
+                    categories=config["phylo_params"]["categories"],
+                    alpha=extract_params(input.s)["alpha"])
+
+
+def get_ar_benchmark_template(arsoft: str) -> str:
+    """
+    Returns the benchmark file template of the ancestral reconstruction with given software.
+    """
+    threads = f"_threads{cfg.get_threads(config, 'ar', config['config_rappas']['arthreads'])}" if arsoft == "RAXMLNG" else ""
+    return config["workdir"] + "/benchmarks/{pruning}_red{red}_ar" + arsoft + threads + "_ansrec_benchmark.tsv"
+
+
 rule compute_ar_inputs:
     """
     Prepares AR outputs using RAPPAS.
@@ -46,39 +70,47 @@ rule ar_phyml:
     log:
         config["workdir"]+"/logs/ar/{pruning}_red{red}_arPHYML.log"
     benchmark:
-        repeat(config["workdir"]+"/benchmarks/{pruning}_red{red}_arPHYML_ansrec_benchmark.tsv", config["repeats"])
+        repeat(get_ar_benchmark_template("PHYML"), cfg.get_repeats(config))
     params:
         outname = os.path.join(cfg.get_work_dir(config), "RAPPAS", "{pruning}", "red{red}_arPHYML"),
         c = config["phylo_params"]["categories"],
+    resources:
+        mem_mb = predicted_mem_mb(config, "ar", "ansrec-PHYML"),
+        runtime = predicted_runtime(config, "ansrec-PHYML")
     run:
-        phylo_params = extract_params(input.s)  #launch 1 extract per pruning
-        states = "nt" if config["states"] == 0 else "aa"
-        arbin = get_ar_binary(config,"PHYML")
+        cache = get_cache(config)
+        cache_key = _get_ar_cache_key(input, "PHYML") if cache else None
+        if not cache or not cache.restore(cache_key, output):
+            phylo_params = extract_params(input.s)  #launch 1 extract per pruning
+            states = "nt" if config["states"] == 0 else "aa"
+            arbin = get_ar_binary(config,"PHYML")
 
-        ar_command = arbin + \
-            " --ancestral " \
-            " --no_memory_check " \
-            " --leave_duplicates " \
-            " -d " + states + \
-            " -f e " + \
-            " -o r " + \
-            " -b 0 " + \
-            " -v 0.0 " + \
-            " -i " + input.a + \
-            " -u " + input.t + \
-            " -c " + str(params.c) + \
-            " -m " + select_model_phymlstyle() + \
-            " -a " + str(phylo_params['alpha']) + \
-            " &> " + str(log)
-        commands = [
-            ar_command,
-            "mkdir -p {params.outname}/AR",
-            "mv {params.outname}/extended_trees/extended_align.phylip_phyml_ancestral_seq.txt {params.outname}/AR/extended_align.phylip_phyml_ancestral_seq.txt",
-            "mv {params.outname}/extended_trees/extended_align.phylip_phyml_ancestral_tree.txt {params.outname}/AR/extended_align.phylip_phyml_ancestral_tree.txt",
-            "mv {params.outname}/extended_trees/extended_align.phylip_phyml_stats.txt {params.outname}/AR/extended_align.phylip_phyml_stats.txt",
-            "mv {params.outname}/extended_trees/extended_align.phylip_phyml_tree.txt {params.outname}/AR/extended_align.phylip_phyml_tree.txt",
-        ]
-        shell(";\n".join(command for command in commands))
+            ar_command = arbin + \
+                " --ancestral " \
+                " --no_memory_check " \
+                " --leave_duplicates " \
+                " -d " + states + \
+                " -f e " + \
+                " -o r " + \
+                " -b 0 " + \
+                " -v 0.0 " + \
+                " -i " + input.a + \
+                " -u " + input.t + \
+                " -c " + str(params.c) + \
+                " -m " + select_model_phymlstyle() + \
+                " -a " + str(phylo_params['alpha']) + \
+                " &> " + str(log)
+            commands = [
+                measured_command(config, ar_command, get_ar_benchmark_template("PHYML")),
+                "mkdir -p {params.outname}/AR",
+                "mv {params.outname}/extended_trees/extended_align.phylip_phyml_ancestral_seq.txt {params.outname}/AR/extended_align.phylip_phyml_ancestral_seq.txt",
+                "mv {params.outname}/extended_trees/extended_align.phylip_phyml_ancestral_tree.txt {params.outname}/AR/extended_align.phylip_phyml_ancestral_tree.txt",
+                "mv {params.outname}/extended_trees/extended_align.phylip_phyml_stats.txt {params.outname}/AR/extended_align.phylip_phyml_stats.txt",
+                "mv {params.outname}/extended_trees/extended_align.phylip_phyml_tree.txt {params.outname}/AR/extended_align.phylip_phyml_tree.txt",
+            ]
+            shell(";\n".join(command for command in commands))
+            if cache:
+                cache.store(cache_key, output)
 
 rule ar_raxmlng:
     input:
@@ -90,30 +122,40 @@ rule ar_raxmlng:
     log:
         config["workdir"]+"/logs/ar/{pruning}_red{red}_arRAXMLNG.log"
     benchmark:
-        repeat(config["workdir"]+"/benchmarks/{pruning}_red{red}_arRAXMLNG_ansrec_benchmark.tsv", config["repeats"])
+        repeat(get_ar_benchmark_template("RAXMLNG"), cfg.get_repeats(config))
     params:
         outname=config["workdir"]+"/RAPPAS/{pruning}/red{red}_arRAXMLNG",
         c=config["phylo_params"]["categories"],
+    threads: cfg.get_threads(config, "ar", config["config_rappas"]["arthreads"])
+    resources:
+        mem_mb = predicted_mem_mb(config, "ar", "ansrec-RAXMLNG"),
+        runtime = predicted_runtime(config, "ansrec-RAXMLNG")
     run:
-        phylo_params=extract_params(input.s)  #launch 1 extract per pruning
-        states="DNA" if config["states"]==0 else "AA"
-        arbin=get_ar_binary(config, "RAXMLNG")
-        model=select_model_phymlstyle()+"+G"+str(config["phylo_params"]["categories"])+"{{"+str(phylo_params['alpha'])+"}}+IU{{0}}+FC"
-        shell(
-            arbin+" --ancestral --redo --precision 9 --seed 1 --force msa --data-type "+states+" "
-            "--threads "+str(config["config_rappas"]["arthreads"])+" "                                                                                                   
-            "--msa {input.a} --tree {input.t} --model "+model+" "
-            "--blopt nr_safe --opt-model on --opt-branches off &> {log} ;"
-            """
-            mkdir -p {params.outname}/AR
-            mv {params.outname}/extended_trees/extended_align.phylip.raxml.log {params.outname}/AR/extended_align.phylip.raxml.log
-            mv {params.outname}/extended_trees/extended_align.phylip.raxml.ancestralTree {params.outname}/AR/extended_align.phylip.raxml.ancestralTree
-            mv {params.outname}/extended_trees/extended_align.phylip.raxml.ancestralProbs {params.outname}/AR/extended_align.phylip.raxml.ancestralProbs
-            mv {params.outname}/extended_trees/extended_align.phylip.raxml.startTree {params.outname}/AR/extended_align.phylip.raxml.startTree
-            mv {params.outname}/extended_trees/extended_align.phylip.raxml.ancestralStates {params.outname}/AR/extended_align.phylip.raxml.ancestralStates
-            mv {params.outname}/extended_trees/extended_align.phylip.raxml.rba {params.outname}/AR/extended_align.phylip.raxml.rba
-            """
-        )
+        cache = get_cache(config)
+        cache_key = _get_ar_cache_key(input, "RAXMLNG") if cache else None
+        if not cache or not cache.restore(cache_key, output):
+            phylo_params=extract_params(input.s)  #launch 1 extract per pruning
+            states="DNA" if config["states"]==0 else "AA"
+            arbin=get_ar_binary(config, "RAXMLNG")
+            model=select_model_phymlstyle()+"+G"+str(config["phylo_params"]["categories"])+"{{"+str(phylo_params['alpha'])+"}}+IU{{0}}+FC"
+            ar_command = arbin+" --ancestral --redo --precision 9 --seed 1 --force msa --data-type "+states+" " \
+                "--threads {threads} " \
+                "--msa {input.a} --tree {input.t} --model "+model+" " \
+                "--blopt nr_safe --opt-model on --opt-branches off &> {log}"
+            shell(
+                measured_command(config, ar_command, get_ar_benchmark_template("RAXMLNG")) + " ;"
+                """
+                mkdir -p {params.outname}/AR
+                mv {params.outname}/extended_trees/extended_align.phylip.raxml.log {params.outname}/AR/extended_align.phylip.raxml.log
+                mv {params.outname}/extended_trees/extended_align.phylip.raxml.ancestralTree {params.outname}/AR/extended_align.phylip.raxml.ancestralTree
+                mv {params.outname}/extended_trees/extended_align.phylip.raxml.ancestralProbs {params.outname}/AR/extended_align.phylip.raxml.ancestralProbs
+                mv {params.outname}/extended_trees/extended_align.phylip.raxml.startTree {params.outname}/AR/extended_align.phylip.raxml.startTree
+                mv {params.outname}/extended_trees/extended_align.phylip.raxml.ancestralStates {params.outname}/AR/extended_align.phylip.raxml.ancestralStates
+                mv {params.outname}/extended_trees/extended_align.phylip.raxml.rba {params.outname}/AR/extended_align.phylip.raxml.rba
+                """
+            )
+            if cache:
+                cache.store(cache_key, output)
 
 rule ar_paml:
     input:
@@ -125,14 +167,24 @@ rule ar_paml:
     log:
         config["workdir"]+"/logs/ar/{pruning}_red{red}_arPAML.log"
     benchmark:
-        repeat(config["workdir"]+"/benchmarks/{pruning}_red{red}_arPAML_ansrec_benchmark.tsv", config["repeats"])
+        repeat(get_ar_benchmark_template("PAML"), cfg.get_repeats(config))
     params:
         outname=config["workdir"]+"/RAPPAS/{pruning}/red{red}_arPAML",
         c=config["phylo_params"]["categories"],
+    resources:
+        mem_mb = predicted_mem_mb(config, "ar", "ansrec-PAML"),
+        runtime = predicted_runtime(config, "ansrec-PAML")
     run:
-        arbin = get_ar_binary(config, "PAML")
-        shell(
-            "mkdir -p {params.outname}/AR ; "
-            "cd {params.outname}/AR ;"
-            " " + arbin + " "+arbin+".ctl --stdout-no-buf &> {log} ;"
-        )
+        cache = get_cache(config)
+        cache_key = _get_ar_cache_key(input, "PAML") if cache else None
+        if not cache or not cache.restore(cache_key, output):
+            arbin = get_ar_binary(config, "PAML")
+            shell(
+                "mkdir -p {params.outname}/AR ; " +
+                measured_command(config,
+                                 "cd {params.outname}/AR ;"
+                                 " " + arbin + " "+arbin+".ctl --stdout-no-buf &> {log}",
+                                 get_ar_benchmark_template("PAML")) + " ;"
+            )
+            if cache:
+                cache.store(cache_key, output)
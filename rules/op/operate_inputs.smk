@@ -12,6 +12,8 @@ __author__ = "Benjamin Linard, Nikolai Romashchenko"
 __license__ = "MIT"
 
 import os
+import pewo.config as cfg
+from pewo.resources.volume import subsample_queries
 
 
 # TODO: script of function to compute reads from alignment
@@ -58,4 +60,20 @@ rule define_resource_inputs:
                 cp {input.r} {output.rout}
                 cp {input.r} {output.gout}
                 """
-            )
\ No newline at end of file
+            )
+
+
+if cfg.get_mode(config) == cfg.Mode.VOLUME:
+    rule subsample_resource_queries:
+        """
+        Subsamples user queries for the volume mode. The read length
+        wildcard of query files holds the number of queries.
+        """
+        input:
+            r=queries()
+        output:
+            rout=config["workdir"]+"/R/0_r{queries}.fasta"
+        wildcard_constraints:
+            queries="[1-9][0-9]*"
+        run:
+            subsample_queries(input.r, output.rout, int(wildcards.queries), cfg.get_query_seed(config))
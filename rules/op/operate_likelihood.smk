@@ -6,15 +6,19 @@ __author__ = "Nikolai Romashchenko"
 __license__ = "MIT"
 
 import os
-from typing import Dict, List, Type
+import string
+import tempfile
+from typing import Dict, List, Tuple, Type
 from snakemake.io import InputFiles, OutputFiles, Params, Wildcards
 import pewo.config as cfg
 from pewo.likelihood.likelihood import combine_csv
-from pewo.likelihood.extend_tree import make_extended_tree
-from pewo.io import fasta
+from pewo.likelihood.extend_tree import make_extended_trees
+from pewo.likelihood.evaluator import get_evaluator, calculate_likelihoods
+from pewo.io import fasta, newick
 from pewo.software import PlacementSoftware, AlignmentSoftware
 from pewo.templates import get_output_template, get_common_queryname_template, \
-    get_output_template_args, get_software_dir, get_common_template_args
+    get_output_template_args, get_software_dir, get_common_template_args, \
+    get_query_batch_alignment_template
 
 _work_dir = cfg.get_work_dir(config)
 
@@ -24,39 +28,133 @@ RuleParams = Type[Params]
 RuleWildcards = Type[Wildcards]
 
 
-def _calculate_likelihood(input: RuleInputs, output: RuleOutputs, params: RuleParams, wildcards: RuleWildcards) -> None:
-    with open(output.csv, "w") as f_out:
-        # make .csv header: placement parameters
-        header = [key for key in wildcards.keys()]
-        # add the likelihood value
-        header.append("likelihood")
-        header.append("software")
-
-        # snakemake.NamedList implemented keys(), but not values()... *sigh*
-        values = [wildcards[key] for key in wildcards.keys()]
-
-        # run raxml-ng, parse the output to get the likelihood value and put it in the variable
-        likelihood = shell(
-            'raxml-ng '
-            '--evaluate '
-            '--msa {input.alignment} '
-            '--tree {input.tree} '
-            '--model {params.model} '
-            '--redo '
-            '--threads 1 '
-            '--opt-branches {params.optimization} '
-            '--opt-model {params.optimization} '
-            '| grep "Final LogLikelihood" | cut -d" " -f3', read=True
-        ).decode("utf-8").strip()
-        values.append(
-            likelihood
-        )
-        values.append(params.software)
+def _use_builtin_evaluator(config: Dict) -> bool:
+    """
+    Checks if the likelihood is computed by pewo.likelihood.evaluator instead of raxml-ng.
+    """
+    return str(config["lac"]["optimization"]).upper() == "OFF" and \
+           config["lac"].get("evaluator", "pewo") == "pewo"
 
-        # All the wilcards extracted from the .tree file were input parameters of placement.
-        # Print them in the file as a header of two-line .csv file
-        print(';'.join(s for s in header), file=f_out)
-        print(';'.join(s for s in values), file=f_out)
+
+def _write_likelihood_csv(output_file: str, header: List[str], rows: List[List[str]]) -> None:
+    """
+    Writes a .csv file: placement parameters, the likelihood value and software,
+    one line per query.
+    """
+    with open(output_file, "w") as f_out:
+        print(';'.join(header + ["likelihood", "software"]), file=f_out)
+        for row in rows:
+            print(';'.join(row), file=f_out)
+
+
+def _run_raxml(alignment: str, tree: str, params: RuleParams, threads: int) -> str:
+    """
+    Runs raxml-ng, parses the output and returns the likelihood value.
+    """
+    return shell(
+        'raxml-ng '
+        '--evaluate '
+        '--msa {alignment} '
+        '--tree {tree} '
+        '--model {params.model} '
+        '--redo '
+        '--threads {threads} '
+        '--opt-branches {params.optimization} '
+        '--opt-model {params.optimization} '
+        '| grep "Final LogLikelihood" | cut -d" " -f3', read=True
+    ).decode("utf-8").strip()
+
+
+def _run_raxml_shard(input: RuleInputs, output: RuleOutputs, params: RuleParams,
+                     threads: int) -> List[Tuple[str, str]]:
+    """
+    Runs raxml-ng for every extended tree of a shard of queries. Every tree is evaluated
+    on the alignment of its own leaves. Returns pairs of query names and likelihood values.
+    """
+    reference_tree = newick.read(config["dataset_tree"])
+    reference_names = set(reference_tree.names[leaf] for leaf in reference_tree.leaves())
+    with fasta.FastaReader(input.alignment) as reader:
+        sequences = dict((seq_id, bytes(sequence)) for seq_id, sequence in reader)
+
+    results = []
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(output.csv)) as tmp_dir, \
+            open(input.tree) as f_trees:
+        for i, line in enumerate(f_trees):
+            tree = newick.parse(line)
+            leaves = [tree.names[leaf] for leaf in tree.leaves()]
+            query_name = next(name for name in leaves if name not in reference_names)
+
+            alignment_file = os.path.join(tmp_dir, str(i) + ".fasta")
+            with fasta.FastaWriter(alignment_file) as writer:
+                for name in leaves:
+                    writer.write(name, sequences[name])
+            tree_file = os.path.join(tmp_dir, str(i) + ".tree")
+            with open(tree_file, "w") as f_out:
+                print(line.strip(), file=f_out)
+
+            results.append((query_name, _run_raxml(alignment_file, tree_file, params, threads)))
+    return results
+
+
+def _calculate_likelihood(input: RuleInputs, output: RuleOutputs, params: RuleParams, wildcards: RuleWildcards,
+                          threads: int) -> None:
+    # make .csv header: placement parameters
+    header = [key for key in wildcards.keys()]
+
+    # snakemake.NamedList implemented keys(), but not values()... *sigh*
+    values = [wildcards[key] for key in wildcards.keys()]
+
+    # All the wilcards extracted from the .tree file were input parameters of placement.
+    # Print them in the file as a header of the .csv file
+    if cfg.get_query_shard_size(config) == 0:
+        rows = [values + [_run_raxml(input.alignment, input.tree, params, threads), params.software]]
+    else:
+        # a shard: the query wildcard is replaced by IDs of queries
+        query_index = header.index("query")
+        rows = []
+        for query_name, likelihood in _run_raxml_shard(input, output, params, threads):
+            values[query_index] = fasta.seq_id_filter(query_name)
+            rows.append(values + [likelihood, params.software])
+    _write_likelihood_csv(output.csv, header, rows)
+
+
+def _evaluate_likelihoods(input: RuleInputs, output: RuleOutputs, params: RuleParams, wildcards: RuleWildcards) -> None:
+    """
+    Calculates likelihood values for all queries with the built-in evaluator. Partial likelihoods
+    of the reference tree, and those of queries changing the GTR frequencies, are computed once
+    and shared by all jobs with the same reference.
+    """
+    evaluator = get_evaluator(input.tree, input.reference,
+                              config["phylo_params"]["model"],
+                              int(config["phylo_params"]["categories"]),
+                              config["lac"].get("model_file"),
+                              cfg.uses_extended_frequencies(config))
+    # queries aligned together are read from a single alignment
+    alignment = input.alignment[0] if cfg.aligns_queries_together(config) else input.alignment
+    likelihoods = calculate_likelihoods(evaluator, input.jplace, alignment)
+
+    # the same columns as in the output of _calculate_likelihood: wildcards in the order
+    # of their appearance in the output template
+    header = list(dict.fromkeys(name for _, name, _, _ in string.Formatter().parse(params.template) if name))
+    queries = get_common_template_args(config)["query"]
+    sharded = cfg.get_query_shard_size(config) > 0
+
+    for query, csv_file, results in zip(queries, output.csv, likelihoods):
+        values = dict((key, wildcards[key]) for key in wildcards.keys())
+        rows = []
+        for query_name, likelihood in results:
+            # a shard: the query wildcard is replaced by IDs of queries
+            values["query"] = fasta.seq_id_filter(query_name) if sharded else query
+            rows.append([values[key] for key in header] + [f"{likelihood:.6f}", params.software])
+        _write_likelihood_csv(csv_file, header, rows)
+
+
+def _get_query_templates(template: str) -> List[str]:
+    """
+    Resolves the {query} wildcard of a template for all input queries,
+    keeping other wildcards. Used by rules processing all queries in one job.
+    """
+    return [template.replace("{query}", query) for query in get_common_template_args(config)["query"]]
 
 
 def _get_aligned_query_template(config: Dict) -> str:
@@ -66,9 +164,19 @@ def _get_aligned_query_template(config: Dict) -> str:
                         "{pruning}",
                         get_common_queryname_template(config) + ".fasta")
 
+
+def _get_aligned_query_files(config: Dict) -> List[str]:
+    """
+    Returns the alignments of all queries for rules processing all queries in one job.
+    """
+    if cfg.aligns_queries_together(config):
+        return [get_query_batch_alignment_template(config) + ".fasta"]
+    return _get_query_templates(_get_aligned_query_template(config))
+
 rule split_queries:
     """
-    Splits input .fasta file into multiple fasta files.
+    Splits input .fasta file into multiple fasta files: one file per query,
+    or one file per shard of queries if query_shard_size is set.
     """
     input:
         reads=config["query_user"]
@@ -82,7 +190,10 @@ rule split_queries:
         config["workdir"] + "/logs/split_queries.log"
     run:
         output_directory = os.path.join(_work_dir, "R")
-        fasta.split_fasta(config["query_user"], output_directory)
+        fasta.split_fasta(config["query_user"], output_directory, cfg.get_query_shard_size(config))
+
+# Trees are extended in one job per software and parameter set: the reference tree
+# is parsed once and the extended trees of all queries are written by the same job.
 
 # WARNING!
 #
@@ -97,263 +208,439 @@ rule split_queries:
 
 rule extend_trees_epa:
     input:
-         jplace=get_output_template(config, PlacementSoftware.EPA, "jplace"),
+         jplace=_get_query_templates(get_output_template(config, PlacementSoftware.EPA, "jplace")),
          tree=config["dataset_tree"],
     output:
-          ext_tree=get_output_template(config, PlacementSoftware.EPA, "tree")
+          ext_tree=_get_query_templates(get_output_template(config, PlacementSoftware.EPA, "tree"))
     run:
-        make_extended_tree(input.tree, output.ext_tree, input.jplace)
+        make_extended_trees(input.tree, input.jplace, output.ext_tree)
 
 rule extend_trees_epang_h1:
     input:
-         jplace=get_output_template(config, PlacementSoftware.EPANG, "jplace", heuristic="h1"),
+         jplace=_get_query_templates(get_output_template(config, PlacementSoftware.EPANG, "jplace", heuristic="h1")),
          tree=config["dataset_tree"],
     output:
-          ext_tree=get_output_template(config, PlacementSoftware.EPANG, "tree", heuristic="h1")
+          ext_tree=_get_query_templates(get_output_template(config, PlacementSoftware.EPANG, "tree", heuristic="h1"))
     run:
-        make_extended_tree(input.tree, output.ext_tree, input.jplace)
+        make_extended_trees(input.tree, input.jplace, output.ext_tree)
 
 rule extend_trees_epang_h2:
     input:
-         jplace=get_output_template(config, PlacementSoftware.EPANG, "jplace", heuristic="h2"),
+         jplace=_get_query_templates(get_output_template(config, PlacementSoftware.EPANG, "jplace", heuristic="h2")),
          tree=config["dataset_tree"],
     output:
-          ext_tree=get_output_template(config, PlacementSoftware.EPANG, "tree", heuristic="h2")
+          ext_tree=_get_query_templates(get_output_template(config, PlacementSoftware.EPANG, "tree", heuristic="h2"))
     run:
-        make_extended_tree(input.tree, output.ext_tree, input.jplace)
+        make_extended_trees(input.tree, input.jplace, output.ext_tree)
 
 rule extend_trees_epang_h3:
     input:
-         jplace=get_output_template(config, PlacementSoftware.EPANG, "jplace", heuristic="h3"),
+         jplace=_get_query_templates(get_output_template(config, PlacementSoftware.EPANG, "jplace", heuristic="h3")),
          tree=config["dataset_tree"],
     output:
-          ext_tree=get_output_template(config, PlacementSoftware.EPANG, "tree", heuristic="h3")
+          ext_tree=_get_query_templates(get_output_template(config, PlacementSoftware.EPANG, "tree", heuristic="h3"))
     run:
-        make_extended_tree(input.tree, output.ext_tree, input.jplace)
+        make_extended_trees(input.tree, input.jplace, output.ext_tree)
 
 rule extend_trees_epang_h4:
     input:
-         jplace=get_output_template(config, PlacementSoftware.EPANG, "jplace", heuristic="h4"),
+         jplace=_get_query_templates(get_output_template(config, PlacementSoftware.EPANG, "jplace", heuristic="h4")),
          tree=config["dataset_tree"],
     output:
-          ext_tree=get_output_template(config, PlacementSoftware.EPANG, "tree", heuristic="h4")
+          ext_tree=_get_query_templates(get_output_template(config, PlacementSoftware.EPANG, "tree", heuristic="h4"))
     run:
-        make_extended_tree(input.tree, output.ext_tree, input.jplace)
+        make_extended_trees(input.tree, input.jplace, output.ext_tree)
 
 rule extend_trees_pplacer:
     input:
-         jplace=get_output_template(config, PlacementSoftware.PPLACER, "jplace"),
+         jplace=_get_query_templates(get_output_template(config, PlacementSoftware.PPLACER, "jplace")),
          tree=config["dataset_tree"],
     output:
-          ext_tree=get_output_template(config, PlacementSoftware.PPLACER, "tree")
+          ext_tree=_get_query_templates(get_output_template(config, PlacementSoftware.PPLACER, "tree"))
     run:
-        make_extended_tree(input.tree, output.ext_tree, input.jplace)
+        make_extended_trees(input.tree, input.jplace, output.ext_tree)
 
 rule extend_trees_rappas:
     input:
-         jplace=get_output_template(config, PlacementSoftware.RAPPAS, "jplace"),
+         jplace=_get_query_templates(get_output_template(config, PlacementSoftware.RAPPAS, "jplace")),
          tree=config["dataset_tree"],
     output:
-          ext_tree=get_output_template(config, PlacementSoftware.RAPPAS, "tree")
+          ext_tree=_get_query_templates(get_output_template(config, PlacementSoftware.RAPPAS, "tree"))
     run:
-        make_extended_tree(input.tree, output.ext_tree, input.jplace)
-
-rule extend_trees_rappas2:
-    input:
-         jplace=get_output_template(config, PlacementSoftware.RAPPAS2, "jplace"),
-         tree=config["dataset_tree"],
-    output:
-          ext_tree=get_output_template(config, PlacementSoftware.RAPPAS2, "tree")
-    log:
-        get_output_template(config, PlacementSoftware.RAPPAS2, "ext_tree.log")
-    run:
-        make_extended_tree(input.tree, output.ext_tree, input.jplace)
+        make_extended_trees(input.tree, input.jplace, output.ext_tree)
 
 rule extend_trees_apples:
     input:
-         jplace=get_output_template(config, PlacementSoftware.APPLES, "jplace"),
+         jplace=_get_query_templates(get_output_template(config, PlacementSoftware.APPLES, "jplace")),
          tree=config["dataset_tree"],
     output:
-          ext_tree=get_output_template(config, PlacementSoftware.APPLES, "tree")
+          ext_tree=_get_query_templates(get_output_template(config, PlacementSoftware.APPLES, "tree"))
     run:
-        make_extended_tree(input.tree, output.ext_tree, input.jplace)
+        make_extended_trees(input.tree, input.jplace, output.ext_tree)
 
 rule extend_trees_appspam:
     input:
-         jplace=get_output_template(config, PlacementSoftware.APPSPAM, "jplace"),
+         jplace=_get_query_templates(get_output_template(config, PlacementSoftware.APPSPAM, "jplace")),
          tree=config["dataset_tree"],
     output:
-          ext_tree=get_output_template(config, PlacementSoftware.APPSPAM, "tree")
-    run:
-        make_extended_tree(input.tree, output.ext_tree, input.jplace)
-
-rule calculate_likelihood_epa:
-    """
-    Calculates likelihood values for the placements produced by EPA.
-    """
-    input:
-         alignment=_get_aligned_query_template(config),
-         tree=get_output_template(config, PlacementSoftware.EPA, "tree")
-    output:
-          csv=get_output_template(config, PlacementSoftware.EPA, "csv")
-    params:
-          workdir=cfg.get_work_dir(config),
-          software=PlacementSoftware.EPA.value,
-          model="GTR+G",
-          optimization=config["lac"]["optimization"]
-    run:
-        _calculate_likelihood(input, output, params, wildcards)
-
-rule calculate_likelihood_epang_h1:
-    """
-    Calculates likelihood values for the placements produced by EPA-NG (heuristic 1).
-    """
-    input:
-         alignment=_get_aligned_query_template(config),
-         tree=get_output_template(config, PlacementSoftware.EPANG, "tree", heuristic="h1")
-    output:
-          csv=get_output_template(config, PlacementSoftware.EPANG, "csv", heuristic="h1")
-    params:
-          workdir=cfg.get_work_dir(config),
-          software=PlacementSoftware.EPANG.value,
-          model="GTR+G",
-          optimization=config["lac"]["optimization"]
-    run:
-        _calculate_likelihood(input, output, params, wildcards)
-
-rule calculate_likelihood_epang_h2:
-    """
-    Calculates likelihood values for the placements produced by EPA-NG (heuristic 2).
-    """
-    input:
-         alignment=_get_aligned_query_template(config),
-         tree=get_output_template(config, PlacementSoftware.EPANG, "tree", heuristic="h2")
-    output:
-          csv=get_output_template(config, PlacementSoftware.EPANG, "csv", heuristic="h2")
-    params:
-          workdir=cfg.get_work_dir(config),
-          software=PlacementSoftware.EPANG.value,
-          model="GTR+G",
-          optimization=config["lac"]["optimization"]
-    run:
-        _calculate_likelihood(input, output, params, wildcards)
-
-rule calculate_likelihood_epang_h3:
-    """
-    Calculates likelihood values for the placements produced by EPA-NG (heuristic 3).
-    """
-    input:
-         alignment=_get_aligned_query_template(config),
-         tree=get_output_template(config, PlacementSoftware.EPANG, "tree", heuristic="h3")
-    output:
-          csv=get_output_template(config, PlacementSoftware.EPANG, "csv", heuristic="h3")
-    params:
-          workdir=cfg.get_work_dir(config),
-          software=PlacementSoftware.EPANG.value,
-          model="GTR+G",
-          optimization=config["lac"]["optimization"]
-    run:
-        _calculate_likelihood(input, output, params, wildcards)
-
-rule calculate_likelihood_epang_h4:
-    """
-    Calculates likelihood values for the placements produced by EPA-NG (heuristic 4).
-    """
-    input:
-         alignment=_get_aligned_query_template(config),
-         tree=get_output_template(config, PlacementSoftware.EPANG, "tree", heuristic="h4")
-    output:
-          csv=get_output_template(config, PlacementSoftware.EPANG, "csv", heuristic="h4")
-    params:
-          workdir=cfg.get_work_dir(config),
-          software=PlacementSoftware.EPANG.value,
-          model="GTR+G",
-          optimization=config["lac"]["optimization"]
-    run:
-        _calculate_likelihood(input, output, params, wildcards)
-
-rule calculate_likelihood_pplacer:
-    """
-    Calculates likelihood values for the placements produced by PPLACER.
-    """
-    input:
-         alignment=_get_aligned_query_template(config),
-         tree=get_output_template(config, PlacementSoftware.PPLACER, "tree")
-    output:
-          csv=get_output_template(config, PlacementSoftware.PPLACER, "csv")
-    params:
-          workdir=cfg.get_work_dir(config),
-          software=PlacementSoftware.PPLACER.value,
-          model="GTR+G",
-          optimization=config["lac"]["optimization"]
-    run:
-        _calculate_likelihood(input, output, params, wildcards)
-
-rule calculate_likelihood_rappas:
-    """
-    Calculates likelihood values for the placements produced by RAPPAS.
-    """
-    input:
-         alignment=_get_aligned_query_template(config),
-         tree=get_output_template(config, PlacementSoftware.RAPPAS, "tree")
-    output:
-          csv=get_output_template(config, PlacementSoftware.RAPPAS, "csv")
-    params:
-          workdir=cfg.get_work_dir(config),
-          software=PlacementSoftware.RAPPAS.value,
-          model="GTR+G",
-          optimization=config["lac"]["optimization"]
-    run:
-        _calculate_likelihood(input, output, params, wildcards)
-
-rule calculate_likelihood_rappas2:
-    input:
-         alignment=_get_aligned_query_template(config),
-         tree=get_output_template(config, PlacementSoftware.RAPPAS2, "tree")
-    output:
-          csv=get_output_template(config, PlacementSoftware.RAPPAS2, "csv")
-    log:
-        get_output_template(config, PlacementSoftware.RAPPAS2, "calc_ll.log")
-    params:
-          workdir=cfg.get_work_dir(config),
-          software=PlacementSoftware.RAPPAS2.value,
-          model="GTR+G",
-          optimization=config["lac"]["optimization"]
-    run:
-        _calculate_likelihood(input, output, params, wildcards)
-
-rule calculate_likelihood_apples:
-    """
-    Calculates likelihood values for the placements produced by APPLES.
-    """
-    input:
-         alignment=_get_aligned_query_template(config),
-         tree=get_output_template(config, PlacementSoftware.APPLES, "tree")
-    output:
-          csv=get_output_template(config, PlacementSoftware.APPLES, "csv")
-    params:
-          workdir=cfg.get_work_dir(config),
-          software=PlacementSoftware.APPLES.value,
-          model="GTR+G",
-          optimization=config["lac"]["optimization"]
-    run:
-        _calculate_likelihood(input, output, params, wildcards)
-
-rule calculate_likelihood_appspam:
-    """
-    Calculates likelihood values for the placements produced by APPSPAM.
-    """
-    input:
-         alignment=_get_aligned_query_template(config),
-         tree=get_output_template(config, PlacementSoftware.APPSPAM, "tree")
-    output:
-          csv=get_output_template(config, PlacementSoftware.APPSPAM, "csv")
-    params:
-          workdir=cfg.get_work_dir(config),
-          software=PlacementSoftware.APPSPAM.value,
-          model="GTR+G"
+          ext_tree=_get_query_templates(get_output_template(config, PlacementSoftware.APPSPAM, "tree"))
     run:
-        _calculate_likelihood(input, output, params, wildcards)
+        make_extended_trees(input.tree, input.jplace, output.ext_tree)
+
+# If model parameters and branch lengths are not optimized, the likelihood is computed
+# by the built-in evaluator in one job per software and parameter set. Otherwise,
+# raxml-ng is run for every extended tree.
+if _use_builtin_evaluator(config):
+    rule calculate_likelihood_epa:
+        """
+        Calculates likelihood values for the placements produced by EPA.
+        """
+        input:
+             alignment=_get_aligned_query_files(config),
+             jplace=_get_query_templates(get_output_template(config, PlacementSoftware.EPA, "jplace")),
+             tree=config["dataset_tree"],
+             reference=os.path.join(_work_dir, "A", "{pruning}.align")
+        output:
+              csv=_get_query_templates(get_output_template(config, PlacementSoftware.EPA, "csv"))
+        params:
+              software=PlacementSoftware.EPA.value,
+              template=get_output_template(config, PlacementSoftware.EPA, "csv")
+        resources:
+            mem_mb = cfg.get_mem_mb(config, "likelihood")
+        run:
+            _evaluate_likelihoods(input, output, params, wildcards)
+
+    rule calculate_likelihood_epang_h1:
+        """
+        Calculates likelihood values for the placements produced by EPA-NG (heuristic 1).
+        """
+        input:
+             alignment=_get_aligned_query_files(config),
+             jplace=_get_query_templates(get_output_template(config, PlacementSoftware.EPANG, "jplace", heuristic="h1")),
+             tree=config["dataset_tree"],
+             reference=os.path.join(_work_dir, "A", "{pruning}.align")
+        output:
+              csv=_get_query_templates(get_output_template(config, PlacementSoftware.EPANG, "csv", heuristic="h1"))
+        params:
+              software=PlacementSoftware.EPANG.value,
+              template=get_output_template(config, PlacementSoftware.EPANG, "csv", heuristic="h1")
+        resources:
+            mem_mb = cfg.get_mem_mb(config, "likelihood")
+        run:
+            _evaluate_likelihoods(input, output, params, wildcards)
+
+    rule calculate_likelihood_epang_h2:
+        """
+        Calculates likelihood values for the placements produced by EPA-NG (heuristic 2).
+        """
+        input:
+             alignment=_get_aligned_query_files(config),
+             jplace=_get_query_templates(get_output_template(config, PlacementSoftware.EPANG, "jplace", heuristic="h2")),
+             tree=config["dataset_tree"],
+             reference=os.path.join(_work_dir, "A", "{pruning}.align")
+        output:
+              csv=_get_query_templates(get_output_template(config, PlacementSoftware.EPANG, "csv", heuristic="h2"))
+        params:
+              software=PlacementSoftware.EPANG.value,
+              template=get_output_template(config, PlacementSoftware.EPANG, "csv", heuristic="h2")
+        resources:
+            mem_mb = cfg.get_mem_mb(config, "likelihood")
+        run:
+            _evaluate_likelihoods(input, output, params, wildcards)
+
+    rule calculate_likelihood_epang_h3:
+        """
+        Calculates likelihood values for the placements produced by EPA-NG (heuristic 3).
+        """
+        input:
+             alignment=_get_aligned_query_files(config),
+             jplace=_get_query_templates(get_output_template(config, PlacementSoftware.EPANG, "jplace", heuristic="h3")),
+             tree=config["dataset_tree"],
+             reference=os.path.join(_work_dir, "A", "{pruning}.align")
+        output:
+              csv=_get_query_templates(get_output_template(config, PlacementSoftware.EPANG, "csv", heuristic="h3"))
+        params:
+              software=PlacementSoftware.EPANG.value,
+              template=get_output_template(config, PlacementSoftware.EPANG, "csv", heuristic="h3")
+        resources:
+            mem_mb = cfg.get_mem_mb(config, "likelihood")
+        run:
+            _evaluate_likelihoods(input, output, params, wildcards)
+
+    rule calculate_likelihood_epang_h4:
+        """
+        Calculates likelihood values for the placements produced by EPA-NG (heuristic 4).
+        """
+        input:
+             alignment=_get_aligned_query_files(config),
+             jplace=_get_query_templates(get_output_template(config, PlacementSoftware.EPANG, "jplace", heuristic="h4")),
+             tree=config["dataset_tree"],
+             reference=os.path.join(_work_dir, "A", "{pruning}.align")
+        output:
+              csv=_get_query_templates(get_output_template(config, PlacementSoftware.EPANG, "csv", heuristic="h4"))
+        params:
+              software=PlacementSoftware.EPANG.value,
+              template=get_output_template(config, PlacementSoftware.EPANG, "csv", heuristic="h4")
+        resources:
+            mem_mb = cfg.get_mem_mb(config, "likelihood")
+        run:
+            _evaluate_likelihoods(input, output, params, wildcards)
+
+    rule calculate_likelihood_pplacer:
+        """
+        Calculates likelihood values for the placements produced by PPLACER.
+        """
+        input:
+             alignment=_get_aligned_query_files(config),
+             jplace=_get_query_templates(get_output_template(config, PlacementSoftware.PPLACER, "jplace")),
+             tree=config["dataset_tree"],
+             reference=os.path.join(_work_dir, "A", "{pruning}.align")
+        output:
+              csv=_get_query_templates(get_output_template(config, PlacementSoftware.PPLACER, "csv"))
+        params:
+              software=PlacementSoftware.PPLACER.value,
+              template=get_output_template(config, PlacementSoftware.PPLACER, "csv")
+        resources:
+            mem_mb = cfg.get_mem_mb(config, "likelihood")
+        run:
+            _evaluate_likelihoods(input, output, params, wildcards)
+
+    rule calculate_likelihood_rappas:
+        """
+        Calculates likelihood values for the placements produced by RAPPAS.
+        """
+        input:
+             alignment=_get_aligned_query_files(config),
+             jplace=_get_query_templates(get_output_template(config, PlacementSoftware.RAPPAS, "jplace")),
+             tree=config["dataset_tree"],
+             reference=os.path.join(_work_dir, "A", "{pruning}.align")
+        output:
+              csv=_get_query_templates(get_output_template(config, PlacementSoftware.RAPPAS, "csv"))
+        params:
+              software=PlacementSoftware.RAPPAS.value,
+              template=get_output_template(config, PlacementSoftware.RAPPAS, "csv")
+        resources:
+            mem_mb = cfg.get_mem_mb(config, "likelihood")
+        run:
+            _evaluate_likelihoods(input, output, params, wildcards)
+
+    rule calculate_likelihood_apples:
+        """
+        Calculates likelihood values for the placements produced by APPLES.
+        """
+        input:
+             alignment=_get_aligned_query_files(config),
+             jplace=_get_query_templates(get_output_template(config, PlacementSoftware.APPLES, "jplace")),
+             tree=config["dataset_tree"],
+             reference=os.path.join(_work_dir, "A", "{pruning}.align")
+        output:
+              csv=_get_query_templates(get_output_template(config, PlacementSoftware.APPLES, "csv"))
+        params:
+              software=PlacementSoftware.APPLES.value,
+              template=get_output_template(config, PlacementSoftware.APPLES, "csv")
+        resources:
+            mem_mb = cfg.get_mem_mb(config, "likelihood")
+        run:
+            _evaluate_likelihoods(input, output, params, wildcards)
+
+    rule calculate_likelihood_appspam:
+        """
+        Calculates likelihood values for the placements produced by APPSPAM.
+        """
+        input:
+             alignment=_get_aligned_query_files(config),
+             jplace=_get_query_templates(get_output_template(config, PlacementSoftware.APPSPAM, "jplace")),
+             tree=config["dataset_tree"],
+             reference=os.path.join(_work_dir, "A", "{pruning}.align")
+        output:
+              csv=_get_query_templates(get_output_template(config, PlacementSoftware.APPSPAM, "csv"))
+        params:
+              software=PlacementSoftware.APPSPAM.value,
+              template=get_output_template(config, PlacementSoftware.APPSPAM, "csv")
+        resources:
+            mem_mb = cfg.get_mem_mb(config, "likelihood")
+        run:
+            _evaluate_likelihoods(input, output, params, wildcards)
+
+else:
+    rule calculate_likelihood_epa:
+        """
+        Calculates likelihood values for the placements produced by EPA.
+        """
+        input:
+             alignment=_get_aligned_query_template(config),
+             tree=get_output_template(config, PlacementSoftware.EPA, "tree")
+        output:
+              csv=get_output_template(config, PlacementSoftware.EPA, "csv")
+        params:
+              workdir=cfg.get_work_dir(config),
+              software=PlacementSoftware.EPA.value,
+              model="GTR+G",
+              optimization=config["lac"]["optimization"]
+        threads: cfg.get_threads(config, "likelihood")
+        resources:
+            mem_mb = cfg.get_mem_mb(config, "likelihood")
+        run:
+            _calculate_likelihood(input, output, params, wildcards, threads)
+
+    rule calculate_likelihood_epang_h1:
+        """
+        Calculates likelihood values for the placements produced by EPA-NG (heuristic 1).
+        """
+        input:
+             alignment=_get_aligned_query_template(config),
+             tree=get_output_template(config, PlacementSoftware.EPANG, "tree", heuristic="h1")
+        output:
+              csv=get_output_template(config, PlacementSoftware.EPANG, "csv", heuristic="h1")
+        params:
+              workdir=cfg.get_work_dir(config),
+              software=PlacementSoftware.EPANG.value,
+              model="GTR+G",
+              optimization=config["lac"]["optimization"]
+        threads: cfg.get_threads(config, "likelihood")
+        resources:
+            mem_mb = cfg.get_mem_mb(config, "likelihood")
+        run:
+            _calculate_likelihood(input, output, params, wildcards, threads)
+
+    rule calculate_likelihood_epang_h2:
+        """
+        Calculates likelihood values for the placements produced by EPA-NG (heuristic 2).
+        """
+        input:
+             alignment=_get_aligned_query_template(config),
+             tree=get_output_template(config, PlacementSoftware.EPANG, "tree", heuristic="h2")
+        output:
+              csv=get_output_template(config, PlacementSoftware.EPANG, "csv", heuristic="h2")
+        params:
+              workdir=cfg.get_work_dir(config),
+              software=PlacementSoftware.EPANG.value,
+              model="GTR+G",
+              optimization=config["lac"]["optimization"]
+        threads: cfg.get_threads(config, "likelihood")
+        resources:
+            mem_mb = cfg.get_mem_mb(config, "likelihood")
+        run:
+            _calculate_likelihood(input, output, params, wildcards, threads)
+
+    rule calculate_likelihood_epang_h3:
+        """
+        Calculates likelihood values for the placements produced by EPA-NG (heuristic 3).
+        """
+        input:
+             alignment=_get_aligned_query_template(config),
+             tree=get_output_template(config, PlacementSoftware.EPANG, "tree", heuristic="h3")
+        output:
+              csv=get_output_template(config, PlacementSoftware.EPANG, "csv", heuristic="h3")
+        params:
+              workdir=cfg.get_work_dir(config),
+              software=PlacementSoftware.EPANG.value,
+              model="GTR+G",
+              optimization=config["lac"]["optimization"]
+        threads: cfg.get_threads(config, "likelihood")
+        resources:
+            mem_mb = cfg.get_mem_mb(config, "likelihood")
+        run:
+            _calculate_likelihood(input, output, params, wildcards, threads)
+
+    rule calculate_likelihood_epang_h4:
+        """
+        Calculates likelihood values for the placements produced by EPA-NG (heuristic 4).
+        """
+        input:
+             alignment=_get_aligned_query_template(config),
+             tree=get_output_template(config, PlacementSoftware.EPANG, "tree", heuristic="h4")
+        output:
+              csv=get_output_template(config, PlacementSoftware.EPANG, "csv", heuristic="h4")
+        params:
+              workdir=cfg.get_work_dir(config),
+              software=PlacementSoftware.EPANG.value,
+              model="GTR+G",
+              optimization=config["lac"]["optimization"]
+        threads: cfg.get_threads(config, "likelihood")
+        resources:
+            mem_mb = cfg.get_mem_mb(config, "likelihood")
+        run:
+            _calculate_likelihood(input, output, params, wildcards, threads)
+
+    rule calculate_likelihood_pplacer:
+        """
+        Calculates likelihood values for the placements produced by PPLACER.
+        """
+        input:
+             alignment=_get_aligned_query_template(config),
+             tree=get_output_template(config, PlacementSoftware.PPLACER, "tree")
+        output:
+              csv=get_output_template(config, PlacementSoftware.PPLACER, "csv")
+        params:
+              workdir=cfg.get_work_dir(config),
+              software=PlacementSoftware.PPLACER.value,
+              model="GTR+G",
+              optimization=config["lac"]["optimization"]
+        threads: cfg.get_threads(config, "likelihood")
+        resources:
+            mem_mb = cfg.get_mem_mb(config, "likelihood")
+        run:
+            _calculate_likelihood(input, output, params, wildcards, threads)
+
+    rule calculate_likelihood_rappas:
+        """
+        Calculates likelihood values for the placements produced by RAPPAS.
+        """
+        input:
+             alignment=_get_aligned_query_template(config),
+             tree=get_output_template(config, PlacementSoftware.RAPPAS, "tree")
+        output:
+              csv=get_output_template(config, PlacementSoftware.RAPPAS, "csv")
+        params:
+              workdir=cfg.get_work_dir(config),
+              software=PlacementSoftware.RAPPAS.value,
+              model="GTR+G",
+              optimization=config["lac"]["optimization"]
+        threads: cfg.get_threads(config, "likelihood")
+        resources:
+            mem_mb = cfg.get_mem_mb(config, "likelihood")
+        run:
+            _calculate_likelihood(input, output, params, wildcards, threads)
+
+    rule calculate_likelihood_apples:
+        """
+        Calculates likelihood values for the placements produced by APPLES.
+        """
+        input:
+             alignment=_get_aligned_query_template(config),
+             tree=get_output_template(config, PlacementSoftware.APPLES, "tree")
+        output:
+              csv=get_output_template(config, PlacementSoftware.APPLES, "csv")
+        params:
+              workdir=cfg.get_work_dir(config),
+              software=PlacementSoftware.APPLES.value,
+              model="GTR+G",
+              optimization=config["lac"]["optimization"]
+        threads: cfg.get_threads(config, "likelihood")
+        resources:
+            mem_mb = cfg.get_mem_mb(config, "likelihood")
+        run:
+            _calculate_likelihood(input, output, params, wildcards, threads)
+
+    rule calculate_likelihood_appspam:
+        """
+        Calculates likelihood values for the placements produced by APPSPAM.
+        """
+        input:
+             alignment=_get_aligned_query_template(config),
+             tree=get_output_template(config, PlacementSoftware.APPSPAM, "tree")
+        output:
+              csv=get_output_template(config, PlacementSoftware.APPSPAM, "csv")
+        params:
+              workdir=cfg.get_work_dir(config),
+              software=PlacementSoftware.APPSPAM.value,
+              model="GTR+G"
+        threads: cfg.get_threads(config, "likelihood")
+        resources:
+            mem_mb = cfg.get_mem_mb(config, "likelihood")
+        run:
+            _calculate_likelihood(input, output, params, wildcards, threads)
 
 def _get_csv_output(config: Dict) -> List[str]:
     """
@@ -392,6 +679,8 @@ rule combine_likelihoods:
     input:
         csv_files=_get_csv_output(config)
     output:
-        сsv_file=os.path.join(_work_dir, "likelihood.csv")
+        сsv_file=os.path.join(_work_dir, "likelihood.csv"),
+        rds_file=[os.path.join(_work_dir, "likelihood.rds")] if cfg.writes_likelihood_rds(config) else []
     run:
-        combine_csv(input.csv_files, output.сsv_file)
+        # rds_file is a list-valued output, empty unless the data frame is written
+        combine_csv(input.csv_files, output.сsv_file, output.rds_file[0] if output.rds_file else None)
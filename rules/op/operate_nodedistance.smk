@@ -6,22 +6,74 @@ __author__ = "Benjamin Linard, Nikolai Romashchenko"
 __license__ = "MIT"
 
 import os
+import re
 import pewo.config as cfg
-from pewo.software import PlacementSoftware
+from pewo.accuracy.nodedistance import build_distances, write_partial_results, merge_results, \
+    get_placement_jobs, score_placement_table
+from pewo.templates import get_node_distance_template, get_placement_table
 
 _working_dir = cfg.get_work_dir(config)
 
+# Every .jplace file gets its own partial result, so that adding new software parameters
+# to an existing working directory does not recompute the results of existing placements.
+_nodedistance_jobs = dict((os.path.splitext(job.jplace)[0] + ".nd.csv", job)
+                          for job in get_placement_jobs(config))
+
+
+rule compute_distance_matrix:
+    """
+    Computes node distances between all branches of a pruned tree
+    and finds the expected placement of the pruned subtree.
+    """
+    input:
+        original_tree=config["dataset_tree"],
+        pruned_tree=os.path.join(_working_dir, "T", "{pruning}.tree")
+    output:
+        get_node_distance_template(config)
+    run:
+        build_distances(input.original_tree, input.pruned_tree, output[0])
+
 
 rule compute_nodedistance:
+    """
+    Computes node distances for all queries of a .jplace file.
+    """
+    input:
+        jplace=lambda wildcards: _nodedistance_jobs[wildcards.prefix + ".nd.csv"].jplace,
+        distances=lambda wildcards: _nodedistance_jobs[wildcards.prefix + ".nd.csv"].distances
+    output:
+        "{prefix}.nd.csv"
+    wildcard_constraints:
+        prefix=re.escape(_working_dir) + ".+"
+    run:
+        write_partial_results(_nodedistance_jobs[output[0]], output[0])
+
+
+rule merge_nodedistance:
+    """
+    Merges node distances of all .jplace files in a single table.
+    """
     input:
-        jplace_files=get_jplace_outputs(config)
+        csv_files=list(_nodedistance_jobs)
     output:
         os.path.join(_working_dir, "results.csv")
-    log:
-        os.path.join(_working_dir, "logs", "compute_nd.log")
-    params:
-          workdir=_working_dir,
-          software_dir_list=','.join(PlacementSoftware.get_by_value(soft_str).value.upper() for soft_str in config["test_soft"]),
-          jar=config["pewo_jar"]
-    shell:
-         "java -cp {params.jar} DistanceGenerator_LITE2 {params.workdir} {params.software_dir_list} &> {log}"
+    run:
+        merge_results(input.csv_files, output[0])
+
+
+# With the placement table, all placements are scored in one job scanning the table,
+# instead of one job parsing every .jplace file
+if cfg.builds_placement_table(config):
+    rule score_placement_table:
+        """
+        Computes node distances for all queries of the placement table.
+        """
+        input:
+            table=get_placement_table(config),
+            distances=sorted(set(job.distances for job in _nodedistance_jobs.values()))
+        output:
+            os.path.join(_working_dir, "results.csv")
+        run:
+            score_placement_table(list(_nodedistance_jobs.values()), input.table, output[0])
+
+    ruleorder: score_placement_table > merge_nodedistance
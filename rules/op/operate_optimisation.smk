@@ -9,8 +9,27 @@ __license__ = "MIT"
 # TODO: add model/parameters selection in the config file, this config needs to be propagated to all placement software
 
 import os
+import time
+from pewo.cache import get_cache, make_key
+from pewo.templates import get_optimisation_record_template
+
+
+def _write_optimisation_record(output_file: str, pruning: str, cache_hit: bool, seconds_saved: float) -> None:
+    """
+    Records whether an optimised tree was restored from the shared cache,
+    and the optimisation time it saved. Records are read by the resources report.
+    """
+    with open(output_file, "w") as f_out:
+        print("pruning\tcache_hit\ts_saved", file=f_out)
+        print(f"{pruning}\t{int(cache_hit)}\t{seconds_saved:.4f}", file=f_out)
+
 
 rule optimise:
+    """
+    Optimises branch lengths and model parameters of a pruned tree.
+    Results are restored from the shared cache if the same alignment and tree
+    were already optimised with the same model.
+    """
     input:
         a=config["workdir"]+"/A/{pruning}.align",
         t=config["workdir"]+"/T/{pruning}.tree"
@@ -18,7 +37,8 @@ rule optimise:
         temp(config["workdir"]+"/T/RAxML_binaryModelParameters.{pruning}"),
         temp(config["workdir"]+"/T/RAxML_log.{pruning}"),
         config["workdir"]+"/T/{pruning}_optimised.tree",
-        config["workdir"]+"/T/{pruning}_optimised.info"
+        config["workdir"]+"/T/{pruning}_optimised.info",
+        record=get_optimisation_record_template(config)
     log:
         config["workdir"]+"/logs/optimisation/{pruning}.log"
     params:
@@ -31,10 +51,26 @@ rule optimise:
         outinfoname=config["workdir"]+"/T/{pruning}_optimised.info",
         reduction=config["workdir"]+"/A/{pruning}.align.reduced",
         outdir= os.path.join(config["workdir"],"T")
-    shell:
-        """
-        raxmlHPC-SSE3 -f e -w {params.outdir} -m {params.m} -c {params.c} -s {input.a} -t {input.t} -n {params.name} &> {log}
-        mv {params.raxmlname} {params.outname}
-        mv {params.raxmlinfoname} {params.outinfoname}
-        rm -f {params.reduction}
-        """
\ No newline at end of file
+    run:
+        # the optimisation is not measured in the resources mode, so the cache is always used
+        cache = get_cache(config, measured=False)
+        cache_key = make_key("optimise", [input.a, input.t], m=params.m, c=params.c) if cache else None
+        # the record is written by every run, it is not cached
+        cached_files = [f for f in output if f != output.record]
+
+        if cache and cache.restore(cache_key, cached_files):
+            _write_optimisation_record(output.record, wildcards.pruning, True,
+                                       float(cache.get_metadata(cache_key).get("s", 0.0)))
+        else:
+            start = time.perf_counter()
+            shell(
+                """
+                raxmlHPC-SSE3 -f e -w {params.outdir} -m {params.m} -c {params.c} -s {input.a} -t {input.t} -n {params.name} &> {log}
+                mv {params.raxmlname} {params.outname}
+                mv {params.raxmlinfoname} {params.outinfoname}
+                rm -f {params.reduction}
+                """
+            )
+            if cache:
+                cache.store(cache_key, cached_files, {"s": f"{time.perf_counter() - start:.4f}"})
+            _write_optimisation_record(output.record, wildcards.pruning, False, 0.0)
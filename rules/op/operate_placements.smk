@@ -0,0 +1,27 @@
+"""
+This module consolidates the placements of all .jplace files in a single table
+"""
+
+__author__ = "Nikolai Romashchenko"
+__license__ = "MIT"
+
+
+import pewo.config as cfg
+from pewo.accuracy.nodedistance import get_placement_jobs, get_placement_keys
+from pewo.io.placements import write_placement_table
+from pewo.templates import get_placement_table
+
+
+_placement_table_jobs = get_placement_jobs(config)
+
+
+rule build_placement_table:
+    """
+    Reads every .jplace file once and writes their placements in a single table.
+    """
+    input:
+        jplace=[job.jplace for job in _placement_table_jobs]
+    output:
+        get_placement_table(config)
+    run:
+        write_placement_table([(get_placement_keys(job), job.jplace) for job in _placement_table_jobs], output[0])
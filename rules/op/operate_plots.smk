@@ -6,8 +6,12 @@ __author__ = "Benjamin Linard, Nikolai Romashchenko"
 __license__ = "MIT"
 
 
+import glob
 import os
 import pewo.config as cfg
+from pewo.resources.harness import write_stats
+from pewo.resources.prediction import write_history
+from pewo.resources.sampler import write_phases
 
 _working_dir = cfg.get_work_dir(config)
 
@@ -34,15 +38,71 @@ rule plot_resources_results:
     Makes plots for the resources workflow.
     """
     input:
-        tsv=get_resources_tsv(config)
+        tsv=get_resources_tsv(config),
+        records=get_optimisation_records()
     output:
-        plots=get_resources_outputs()
+        plots=get_resources_outputs(),
+        cache=get_optimisation_cache_outputs()
     log:
        os.path.join(_working_dir, "logs", "R", "resources_plots.log")
     params:
         workdir=_working_dir
     shell:
-        "Rscript --vanilla scripts/R/eval_resources_plots.R {params.workdir} &> {log}"
+        "Rscript --vanilla scripts/R/eval_resources_plots.R {params.workdir} {input.records} &> {log}"
+
+
+rule resources_stats:
+    """
+    Summarizes the runs of every benchmark of the resources workflow.
+    """
+    input:
+        get_resources_tsv(config)
+    output:
+        get_resources_stats()
+    run:
+        write_stats(config, input, output[0])
+
+
+rule resources_history:
+    """
+    Records the measurements of the resources workflow with the features of jobs,
+    which are used to predict resources of later runs.
+    """
+    input:
+        get_resources_tsv(config)
+    output:
+        get_resources_history()
+    run:
+        write_history(config, glob.glob(os.path.join(_working_dir, "benchmarks", "*_benchmark.tsv")), output[0])
+
+
+if cfg.get_sampling_interval(config):
+    rule sampling_phases:
+        """
+        Summarizes the time spent in each phase of sampled jobs.
+        """
+        input:
+            get_resources_tsv(config)
+        output:
+            get_sampling_outputs()[0]
+        run:
+            write_phases(glob.glob(os.path.join(_working_dir, "benchmarks", "*_samples.tsv")), output[0])
+
+
+    rule plot_sampling_results:
+        """
+        Plots memory over time of sampled jobs, and their phases.
+        """
+        input:
+            get_sampling_outputs()[0]
+        output:
+            get_sampling_outputs()[1:]
+        log:
+            os.path.join(_working_dir, "logs", "R", "sampling_plots.log")
+        params:
+            workdir=_working_dir
+        shell:
+            "Rscript --vanilla scripts/R/eval_sampling_plots.R {params.workdir} &> {log}"
 
 
 rule plot_likelihood_results:
@@ -50,7 +110,7 @@ rule plot_likelihood_results:
     Makes plots for the likelihood workflow.
     """
     input:
-        csv=os.path.join(_working_dir, "likelihood.csv")
+        csv=os.path.join(_working_dir, "likelihood.rds" if cfg.writes_likelihood_rds(config) else "likelihood.csv")
     output:
         plots=get_likelihood_plots()
     log:
@@ -58,4 +118,20 @@ rule plot_likelihood_results:
     params:
         workdir=_working_dir
     shell:
-        "Rscript --vanilla scripts/R/eval_likelihood_plots.R {input.csv} {params.workdir} &> {log}"
\ No newline at end of file
+        "Rscript --vanilla scripts/R/eval_likelihood_plots.R {input.csv} {params.workdir} &> {log}"
+
+
+rule plot_scaling_results:
+    """
+    Makes plots for the scaling workflow.
+    """
+    input:
+        tsv=os.path.join(_working_dir, "scaling.tsv")
+    output:
+        plots=get_scaling_plots()
+    log:
+        os.path.join(_working_dir, "logs", "R", "scaling_plots.log")
+    params:
+        workdir=_working_dir
+    shell:
+        "Rscript --vanilla scripts/R/eval_scaling_plots.R {input.tsv} {params.workdir} &> {log}"
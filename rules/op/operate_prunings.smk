@@ -10,6 +10,7 @@ __license__ = "MIT"
 import os
 import pewo.config as cfg
 from typing import Dict
+from pewo.pruning import generate_pruning
 
 
 _work_dir = cfg.get_work_dir(config)
@@ -22,63 +23,58 @@ def get_input_reads():
     return config["dataset_reads"] if "dataset_reads" in config else []
 
 
-def get_pruning_output_read_files():
-    """
-    Creates a list of output read files.
-    """
-    output_directory = os.path.join(_work_dir, "R")
-
-    return [os.path.join(output_directory, "{0}_r{1}.fasta".format(pruning, length))
-            for pruning in range(config["pruning_count"])
-            for length in config["read_length"]]
-
-
 def _generate_reads(config: Dict) -> bool:
     return cfg.get_mode(config) == cfg.Mode.ACCURACY
 
 
-def get_params_length():
-    """
-    Creates {params.length} parameter.
-    """
-    return str(config["read_length"]).replace("[","").replace("]","").replace(" ","")
-
-
-rule operate_pruning:
-    """
-    Runs PrunedTreeGenerator to creates prunings.
-    """
-    input:
-        a = config["dataset_align"],
-        t = config["dataset_tree"],
-        r = get_input_reads()
-    output:
-        a = expand(config["workdir"] + "/A/{pruning}.align", pruning=range(config["pruning_count"])),
-        t = expand(config["workdir"] + "/T/{pruning}.tree", pruning=range(config["pruning_count"])),
-        g = expand(config["workdir"] + "/G/{pruning}.fasta", pruning=range(config["pruning_count"])),
-        r = get_pruning_output_read_files() if _generate_reads(config) else []
-    log:
-        config["workdir"] + "/logs/operate_pruning.log"
-    params:
-        wd = config["workdir"],
-        pruning_count = config["pruning_count"],
-        states = config["states"],
-        jar = config["pewo_jar"],
-        length = get_params_length()
-        #length_sd=config["read_length_sd"],
-        #bpe=config["bpe"],
-    run:
-        if _generate_reads(config):
-            shell(
-                "java -cp {params.jar} PrunedTreeGenerator_LITE "
-                "{params.wd} {input.a} {input.t} "
-                "{params.pruning_count} {params.length} 0 1 {params.states} "
-                "&> {log}"
-            )
-        else:
-            shell(
-                "mkdir -p {params.wd}/A {params.wd}/T {params.wd}/G {params.wd}/R;"
-                "cp {input.a} {params.wd}/A/0.align;"
-                "cp {input.t} {params.wd}/T/0.tree;"
-                "touch {params.wd}/G/0.fasta;"
-            )
\ No newline at end of file
+if _generate_reads(config):
+    rule operate_pruning:
+        """
+        Generates a pruning: the pruned alignment and tree, the pruned leaves
+        and reads simulated from them. Every pruning is a separate job.
+        """
+        input:
+            a = config["dataset_align"],
+            t = config["dataset_tree"]
+        output:
+            a = config["workdir"] + "/A/{pruning}.align",
+            t = config["workdir"] + "/T/{pruning}.tree",
+            g = config["workdir"] + "/G/{pruning}.fasta",
+            r = expand(config["workdir"] + "/R/{{pruning}}_r{length}.fasta", length=config["read_length"])
+        wildcard_constraints:
+            pruning = r"\d+"
+        log:
+            config["workdir"] + "/logs/operate_pruning/{pruning}.log"
+        params:
+            seed = cfg.get_pruning_seed(config)
+            #length_sd=config["read_length_sd"],
+            #bpe=config["bpe"],
+        run:
+            pruned_leaves = generate_pruning(input.a, input.t, int(wildcards.pruning),
+                                             output.a, output.t, output.g,
+                                             dict(zip(config["read_length"], output.r)),
+                                             params.seed)
+            with open(log[0], "w") as f_log:
+                print(f"Pruned leaves: {' '.join(pruned_leaves)}", file=f_log)
+else:
+    rule operate_pruning:
+        """
+        Copies the input alignment and tree as a single pruning.
+        """
+        input:
+            a = config["dataset_align"],
+            t = config["dataset_tree"],
+            r = get_input_reads()
+        output:
+            a = config["workdir"] + "/A/0.align",
+            t = config["workdir"] + "/T/0.tree",
+            g = config["workdir"] + "/G/0.fasta"
+        log:
+            config["workdir"] + "/logs/operate_pruning.log"
+        params:
+            wd = config["workdir"]
+        shell:
+            "mkdir -p {params.wd}/A {params.wd}/T {params.wd}/G {params.wd}/R;"
+            "cp {input.a} {params.wd}/A/0.align;"
+            "cp {input.t} {params.wd}/T/0.tree;"
+            "touch {params.wd}/G/0.fasta;"
@@ -0,0 +1,339 @@
+"""
+This module measures how tools scale with the number of threads.
+
+Every multi-threaded tool of test_soft is run once per thread count of
+config["scaling_threads"], with the first value of every software parameter.
+All runs of a tool take the same inputs: the alignments, pplacer packages,
+extended trees and IPK databases are computed once by the usual rules.
+RAPPAS placement, IPK and APP-SPAM are single-threaded and are not measured.
+"""
+
+__author__ = "Nikolai Romashchenko"
+__license__ = "MIT"
+
+
+import os
+from typing import Any, Dict, List
+from snakemake.io import expand
+import pewo.config as cfg
+from pewo.software import PlacementSoftware, AlignmentSoftware
+from pewo.templates import get_software_dir
+from pewo.resources.scaling import ScalingJob, write_scaling
+
+
+_working_dir = cfg.get_work_dir(config)
+_scaling_dir = os.path.join(_working_dir, "scaling")
+_alignment_dir = get_software_dir(config, AlignmentSoftware.HMMER)
+
+# Inputs of the resources mode: the full tree and the user queries
+_scaling_query = os.path.join(_alignment_dir, "0", "0_r0")
+
+_ALIGNMENT_BASED_SOFTWARE = ("epa", "epang", "pplacer", "apples")
+
+
+def get_scaling_tools(config: Dict) -> List[str]:
+    """
+    Returns the tools measured in the scaling mode.
+    """
+    tools = []
+    if any(software in config["test_soft"] for software in _ALIGNMENT_BASED_SOFTWARE):
+        tools.append("hmmalign")
+    tools.extend(software for software in _ALIGNMENT_BASED_SOFTWARE if software in config["test_soft"])
+    # the ancestral reconstruction is multi-threaded with raxml-ng only
+    if "rappas" in config["test_soft"] or "epik" in config["test_soft"]:
+        tools.append("ar")
+    if "epik" in config["test_soft"]:
+        tools.append("epik")
+    return tools
+
+
+def get_scaling_benchmark_template(tool: str) -> str:
+    return os.path.join(_scaling_dir, "benchmarks", tool + "_threads{threads}_benchmark.tsv")
+
+
+def get_scaling_benchmarks(config: Dict) -> List[str]:
+    """
+    Returns benchmark files of every tool and thread count measured.
+    """
+    return [get_scaling_benchmark_template(tool).format(threads=threads)
+            for tool in get_scaling_tools(config)
+            for threads in cfg.get_scaling_threads(config)]
+
+
+def _get_scaling_output_dir(tool: str) -> str:
+    return os.path.join(_scaling_dir, tool, "threads{threads}")
+
+
+def _get_scaling_threads(wildcards) -> int:
+    return int(wildcards.threads)
+
+
+def _check_scaling_threads(wildcards, threads: int) -> None:
+    # snakemake lowers the number of threads of a job to the --cores value
+    if threads != int(wildcards.threads):
+        raise RuntimeError(f"A job of {wildcards.threads} threads got {threads} threads. "
+                           f"Run the scaling workflow with --cores {max(cfg.get_scaling_threads(config))} or more.")
+
+
+def _first(value: Any) -> Any:
+    """
+    Returns the first value of a parameter, which can be set as a list or as a single value.
+    """
+    return value[0] if isinstance(value, list) else value
+
+
+def _get_ar_reduction() -> float:
+    software_config = config["config_rappas"] if "rappas" in config["test_soft"] else config["config_epik"]
+    return _first(software_config["reduction"])
+
+
+def _get_epang_heuristic_option() -> str:
+    heuristic = config["config_epang"]["heuristics"][0]
+    if heuristic == "h1":
+        return "-g " + str(config["config_epang"]["h1"]["g"][0])
+    elif heuristic == "h2":
+        return "-G " + str(config["config_epang"]["h2"]["G"][0])
+    elif heuristic == "h3":
+        return "--baseball-heur"
+    return "--no-heur"
+
+
+def _get_ipk_database() -> str:
+    return expand(get_ipk_output_templates(config),
+                  pruning="0",
+                  red=_first(config["config_epik"]["reduction"]),
+                  ar=_first(config["config_epik"]["arsoft"]),
+                  k=_first(config["config_epik"]["k"]))[0]
+
+
+rule scaling_hmmalign:
+    """
+    Aligns the queries with a number of hmmalign processes.
+    """
+    input:
+        hmm = os.path.join(_alignment_dir, "0.hmm"),
+        alignment = os.path.join(_working_dir, "A", "0.align"),
+        query = os.path.join(_working_dir, "R", "0_r0.fasta")
+    output:
+        psiblast = os.path.join(_get_scaling_output_dir("hmmalign"), "0_r0.psiblast")
+    log:
+        os.path.join(_working_dir, "logs", "scaling", "hmmalign_threads{threads}.log")
+    benchmark:
+        repeat(get_scaling_benchmark_template("hmmalign"), config["repeats"])
+    params:
+        states = ["dna"] if config["states"] == 0 else ["amino"]
+    threads: _get_scaling_threads
+    resources:
+        scaling_jobs = 1,
+        mem_mb = cfg.get_mem_mb(config, "hmmalign")
+    run:
+        _check_scaling_threads(wildcards, threads)
+        shell("scripts/shell/hmmalign_parallel.sh {params.states} {threads} {input.hmm} {input.alignment} "
+              "{input.query} {output.psiblast} &> {log}")
+
+
+rule scaling_epa:
+    """
+    Runs EPA with a number of threads.
+    """
+    input:
+        hmm = _scaling_query + ".fasta",
+        t = os.path.join(_working_dir, "T", "0.tree")
+    output:
+        jplace = os.path.join(_get_scaling_output_dir("epa"), "RAxML_portableTree.scaling.jplace")
+    log:
+        os.path.join(_working_dir, "logs", "scaling", "epa_threads{threads}.log")
+    benchmark:
+        repeat(get_scaling_benchmark_template("epa"), config["repeats"])
+    params:
+        m = select_model_raxmlstyle(),
+        c = config["phylo_params"]["categories"],
+        g = config["config_epa"]["G"][0],
+        outdir = _get_scaling_output_dir("epa"),
+        reduction = _scaling_query + ".fasta.reduced",
+        maxp = config["maxplacements"],
+        minlwr = config["minlwr"],
+        # the sequential RAxML binary does not support -T
+        raxml = lambda wildcards, threads: "raxmlHPC-SSE3" if threads == 1 else f"raxmlHPC-PTHREADS-SSE3 -T {threads}"
+    threads: _get_scaling_threads
+    resources:
+        scaling_jobs = 1,
+        mem_mb = cfg.get_mem_mb(config, "epa")
+    run:
+        _check_scaling_threads(wildcards, threads)
+        shell(
+            """
+            rm -f {params.outdir}/RAxML_info.scaling
+            {params.raxml} -f v --epa-keep-placements={params.maxp} --epa-prob-threshold={params.minlwr} -w {params.outdir} -G {params.g} -m {params.m} -c {params.c} -n scaling -s {input.hmm} -t {input.t} &> {log}
+            rm -f {params.reduction}
+            """
+        )
+
+
+rule scaling_epang:
+    """
+    Runs EPA-ng with a number of threads, with the first heuristic of the config file.
+    """
+    input:
+        r = _scaling_query + ".fasta_refs",
+        q = _scaling_query + ".fasta_queries",
+        t = os.path.join(_working_dir, "T", "0.tree"),
+        m = os.path.join(_working_dir, "T", "0_optimised.info")
+    output:
+        jplace = os.path.join(_get_scaling_output_dir("epang"), "epa_result.jplace")
+    log:
+        os.path.join(_working_dir, "logs", "scaling", "epang_threads{threads}.log")
+    benchmark:
+        repeat(get_scaling_benchmark_template("epang"), config["repeats"])
+    params:
+        outdir = _get_scaling_output_dir("epang"),
+        premask = "--no-pre-mask" if config["config_epang"]["premask"] == 0 else "",
+        heuristic = _get_epang_heuristic_option(),
+        maxp = config["maxplacements"],
+        minlwr = config["minlwr"]
+    threads: _get_scaling_threads
+    resources:
+        scaling_jobs = 1,
+        mem_mb = cfg.get_mem_mb(config, "epang")
+    run:
+        _check_scaling_threads(wildcards, threads)
+        shell("epa-ng --redo {params.premask} --preserve-rooting on --filter-max {params.maxp} "
+              "--filter-min-lwr {params.minlwr} {params.heuristic} --verbose -w {params.outdir} "
+              "-q {input.q} -t {input.t} --ref-msa {input.r} -T {threads} -m {input.m} &> {log}")
+
+
+rule scaling_pplacer:
+    """
+    Runs pplacer with a number of threads.
+    """
+    input:
+        alignment = _scaling_query + ".fasta",
+        pkg = expand(_get_pplacer_refpkg_template(config), pruning="0")
+    output:
+        jplace = os.path.join(_get_scaling_output_dir("pplacer"), "0_r0.jplace")
+    log:
+        os.path.join(_working_dir, "logs", "scaling", "pplacer_threads{threads}.log")
+    benchmark:
+        repeat(get_scaling_benchmark_template("pplacer"), config["repeats"])
+    params:
+        ms = config["config_pplacer"]["max-strikes"][0],
+        sb = config["config_pplacer"]["strike-box"][0],
+        mp = config["config_pplacer"]["max-pitches"][0],
+        premask = "" if config["config_pplacer"]["premask"] else "--no-pre-mask",
+        maxp = config["maxplacements"],
+        minlwr = config["minlwr"]
+    threads: _get_scaling_threads
+    resources:
+        scaling_jobs = 1,
+        mem_mb = cfg.get_mem_mb(config, "pplacer")
+    run:
+        _check_scaling_threads(wildcards, threads)
+        shell("pplacer -o {output.jplace} --verbosity 1 --max-strikes {params.ms} --strike-box {params.sb} "
+              "--max-pitches {params.mp} --keep-at-most {params.maxp} --keep-factor {params.minlwr} "
+              "-j {threads} {params.premask} -c {input.pkg} {input.alignment} &> {log}")
+
+
+rule scaling_apples:
+    """
+    Runs APPLES with a number of threads.
+    """
+    input:
+        r = _scaling_query + ".fasta_refs",
+        q = _scaling_query + ".fasta_queries",
+        t = os.path.join(_working_dir, "T", "0.tree")
+    output:
+        jplace = os.path.join(_get_scaling_output_dir("apples"), "0_r0.jplace")
+    log:
+        os.path.join(_working_dir, "logs", "scaling", "apples_threads{threads}.log")
+    benchmark:
+        repeat(get_scaling_benchmark_template("apples"), config["repeats"])
+    params:
+        meth = config["config_apples"]["methods"][0],
+        crit = config["config_apples"]["criteria"][0],
+        protein = "-p" if config["states"] == 1 else ""
+    threads: _get_scaling_threads
+    resources:
+        scaling_jobs = 1,
+        mem_mb = cfg.get_mem_mb(config, "apples")
+    run:
+        _check_scaling_threads(wildcards, threads)
+        shell("run_apples.py -s {input.r} -q {input.q} -t {input.t} -T {threads} -m {params.meth} "
+              "-c {params.crit} -o {output.jplace} {params.protein} &> {log}")
+
+
+rule scaling_ar:
+    """
+    Runs the ancestral reconstruction with raxml-ng and a number of threads,
+    on the extended tree of the first reduction ratio.
+    """
+    input:
+        a = os.path.join(_working_dir, "RAPPAS", "0", f"red{_get_ar_reduction()}_arRAXMLNG",
+                         "extended_trees", "extended_align.phylip"),
+        t = os.path.join(_working_dir, "RAPPAS", "0", f"red{_get_ar_reduction()}_arRAXMLNG",
+                         "extended_trees", "extended_tree_withBL_withoutInterLabels.tree"),
+        s = os.path.join(_working_dir, "T", "0_optimised.info")
+    output:
+        os.path.join(_get_scaling_output_dir("ar"), "ar.raxml.ancestralStates")
+    log:
+        os.path.join(_working_dir, "logs", "scaling", "ar_threads{threads}.log")
+    benchmark:
+        repeat(get_scaling_benchmark_template("ar"), config["repeats"])
+    params:
+        prefix = os.path.join(_get_scaling_output_dir("ar"), "ar")
+    threads: _get_scaling_threads
+    resources:
+        scaling_jobs = 1,
+        mem_mb = cfg.get_mem_mb(config, "ar")
+    run:
+        _check_scaling_threads(wildcards, threads)
+        phylo_params = extract_params(input.s)
+        states = "DNA" if config["states"] == 0 else "AA"
+        model = select_model_phymlstyle() + "+G" + str(config["phylo_params"]["categories"]) + \
+                "{{" + str(phylo_params['alpha']) + "}}+IU{{0}}+FC"
+        shell(get_ar_binary(config, "RAXMLNG") + " --ancestral --redo --precision 9 --seed 1 --force msa "
+              "--data-type " + states + " --threads {threads} --prefix {params.prefix} "
+              "--msa {input.a} --tree {input.t} --model " + model + " "
+              "--blopt nr_safe --opt-model on --opt-branches off &> {log}")
+
+
+rule scaling_epik:
+    """
+    Runs EPIK with a number of threads, on the IPK database of the first parameter values.
+    """
+    input:
+        database = _get_ipk_database() if "epik" in config["test_soft"] else [],
+        r = os.path.join(_working_dir, "R", "0_r0.fasta")
+    output:
+        jplace = os.path.join(_get_scaling_output_dir("epik"), "placements_0_r0.fasta.jplace")
+    log:
+        os.path.join(_working_dir, "logs", "scaling", "epik_threads{threads}.log")
+    benchmark:
+        repeat(get_scaling_benchmark_template("epik"), config["repeats"])
+    params:
+        states = ["nucl"] if config["states"] == 0 else ["amino"],
+        outdir = _get_scaling_output_dir("epik"),
+        mu = _first(config["config_epik"]["mu"]) if "epik" in config["test_soft"] else "",
+        o = _first(config["config_epik"]["omega"]) if "epik" in config["test_soft"] else ""
+    threads: _get_scaling_threads
+    resources:
+        scaling_jobs = 1,
+        mem_mb = cfg.get_mem_mb(config, "epik")
+    run:
+        _check_scaling_threads(wildcards, threads)
+        shell("epik.py place --states {params.states} -i {input.database} -o {params.outdir} "
+              "--mu {params.mu} --omega {params.o} --threads {threads} {input.r} &> {log}")
+
+
+rule scaling_table:
+    """
+    Computes the speedup and the parallel efficiency of every tool.
+    """
+    input:
+        get_scaling_benchmarks(config)
+    output:
+        os.path.join(_working_dir, "scaling.tsv")
+    run:
+        jobs = [ScalingJob(tool, threads, get_scaling_benchmark_template(tool).format(threads=threads))
+                for tool in get_scaling_tools(config)
+                for threads in cfg.get_scaling_threads(config)]
+        write_scaling(jobs, output[0])
@@ -0,0 +1,133 @@
+"""
+This module reports how placement tools scale with the number of queries.
+
+The read length wildcard of the resources mode holds the query count:
+R/0_r{count}.fasta is a subsample of count user queries. Databases, hmm profiles
+and reference packages do not depend on queries and are built once per parameter
+combination, while placements are done for every query count.
+"""
+
+__author__ = "Nikolai Romashchenko"
+__license__ = "MIT"
+
+
+import itertools
+import os
+from typing import Any, Dict, Iterator, List
+import pewo.config as cfg
+from pewo.software import PlacementSoftware
+from pewo.resources.volume import VolumeConfiguration, write_volume_report
+
+
+_working_dir = cfg.get_work_dir(config)
+
+_ALIGNMENT_FREE_SOFTWARE = (PlacementSoftware.RAPPAS, PlacementSoftware.EPIK, PlacementSoftware.APPSPAM)
+
+
+def get_volume_outputs() -> List[str]:
+    return [os.path.join(_working_dir, "volume.tsv"),
+            os.path.join(_working_dir, "volume_summary.tsv"),
+            os.path.join(_working_dir, "volume_break_even.tsv")]
+
+
+def _iter_parameters(template_args: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """
+    Yields every combination of software parameter values. Query-related arguments are skipped.
+    """
+    names = [name for name in template_args if name not in ("pruning", "length", "software")]
+    values = [template_args[name] if isinstance(template_args[name], (list, tuple, range)) else [template_args[name]]
+              for name in names]
+    for combination in itertools.product(*values):
+        yield dict(zip(names, combination))
+
+
+def _get_software_stages(software: PlacementSoftware, heuristic: str = None):
+    """
+    Returns the benchmark templates of the build and placement stages of a software,
+    and its template arguments. The alignment of queries, and the epa-ng binary of
+    the reference alignment of queries, are placement stages.
+    """
+    if software == PlacementSoftware.RAPPAS:
+        return ([lambda p: get_ar_benchmark_template(p["ar"]), rappas_benchmark_templates[0]],
+                [rappas_benchmark_templates[1]],
+                rappas_benchmark_template_args[1])
+    elif software == PlacementSoftware.EPIK:
+        return ([lambda p: get_ar_benchmark_template(p["ar"]), epik_benchmark_templates[0]],
+                [epik_benchmark_templates[1]],
+                epik_benchmark_template_args[1])
+    elif software == PlacementSoftware.APPSPAM:
+        return [], appspam_benchmark_templates, appspam_benchmark_template_args[0]
+    elif software == PlacementSoftware.EPA:
+        return (hmmer_build_benchmark_templates,
+                hmmer_benchmark_templates + epa_benchmark_templates,
+                epa_benchmark_template_args[0])
+    elif software == PlacementSoftware.EPANG:
+        h_index = ["h1", "h2", "h3", "h4"].index(heuristic)
+        return (hmmer_build_benchmark_templates,
+                hmmer_benchmark_templates + epang_binary_benchmark_templates + [epang_benchmark_templates[h_index]],
+                epang_benchmark_template_args[h_index])
+    elif software == PlacementSoftware.PPLACER:
+        return (hmmer_build_benchmark_templates + pplacer_build_benchmark_templates,
+                hmmer_benchmark_templates + pplacer_benchmark_templates,
+                pplacer_benchmark_template_args[0])
+    elif software == PlacementSoftware.APPLES:
+        return (hmmer_build_benchmark_templates,
+                hmmer_benchmark_templates + apples_benchmark_templates,
+                apples_benchmark_template_args[0])
+    raise RuntimeError("Unsupported software: " + software.value)
+
+
+def _format_template(template, parameters: Dict[str, Any], **kwargs) -> str:
+    if callable(template):
+        template = template(parameters)
+    return template.format(pruning="0", **parameters, **kwargs)
+
+
+def get_volume_configurations(config: Dict) -> List[VolumeConfiguration]:
+    """
+    Returns benchmark files of every tested software and parameter combination.
+    """
+    configurations = []
+    for software_name in config["test_soft"]:
+        software = PlacementSoftware.get_by_value(software_name)
+        heuristics = config["config_epang"]["heuristics"] if software == PlacementSoftware.EPANG else [None]
+        for heuristic in heuristics:
+            build_templates, placement_templates, template_args = _get_software_stages(software, heuristic)
+            for parameters in _iter_parameters(template_args):
+                configurations.append(VolumeConfiguration(
+                    software=software_name + (f"-{heuristic}" if heuristic else ""),
+                    configuration="_".join(f"{name}{value}" for name, value in parameters.items()) or "default",
+                    alignment_free=software in _ALIGNMENT_FREE_SOFTWARE,
+                    build=[_format_template(template, parameters) for template in build_templates],
+                    placement={count: [_format_template(template, parameters, length=count)
+                                       for template in placement_templates]
+                               for count in cfg.get_query_counts(config)}
+                ))
+    return configurations
+
+
+def get_volume_benchmarks(config: Dict) -> List[str]:
+    """
+    Returns all benchmark files of the volume mode.
+    """
+    benchmarks = set()
+    for configuration in get_volume_configurations(config):
+        benchmarks.update(configuration.build)
+        benchmarks.update(itertools.chain.from_iterable(configuration.placement.values()))
+    return sorted(benchmarks)
+
+
+rule volume_report:
+    """
+    Reports placement speed and memory for every query count, and the query counts
+    from which database builds are amortized.
+    """
+    input:
+        get_volume_benchmarks(config)
+    output:
+        volume = get_volume_outputs()[0],
+        summary = get_volume_outputs()[1],
+        break_even = get_volume_outputs()[2]
+    run:
+        write_volume_report(get_volume_configurations(config), output.volume, output.summary, output.break_even,
+                            adaptive=cfg.get_adaptive_repeats(config) is not None)
@@ -9,8 +9,11 @@ __license__ = "MIT"
 import os
 import pewo.config as cfg
 from pewo.software import PlacementSoftware, AlignmentSoftware
+from pewo.resources.harness import measured_command
+from pewo.resources.prediction import predicted_mem_mb, predicted_runtime
 from pewo.templates import get_output_template, get_log_template, get_software_dir, \
-    get_common_queryname_template, get_benchmark_template, get_output_template_args
+    get_common_queryname_template, get_benchmark_template, get_output_template_args, \
+    get_query_batch_alignment_template
 
 
 _working_dir = cfg.get_work_dir(config)
@@ -18,7 +21,8 @@ _alignment_dir = get_software_dir(config, AlignmentSoftware.HMMER)
 
 _apples_place_benchmark_template = get_benchmark_template(config, PlacementSoftware.APPLES,
                                                           p="pruning", length="length", meth="meth", crit="crit",
-                                                          rule_name="placement") if cfg.get_mode(config) == cfg.Mode.RESOURCES else ""
+                                                          threads=cfg.get_threads(config, "apples"),
+                                                          rule_name="placement") if cfg.measures_resources(config) else ""
 
 apples_benchmark_templates = [_apples_place_benchmark_template]
 apples_benchmark_template_args = [get_output_template_args(config, PlacementSoftware.APPLES),]
@@ -26,6 +30,9 @@ apples_benchmark_template_args = [get_output_template_args(config, PlacementSoft
 
 # FIXME: These are the same methods as in the epang.smk
 def _get_apples_input_reads(config) -> str:
+    # reference sequences are shared by all queries aligned together
+    if cfg.aligns_queries_together(config):
+        return get_query_batch_alignment_template(config) + ".fasta_refs"
     return os.path.join(_alignment_dir, "{pruning}", get_common_queryname_template(config) + ".fasta_refs")
 
 def _get_apples_input_queries(config) -> str:
@@ -48,14 +55,18 @@ rule placement_apples:
     log:
         get_log_template(config, PlacementSoftware.APPLES)
 
+    threads: cfg.get_threads(config, "apples")
+    resources:
+        mem_mb = predicted_mem_mb(config, "apples", "apples-placement"),
+        runtime = predicted_runtime(config, "apples-placement")
     run:
-        command = "run_apples.py -s {input.r} -q {input.q} -t {input.t} -T 1 -m {wildcards.meth} -c {wildcards.crit} -o {output.jplace} "
+        command = "run_apples.py -s {input.r} -q {input.q} -t {input.t} -T {threads} -m {wildcards.meth} -c {wildcards.crit} -o {output.jplace} "
         if params.is_protein:
             command += "-p "
-        shell(command)
+        shell(measured_command(config, command, _apples_place_benchmark_template))
 
         
-if cfg.get_mode(config) == cfg.Mode.RESOURCES:
+if cfg.measures_resources(config):
     rule placement_apples:
         benchmark:
-            repeat(_apples_place_benchmark_template, config["repeats"])
\ No newline at end of file
+            repeat(_apples_place_benchmark_template, cfg.get_repeats(config))
\ No newline at end of file
@@ -9,13 +9,15 @@ import os
 from typing import List
 import pewo.config as cfg
 from pewo.software import PlacementSoftware, AlignmentSoftware
+from pewo.resources.harness import measured_command
+from pewo.resources.prediction import predicted_mem_mb, predicted_runtime
 from pewo.templates import get_output_template, get_log_template, get_software_dir, \
     get_common_queryname_template, get_benchmark_template, get_output_template_args
 
 _working_dir = cfg.get_work_dir(config)
 _appspam_place_benchmark_template = get_benchmark_template(config, PlacementSoftware.APPSPAM,
                                                           p="pruning", length="length", mode="mode", w="w", pattern="pattern",
-                                                          rule_name="placement") if cfg.get_mode(config) == cfg.Mode.RESOURCES else ""
+                                                          rule_name="placement") if cfg.measures_resources(config) else ""
 
 appspam_benchmark_templates = [_appspam_place_benchmark_template]
 appspam_benchmark_template_args = [get_output_template_args(config, PlacementSoftware.APPSPAM),]
@@ -39,12 +41,16 @@ rule placement_appspam:
     log:
         get_log_template(config, PlacementSoftware.APPSPAM)
 
+    resources:
+        mem_mb = predicted_mem_mb(config, "appspam", "appspam-placement"),
+        runtime = predicted_runtime(config, "appspam-placement")
     shell:
-        """
-        appspam -s {input.s} -q {input.q} -t {input.t} -m {wildcards.mode} -w {wildcards.w} -p {wildcards.pattern} -o {output.jplace} >& {log}
-        """
+        measured_command(config,
+                         "appspam -s {input.s} -q {input.q} -t {input.t} -m {wildcards.mode} -w {wildcards.w} "
+                         "-p {wildcards.pattern} -o {output.jplace} >& {log}",
+                         _appspam_place_benchmark_template)
 
-if cfg.get_mode(config) == cfg.Mode.RESOURCES:
+if cfg.measures_resources(config):
     rule placement_appspam:
         benchmark:
-            repeat(_appspam_place_benchmark_template, config["repeats"])
\ No newline at end of file
+            repeat(_appspam_place_benchmark_template, cfg.get_repeats(config))
\ No newline at end of file
@@ -18,6 +18,8 @@ from snakemake.io import Namedlist, temp
 import pewo.config as cfg
 from pewo.software import PlacementSoftware
 from pewo.software import AlignmentSoftware
+from pewo.resources.harness import measured_command
+from pewo.resources.prediction import predicted_mem_mb, predicted_runtime
 from pewo.templates import get_experiment_dir_template, get_output_template, \
     get_log_template, get_queryname_template,  get_common_queryname_template, \
     get_software_dir, get_benchmark_template, get_output_template_args
@@ -31,7 +33,8 @@ _epa_experiment_dir = get_experiment_dir_template(config, PlacementSoftware.EPA)
 _alignment_dir = get_software_dir(config, AlignmentSoftware.HMMER)
 
 _epa_place_benchmark_template = get_benchmark_template(config, PlacementSoftware.EPA,
-                                                       p="pruning", length="length", g="g", rule_name="placement") if cfg.get_mode(config) == cfg.Mode.RESOURCES else ""
+                                                       p="pruning", length="length", g="g",
+                                                       threads=cfg.get_threads(config, "epa"), rule_name="placement") if cfg.measures_resources(config) else ""
 
 epa_benchmark_templates = [_epa_place_benchmark_template]
 epa_benchmark_template_args = [get_output_template_args(config, PlacementSoftware.EPA)]
@@ -98,17 +101,28 @@ rule placement_epa:
                             "RAxML_info." + get_queryname_template(config, PlacementSoftware.EPA)),
         outdir = _epa_experiment_dir,
         maxp = config["maxplacements"],
-        minlwr = config["minlwr"]
+        minlwr = config["minlwr"],
+        # the sequential RAxML binary does not support -T
+        raxml = lambda wildcards, threads: "raxmlHPC-SSE3" if threads == 1 else f"raxmlHPC-PTHREADS-SSE3 -T {threads}"
+    threads: cfg.get_threads(config, "epa")
+    resources:
+        mem_mb = predicted_mem_mb(config, "epa", "epa-placement"),
+        runtime = predicted_runtime(config, "epa-placement")
+    # RAxML refuses to overwrite its info file, which is removed before every run
     shell:
+        measured_command(config,
+                         "rm -f {params.info}; "
+                         "{params.raxml} -f v --epa-keep-placements={params.maxp} --epa-prob-threshold={params.minlwr} "
+                         "-w {params.outdir} -G {wildcards.g} -m {params.m} -c {params.c} -n {params.name} "
+                         "-s {input.hmm} -t {input.t} &> {log}",
+                         _epa_place_benchmark_template) +
         """
-        rm -f {params.info}
-        raxmlHPC-SSE3 -f v --epa-keep-placements={params.maxp} --epa-prob-threshold={params.minlwr} -w {params.outdir} -G {wildcards.g} -m {params.m} -c {params.c} -n {params.name} -s {input.hmm} -t {input.t} &> {log}
         mv {params.raxmlname} {params.outname}
         rm -f {params.reduction}
         """
 
         
-if cfg.get_mode(config) == cfg.Mode.RESOURCES:
+if cfg.measures_resources(config):
     rule placement_epa:
         benchmark:
-            repeat(_epa_place_benchmark_template, config["repeats"])
\ No newline at end of file
+            repeat(_epa_place_benchmark_template, cfg.get_repeats(config))
\ No newline at end of file
@@ -9,10 +9,14 @@ __license__ = "MIT"
 # TODO: Use optimised tree version
 
 import os
+from typing import List
 import pewo.config as cfg
 from pewo.software import PlacementSoftware, AlignmentSoftware
+from pewo.resources.harness import measured_command
+from pewo.resources.prediction import predicted_mem_mb, predicted_runtime
 from pewo.templates import get_output_template, get_log_template, get_software_dir, \
-    get_common_queryname_template, get_experiment_dir_template, get_benchmark_template, get_output_template_args
+    get_common_queryname_template, get_experiment_dir_template, get_benchmark_template, get_output_template_args, \
+    get_query_batch_alignment_template, get_experiment_log_dir_template, get_common_template_args
 
 _working_dir = cfg.get_work_dir(config)
 _epang_soft_dir = get_software_dir(config, PlacementSoftware.EPANG)
@@ -22,16 +26,20 @@ _alignment_dir = get_software_dir(config, AlignmentSoftware.HMMER)
 
 _epang_h1_place_benchmark_template = get_benchmark_template(config, PlacementSoftware.EPANG,
                                                             p="pruning", length="length", g="g", heuristic="h1",
-                                                            rule_name="placement") if cfg.get_mode(config) == cfg.Mode.RESOURCES else ""
+                                                            threads=cfg.get_threads(config, "epang"),
+                                                            rule_name="placement") if cfg.measures_resources(config) else ""
 _epang_h2_place_benchmark_template = get_benchmark_template(config, PlacementSoftware.EPANG,
                                                             p="pruning", length="length", bigg="bigg", heuristic="h2",
-                                                            rule_name="placement") if cfg.get_mode(config) == cfg.Mode.RESOURCES else ""
+                                                            threads=cfg.get_threads(config, "epang"),
+                                                            rule_name="placement") if cfg.measures_resources(config) else ""
 _epang_h3_place_benchmark_template = get_benchmark_template(config, PlacementSoftware.EPANG,
                                                             p="pruning", length="length", heuristic="h3",
-                                                            rule_name="placement") if cfg.get_mode(config) == cfg.Mode.RESOURCES else ""
+                                                            threads=cfg.get_threads(config, "epang"),
+                                                            rule_name="placement") if cfg.measures_resources(config) else ""
 _epang_h4_place_benchmark_template = get_benchmark_template(config, PlacementSoftware.EPANG,
                                                             p="pruning", length="length", heuristic="h4",
-                                                            rule_name="placement") if cfg.get_mode(config) == cfg.Mode.RESOURCES else ""
+                                                            threads=cfg.get_threads(config, "epang"),
+                                                            rule_name="placement") if cfg.measures_resources(config) else ""
 
 epang_benchmark_templates = [
     _epang_h1_place_benchmark_template,
@@ -47,6 +55,15 @@ epang_benchmark_template_args = [
     get_output_template_args(config, PlacementSoftware.EPANG, heuristic="h4")
 ]
 
+# the reference binary is measured apart from placements, as it is shared by them
+_epang_binary_benchmark_template = get_benchmark_template(config, PlacementSoftware.EPANG,
+                                                          p="pruning", length="length",
+                                                          threads=cfg.get_threads(config, "epang"),
+                                                          rule_name="binary") \
+    if cfg.measures_resources(config) and cfg.uses_epang_binary(config) else ""
+epang_binary_benchmark_templates = [_epang_binary_benchmark_template] if _epang_binary_benchmark_template else []
+epang_binary_benchmark_template_args = [get_common_template_args(config)] if _epang_binary_benchmark_template else []
+
 
 def _make_epang_command(**kwargs) -> str:
     """
@@ -71,6 +88,14 @@ def _make_epang_command(**kwargs) -> str:
     else:
         heuristic_option = "--no-heur "
 
+    # the reference is loaded from its binary dump, or preprocessed from the alignment, tree and model
+    if cfg.uses_epang_binary(config):
+        reference_option = "--binary {input.b} "
+    else:
+        reference_option = "-t {input.t} " \
+                           "--ref-msa {input.r} " \
+                           "-m {input.m} "
+
     # make the EPA-NG command
     epang_command = "epa-ng " \
                     "--redo " \
@@ -82,11 +107,11 @@ def _make_epang_command(**kwargs) -> str:
                     "--verbose " \
                     "-w {params.tmpdir} " \
                     "-q {input.q} " \
-                    "-t {input.t} " \
-                    "--ref-msa {input.r} " \
-                    "-T 1 " \
-                    "-m {input.m} " \
+                    + reference_option + \
+                    "-T {threads} " \
                     "&> {log.logfile}"
+    epang_command = measured_command(config, epang_command,
+                                     epang_benchmark_templates[["h1", "h2", "h3", "h4"].index(heuristic)])
 
     # make a resulting sequence of commands
     return ";\n".join(c for c in ["mkdir -p {params.tmpdir}",
@@ -98,6 +123,9 @@ def _make_epang_command(**kwargs) -> str:
 
 
 def _get_epang_input_reads(config) -> str:
+    # reference sequences are shared by all queries aligned together
+    if cfg.aligns_queries_together(config):
+        return get_query_batch_alignment_template(config) + ".fasta_refs"
     return os.path.join(_alignment_dir, "{pruning}", get_common_queryname_template(config) + ".fasta_refs")
 
 
@@ -113,6 +141,56 @@ def _get_epang_input_info() -> str:
     return os.path.join(_working_dir, "T", "{pruning}_optimised.info")
 
 
+def _get_epang_binary_name(config) -> str:
+    # one binary per reference alignment: per pruning if all queries are aligned together
+    if cfg.aligns_queries_together(config):
+        return "queries"
+    return get_common_queryname_template(config)
+
+
+def _get_epang_input_binary(config) -> List[str]:
+    if not cfg.uses_epang_binary(config):
+        return []
+    return [os.path.join(_epang_soft_dir, "{pruning}", _get_epang_binary_name(config) + ".epa_binary")]
+
+
+if cfg.uses_epang_binary(config):
+    rule epang_dump_binary:
+        """
+        Preprocesses the reference alignment, tree and model of epa-ng once,
+        for all placements with this reference.
+        """
+        input:
+            r=_get_epang_input_reads(config),
+            t=_get_epang_input_tree(),
+            m=_get_epang_input_info()
+        output:
+            binary=_get_epang_input_binary(config)[0]
+        log:
+            logfile=os.path.join(get_experiment_log_dir_template(config, PlacementSoftware.EPANG),
+                                 _get_epang_binary_name(config) + "_binary.log")
+        params:
+            tmpdir=os.path.join(_epang_soft_dir, "{pruning}", "binary", _get_epang_binary_name(config))
+        threads: cfg.get_threads(config, "epang")
+        resources:
+            mem_mb = predicted_mem_mb(config, "epang", "epang-binary"),
+            runtime = predicted_runtime(config, "epang-binary")
+        shell:
+            ";\n".join(["mkdir -p {params.tmpdir}",
+                        measured_command(config,
+                                         "epa-ng --redo --no-pre-mask --preserve-rooting on --dump-binary "
+                                         "-w {params.tmpdir} -t {input.t} --ref-msa {input.r} -m {input.m} "
+                                         "-T {threads} &> {log.logfile}",
+                                         _epang_binary_benchmark_template),
+                        "mv {params.tmpdir}/epa_binary {output.binary}",
+                        "rm -rf {params.tmpdir}"])
+
+    if cfg.measures_resources(config):
+        rule epang_dump_binary:
+            benchmark:
+                repeat(_epang_binary_benchmark_template, cfg.get_repeats(config))
+
+
 rule placement_epang_h1:
     '''
     operate placement
@@ -125,7 +203,8 @@ rule placement_epang_h1:
         r=_get_epang_input_reads(config),
         q=_get_epang_input_queries(config),
         t=_get_epang_input_tree(),
-        m=_get_epang_input_info()
+        m=_get_epang_input_info(),
+        b=_get_epang_input_binary(config)
     output:
         jplace=get_output_template(config, PlacementSoftware.EPANG, "jplace", heuristic="h1")
     log:
@@ -136,13 +215,17 @@ rule placement_epang_h1:
           dir=os.path.join(_epang_soft_dir, "{pruning}", "h1"),
           maxp=config["maxplacements"],
           minlwr=config["minlwr"]
+    threads: cfg.get_threads(config, "epang")
+    resources:
+        mem_mb = predicted_mem_mb(config, "epang", "epang-h1-placement"),
+        runtime = predicted_runtime(config, "epang-h1-placement")
     run:
         shell(_make_epang_command(heuristic="h1"))
 
-if cfg.get_mode(config) == cfg.Mode.RESOURCES:
+if cfg.measures_resources(config):
     rule placement_epang_h1:
         benchmark:
-            repeat(_epang_h1_place_benchmark_template, config["repeats"])
+            repeat(_epang_h1_place_benchmark_template, cfg.get_repeats(config))
 
 
 rule placement_epang_h2:
@@ -157,7 +240,8 @@ rule placement_epang_h2:
         r=_get_epang_input_reads(config),
         q=_get_epang_input_queries(config),
         t=_get_epang_input_tree(),
-        m=_get_epang_input_info()
+        m=_get_epang_input_info(),
+        b=_get_epang_input_binary(config)
     output:
         jplace=get_output_template(config, PlacementSoftware.EPANG, "jplace", heuristic="h2")
     log:
@@ -167,13 +251,17 @@ rule placement_epang_h2:
           dir=os.path.join(_epang_soft_dir, "{pruning}", "h2"),
           maxp=config["maxplacements"],
           minlwr=config["minlwr"]
+    threads: cfg.get_threads(config, "epang")
+    resources:
+        mem_mb = predicted_mem_mb(config, "epang", "epang-h2-placement"),
+        runtime = predicted_runtime(config, "epang-h2-placement")
     run:
         shell(_make_epang_command(heuristic="h2"))
 
-if cfg.get_mode(config) == cfg.Mode.RESOURCES:
+if cfg.measures_resources(config):
     rule placement_epang_h2:
         benchmark:
-            repeat(_epang_h2_place_benchmark_template, config["repeats"])
+            repeat(_epang_h2_place_benchmark_template, cfg.get_repeats(config))
 
 rule placement_epang_h3:
     '''
@@ -187,7 +275,8 @@ rule placement_epang_h3:
         r=_get_epang_input_reads(config),
         q=_get_epang_input_queries(config),
         t=_get_epang_input_tree(),
-        m=_get_epang_input_info()
+        m=_get_epang_input_info(),
+        b=_get_epang_input_binary(config)
     output:
         jplace=get_output_template(config, PlacementSoftware.EPANG, "jplace", heuristic="h3")
     log:
@@ -197,13 +286,17 @@ rule placement_epang_h3:
           dir=os.path.join(_epang_soft_dir, "{pruning}", "h3"),
           maxp=config["maxplacements"],
           minlwr=config["minlwr"]
+    threads: cfg.get_threads(config, "epang")
+    resources:
+        mem_mb = predicted_mem_mb(config, "epang", "epang-h3-placement"),
+        runtime = predicted_runtime(config, "epang-h3-placement")
     run:
         shell(_make_epang_command(heuristic="h3"))
 
-if cfg.get_mode(config) == cfg.Mode.RESOURCES:
+if cfg.measures_resources(config):
     rule placement_epang_h3:
         benchmark:
-            repeat(_epang_h3_place_benchmark_template, config["repeats"])
+            repeat(_epang_h3_place_benchmark_template, cfg.get_repeats(config))
 
 rule placement_epang_h4:
     '''
@@ -217,7 +310,8 @@ rule placement_epang_h4:
         r=_get_epang_input_reads(config),
         q=_get_epang_input_queries(config),
         t=_get_epang_input_tree(),
-        m=_get_epang_input_info()
+        m=_get_epang_input_info(),
+        b=_get_epang_input_binary(config)
     output:
         jplace=get_output_template(config, PlacementSoftware.EPANG, "jplace", heuristic="h4")
     log:
@@ -227,10 +321,14 @@ rule placement_epang_h4:
           dir=os.path.join(_epang_soft_dir, "{pruning}", "h4"),
           maxp=config["maxplacements"],
           minlwr=config["minlwr"]
+    threads: cfg.get_threads(config, "epang")
+    resources:
+        mem_mb = predicted_mem_mb(config, "epang", "epang-h4-placement"),
+        runtime = predicted_runtime(config, "epang-h4-placement")
     run:
         shell(_make_epang_command(heuristic="h4"))
 
-if cfg.get_mode(config) == cfg.Mode.RESOURCES:
+if cfg.measures_resources(config):
     rule placement_epang_h4:
         benchmark:
-            repeat(_epang_h4_place_benchmark_template, config["repeats"])
+            repeat(_epang_h4_place_benchmark_template, cfg.get_repeats(config))
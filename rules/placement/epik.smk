@@ -11,6 +11,10 @@ from pathlib import Path
 import numpy as np
 import pewo.config as cfg
 from pewo.software import PlacementSoftware, get_ar_binary
+from pewo.cache import get_cache, make_key
+from pewo.resources.harness import measured_command
+from pewo.placement.server import client_command
+from pewo.resources.prediction import predicted_mem_mb, predicted_runtime
 from pewo.templates import get_output_template, get_log_template, get_experiment_dir_template, \
     get_ar_output_templates, get_benchmark_template, get_output_template_args
 
@@ -31,17 +35,17 @@ def has_epik():
 # Benchmark templates
 _ipk_benchmark_template = get_benchmark_template(config, PlacementSoftware.EPIK,
     p="pruning", k="k", red="red", ar="ar",
-    rule_name="build") if cfg.get_mode(config) == cfg.Mode.RESOURCES else ""
+    rule_name="build") if cfg.measures_resources(config) else ""
 _epik_benchmark_template = get_benchmark_template(config, PlacementSoftware.EPIK,
     p="pruning", length="length", k="k", o="o", red="red", ar="ar",
-    mu="mu",
-    rule_name="placement")  if cfg.get_mode(config) == cfg.Mode.RESOURCES else ""
+    mu="mu", threads=cfg.get_threads(config, "epik"),
+    rule_name="placement")  if cfg.measures_resources(config) else ""
 
 if has_epik():
     epik_benchmark_templates = [_ipk_benchmark_template, _epik_benchmark_template]
 
     # Benchmark template args
-    _ipk_benchmark_template_args = get_output_template_args(config, PlacementSoftware.EPIK) if cfg.get_mode(config) == cfg.Mode.RESOURCES else ""
+    _ipk_benchmark_template_args = get_output_template_args(config, PlacementSoftware.EPIK) if cfg.measures_resources(config) else ""
     if _ipk_benchmark_template_args:
         _ipk_benchmark_template_args.pop("length")
         
@@ -84,7 +88,8 @@ rule ipk:
     input:
         a = os.path.join(_working_dir, "A", "{pruning}.align"),
         t = os.path.join(_working_dir, "T", "{pruning}.tree"),
-        ar = lambda wildcards: get_ar_output_templates(config, wildcards.ar)
+        ar = lambda wildcards: get_ar_output_templates(config, wildcards.ar),
+        s = os.path.join(_working_dir, "T", "{pruning}_optimised.info")
     output:
         get_ipk_output_templates(config)
     log:
@@ -101,33 +106,48 @@ rule ipk:
         # Build a database with the minimal omega value.
         # Higher omega values will be dealt with by EPIK via dynamic load
         minimal_omega = get_minimal_value(config["config_epik"]["omega"]) if has_epik() else 0.0
+    resources:
+        mem_mb = predicted_mem_mb(config, "ipk", "epik-build"),
+        runtime = predicted_runtime(config, "epik-build")
     run:
-        shell(
-            "ipk.py build " +
-            "--states {params.states} " +
-            "-b $(which {params.arbin}) " +
-            "-k {wildcards.k} " +
-            "--omega {params.minimal_omega} " +
-            "-m {params.model} "
-            "-t {input.t} " +
-            "-r {input.a} " +
-            "-w {params.workdir} " +
-            #"--threads {params.arthreads} " +
-            "--ar-dir {params.ardir} " +
-            "--reduction-ratio {wildcards.red} " +
-            "--use-unrooted  &> {log} "
-        )
-        shell("mv {params.workdir}/DB.ipk {params.workdir}/DB_k{wildcards.k}.ipk")
-
-if cfg.get_mode(config) == cfg.Mode.RESOURCES:
+        cache = get_cache(config)
+        cache_key = make_key("ipk", [input.a, input.t],
+                             states=config["states"],
+                             model=config["phylo_params"]["model"],
+                             categories=config["phylo_params"]["categories"],
+                             alpha=extract_params(input.s)["alpha"],
+                             red=wildcards.red, ar=wildcards.ar,
+                             k=wildcards.k, o=params.minimal_omega) if cache else None
+        if not cache or not cache.restore(cache_key, output):
+            shell(measured_command(config,
+                "ipk.py build " +
+                "--states {params.states} " +
+                "-b $(which {params.arbin}) " +
+                "-k {wildcards.k} " +
+                "--omega {params.minimal_omega} " +
+                "-m {params.model} "
+                "-t {input.t} " +
+                "-r {input.a} " +
+                "-w {params.workdir} " +
+                #"--threads {params.arthreads} " +
+                "--ar-dir {params.ardir} " +
+                "--reduction-ratio {wildcards.red} " +
+                "--use-unrooted  &> {log} ",
+                _ipk_benchmark_template
+            ))
+            shell("mv {params.workdir}/DB.ipk {params.workdir}/DB_k{wildcards.k}.ipk")
+            if cache:
+                cache.store(cache_key, output)
+
+if cfg.measures_resources(config):
     rule ipk:
         benchmark:
-            repeat(_ipk_benchmark_template, config["repeats"])
+            repeat(_ipk_benchmark_template, cfg.get_repeats(config))
 
 rule placement_epik:
     input:
         database = lambda wildcards: get_epik_input_templates(config, wildcards),
-        r = lambda wildcards: get_rappas_input_reads(wildcards.pruning)
+        r = lambda wildcards: get_rappas_input_reads(wildcards.pruning, wildcards.length)
     output:
         jplace = get_output_template(config, PlacementSoftware.EPIK, "jplace")
     log:
@@ -138,6 +158,10 @@ rule placement_epik:
         workdir = _epik_experiment_dir,
         maxp = config["maxplacements"],
         minlwr = config["minlwr"]
+    threads: cfg.get_threads(config, "epik")
+    resources:
+        mem_mb = predicted_mem_mb(config, "epik", "epik-placement"),
+        runtime = predicted_runtime(config, "epik-placement")
     run:
         epik_command = "epik.py place " + \
             "--states {params.states} " + \
@@ -145,17 +169,23 @@ rule placement_epik:
             "-o {params.workdir} " + \
             "--mu {wildcards.mu} " + \
             "--omega {wildcards.o} " + \
-            "--threads 1 " + \
+            "--threads {threads} " + \
             "{input.r} " + \
             "&> {log} "
+        # queries of concurrent jobs are placed together by the placement server of the database
+        if cfg.get_placement_server(config):
+            server_command = epik_command.replace("{input.r}", "{{queries}}").replace(" &> {log} ", "")
+            epik_command = client_command(config, server_command, "{input.r}", "{params.workdir}",
+                                          "{log}.server.tsv") + " &> {log}"
         query_wildcard = "{wildcards.query}" if cfg.get_mode(config) == cfg.Mode.LIKELIHOOD else "{wildcards.pruning}"
         move_command = "mv {params.workdir}/placements_" + query_wildcard + "_r{wildcards.length}.fasta.jplace " + \
                        "{params.workdir}/" + \
                        query_wildcard + \
                        "_r{wildcards.length}_k{wildcards.k}_o{wildcards.o}_red{wildcards.red}_ar{wildcards.ar}_mu{wildcards.mu}_epik.jplace"
+        epik_command = measured_command(config, epik_command, _epik_benchmark_template)
         shell(";".join(_ for _ in [epik_command, move_command]))
 
-if cfg.get_mode(config) == cfg.Mode.RESOURCES:
+if cfg.measures_resources(config):
     rule placement_epik:
         benchmark:
-            repeat(_epik_benchmark_template, config["repeats"])
\ No newline at end of file
+            repeat(_epik_benchmark_template, cfg.get_repeats(config))
\ No newline at end of file
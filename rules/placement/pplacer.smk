@@ -12,6 +12,8 @@ import os
 from typing import Dict
 import pewo.config as cfg
 from pewo.software import PlacementSoftware, AlignmentSoftware
+from pewo.resources.harness import measured_command
+from pewo.resources.prediction import predicted_mem_mb, predicted_runtime
 from pewo.templates import get_experiment_dir_template, get_software_dir, get_common_queryname_template, \
     get_output_template, get_log_template, get_benchmark_template, get_output_template_args
 
@@ -26,8 +28,14 @@ _alignment_dir = get_software_dir(config, AlignmentSoftware.HMMER)
 
 _pplacer_place_benchmark_template = get_benchmark_template(config, PlacementSoftware.PPLACER,
                                                            p="pruning", length="length", ms="ms",
-                                                           sb="sb", mp="mp", rule_name="placement") if cfg.get_mode(config) == cfg.Mode.RESOURCES else ""
+                                                           sb="sb", mp="mp", threads=cfg.get_threads(config, "pplacer"),
+                                                           rule_name="placement") if cfg.measures_resources(config) else ""
 
+_pplacer_build_benchmark_template = get_benchmark_template(config, PlacementSoftware.PPLACER,
+                                                           p="pruning",
+                                                           rule_name="build") if cfg.measures_resources(config) else ""
+
+pplacer_build_benchmark_templates = [_pplacer_build_benchmark_template]
 pplacer_benchmark_templates = [_pplacer_place_benchmark_template]
 pplacer_benchmark_template_args = [get_output_template_args(config, PlacementSoftware.PPLACER)]
 
@@ -52,8 +60,21 @@ rule build_pplacer:
         os.path.join(_working_dir, "logs", "taxtastic", "{pruning}.log")
     params:
         refpkg_dir = _get_pplacer_refpkg_template(config)
+    resources:
+        mem_mb = predicted_mem_mb(config, "taxit", "pplacer-build"),
+        runtime = predicted_runtime(config, "pplacer-build")
+    # taxit refuses to overwrite a reference package, which is removed before every run
     shell:
-        "taxit create -P {params.refpkg_dir} -l locus -f {input.a} -t {input.t} -s {input.s} &> {log}"
+        measured_command(config,
+                         "rm -rf {params.refpkg_dir}; "
+                         "taxit create -P {params.refpkg_dir} -l locus -f {input.a} -t {input.t} -s {input.s} &> {log}",
+                         _pplacer_build_benchmark_template, modes=[cfg.Mode.VOLUME])
+
+# reference packages are measured in the volume mode only, where their build cost is amortized over query counts
+if cfg.get_mode(config) == cfg.Mode.VOLUME:
+    rule build_pplacer:
+        benchmark:
+            repeat(_pplacer_build_benchmark_template, cfg.get_repeats(config))
 
 
 rule placement_pplacer:
@@ -75,18 +96,22 @@ rule placement_pplacer:
     params:
         maxp = config["maxplacements"],
         minlwr = config["minlwr"]
+    threads: cfg.get_threads(config, "pplacer")
+    resources:
+        mem_mb = predicted_mem_mb(config, "pplacer", "pplacer-placement"),
+        runtime = predicted_runtime(config, "pplacer-placement")
     run:
         pplacer_command = "pplacer -o {output.jplace} --verbosity 1 --max-strikes {wildcards.ms}" \
                           " --strike-box {wildcards.sb} --max-pitches {wildcards.mp}" \
-                          " --keep-at-most {params.maxp} --keep-factor {params.minlwr}"
+                          " --keep-at-most {params.maxp} --keep-factor {params.minlwr} -j {threads}"
 
         if not config["config_pplacer"]["premask"]:
             pplacer_command += " --no-pre-mask"
 
         pplacer_command += " -c {input.pkg} {input.alignment} &> {log}"
-        shell(pplacer_command)
+        shell(measured_command(config, pplacer_command, _pplacer_place_benchmark_template))
 
-if cfg.get_mode(config) == cfg.Mode.RESOURCES:
+if cfg.measures_resources(config):
     rule placement_pplacer:
         benchmark:
-            repeat(_pplacer_place_benchmark_template, config["repeats"])
\ No newline at end of file
+            repeat(_pplacer_place_benchmark_template, cfg.get_repeats(config))
\ No newline at end of file
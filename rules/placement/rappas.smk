@@ -11,6 +11,10 @@ import os
 from pathlib import Path
 import pewo.config as cfg
 from pewo.software import PlacementSoftware, get_ar_binary
+from pewo.cache import get_cache, make_key
+from pewo.resources.harness import measured_command
+from pewo.placement.server import client_command
+from pewo.resources.prediction import predicted_mem_mb, predicted_runtime
 from pewo.templates import get_output_template, get_log_template, get_experiment_dir_template, \
     get_ar_output_templates, get_benchmark_template, get_output_template_args, get_experiment_log_dir_template
 
@@ -21,10 +25,10 @@ _rappas_experiment_dir = get_experiment_dir_template(config, PlacementSoftware.R
 # Benchmark templates
 _rappas_build_benchmark_template = get_benchmark_template(config, PlacementSoftware.RAPPAS,
     p="pruning", k="k", o="o", red="red", ar="ar",
-    rule_name="dbbuild") if cfg.get_mode(config) == cfg.Mode.RESOURCES else ""
+    rule_name="dbbuild") if cfg.measures_resources(config) else ""
 _rappas_place_benchmark_template = get_benchmark_template(config, PlacementSoftware.RAPPAS,
     p="pruning", length="length", k="k", o="o", red="red", ar="ar",
-    rule_name="placement")  if cfg.get_mode(config) == cfg.Mode.RESOURCES else ""
+    rule_name="placement")  if cfg.measures_resources(config) else ""
 
 rappas_benchmark_templates = [_rappas_build_benchmark_template, _rappas_place_benchmark_template]
 
@@ -39,17 +43,20 @@ rappas_benchmark_template_args = [
 ]
 
 
-def get_rappas_input_reads(pruning):
+def get_rappas_input_reads(pruning, length=None):
     """
     Creates a list of input reads files. For generated reads from a pruning,
     all read lengths are passed in a single RAPPAS execution.
-    Read lengths can not be wildcards and must be set manually
+    Read lengths can not be wildcards and must be set manually.
+    In the volume mode, every query count is placed separately.
     """
     output_dir = os.path.join(_working_dir, "R")
 
     # one read per fasta
     if cfg.get_mode(config) == cfg.Mode.LIKELIHOOD:
         return [os.path.join(output_dir, "{query}_r0.fasta")]
+    elif cfg.get_mode(config) == cfg.Mode.VOLUME:
+        return [os.path.join(output_dir, pruning + "_r" + str(length) + ".fasta")]
     # multiple reads per fasta
     else:
         # FIXME:
@@ -70,7 +77,8 @@ rule db_build_rappas:
     input:
         a = os.path.join(_working_dir, "A", "{pruning}.align"),
         t = os.path.join(_working_dir, "T", "{pruning}.tree"),
-        ar = lambda wildcards: get_ar_output_templates(config, wildcards.ar)
+        ar = lambda wildcards: get_ar_output_templates(config, wildcards.ar),
+        s = os.path.join(_working_dir, "T", "{pruning}_optimised.info")
     output:
         database = os.path.join(_rappas_experiment_dir, "DB.bin")
     log:
@@ -84,25 +92,40 @@ rule db_build_rappas:
         workdir=_rappas_experiment_dir,
         dbfilename="DB.bin",
         arbin=lambda wildcards: get_ar_binary(config, wildcards.ar)
+    resources:
+        mem_mb = predicted_mem_mb(config, "rappas", "rappas-dbbuild", 1000 * config["config_rappas"]["memory"]),
+        runtime = predicted_runtime(config, "rappas-dbbuild")
     run:
-         shell(
-            "java -Xms2G -Xmx"+str(config["config_rappas"]["memory"])+"G -jar $(which RAPPAS.jar) -v 0 -p b -b $(which {params.arbin}) "
-            "-k {wildcards.k} --omega {wildcards.o} -t {input.t} -r {input.a} "                                                          
-            "--gap-jump-thresh 1.0 "
-            "-w {params.workdir} --ardir {params.ardir} -s {params.states} --ratio-reduction {wildcards.red} "
-            "--use_unrooted --dbfilename {params.dbfilename} &> {log}"
-         )
-
-if cfg.get_mode(config) == cfg.Mode.RESOURCES:
+        cache = get_cache(config)
+        cache_key = make_key("rappas", [input.a, input.t],
+                             states=config["states"],
+                             model=config["phylo_params"]["model"],
+                             categories=config["phylo_params"]["categories"],
+                             alpha=extract_params(input.s)["alpha"],
+                             red=wildcards.red, ar=wildcards.ar,
+                             k=wildcards.k, o=wildcards.o) if cache else None
+        if not cache or not cache.restore(cache_key, output):
+            shell(measured_command(config,
+                "java -Xms2G -Xmx"+str(config["config_rappas"]["memory"])+"G -jar $(which RAPPAS.jar) -v 0 -p b -b $(which {params.arbin}) "
+                "-k {wildcards.k} --omega {wildcards.o} -t {input.t} -r {input.a} "
+                "--gap-jump-thresh 1.0 "
+                "-w {params.workdir} --ardir {params.ardir} -s {params.states} --ratio-reduction {wildcards.red} "
+                "--use_unrooted --dbfilename {params.dbfilename} &> {log}",
+                _rappas_build_benchmark_template
+            ))
+            if cache:
+                cache.store(cache_key, output)
+
+if cfg.measures_resources(config):
     rule db_build_rappas:
         benchmark:
-            repeat(_rappas_build_benchmark_template, config["repeats"])
+            repeat(_rappas_build_benchmark_template, cfg.get_repeats(config))
 
 
 rule placement_rappas:
     input:
         database = os.path.join(_rappas_experiment_dir, "DB.bin"),
-        r = lambda wildcards: get_rappas_input_reads(wildcards.pruning),
+        r = lambda wildcards: get_rappas_input_reads(wildcards.pruning, wildcards.length),
     output:
         jplace = get_output_template(config, PlacementSoftware.RAPPAS, "jplace")
     log:
@@ -112,6 +135,9 @@ rule placement_rappas:
         workdir = _rappas_experiment_dir,
         maxp = config["maxplacements"],
         minlwr = config["minlwr"]
+    resources:
+        mem_mb = predicted_mem_mb(config, "rappas", "rappas-placement", 1000 * config["config_rappas"]["memory"]),
+        runtime = predicted_runtime(config, "rappas-placement")
     run:
         memory = config['config_rappas']['memory']
         rappas_command = "java -Xms2G " + \
@@ -125,15 +151,22 @@ rule placement_rappas:
                          "-q {input.r} " + \
                          "-w {params.workdir} " + \
                          "&> {log}"
+        # queries of concurrent jobs are placed together by the placement server of the database
+        if cfg.get_placement_server(config):
+            server_command = rappas_command.replace("{input.r}", "{{queries}}").replace(" &> {log}", "")
+            # RAPPAS takes a comma-separated list of query files
+            rappas_command = client_command(config, server_command, "{input.r}", "{params.workdir}",
+                                            "{log}.server.tsv", separator=",") + " &> {log}"
         query_wildcard = "{wildcards.query}" if cfg.get_mode(config) == cfg.Mode.LIKELIHOOD else "{wildcards.pruning}"
         move_command = "mv {params.workdir}/placements_" + query_wildcard + "_r{wildcards.length}.fasta.jplace " + \
                        "{params.workdir}/" + \
                        query_wildcard + \
                        "_r{wildcards.length}_k{wildcards.k}_o{wildcards.o}_red{wildcards.red}_ar{wildcards.ar}_rappas.jplace"
+        rappas_command = measured_command(config, rappas_command, _rappas_place_benchmark_template)
         pipeline = ";".join(_ for _ in [rappas_command, move_command])
         shell(pipeline)
         
-if cfg.get_mode(config) == cfg.Mode.RESOURCES:
+if cfg.measures_resources(config):
     rule placement_rappas:
         benchmark:
-                repeat(_rappas_place_benchmark_template, config["repeats"])
\ No newline at end of file
+                repeat(_rappas_place_benchmark_template, cfg.get_repeats(config))
\ No newline at end of file
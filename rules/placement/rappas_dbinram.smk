@@ -21,10 +21,10 @@ _rappas_experiment_dir = get_experiment_dir_template(config, PlacementSoftware.R
 # Benchmark templates
 _rappas_build_benchmark_template = get_benchmark_template(config, PlacementSoftware.RAPPAS,
     p="pruning", k="k", o="o", red="red", ar="ar",
-    rule_name="dbbuild") if cfg.get_mode(config) == cfg.Mode.RESOURCES else ""
+    rule_name="dbbuild") if cfg.measures_resources(config) else ""
 _rappas_place_benchmark_template = get_benchmark_template(config, PlacementSoftware.RAPPAS,
     p="pruning", length="length", k="k", o="o", red="red", ar="ar",
-    rule_name="placement")  if cfg.get_mode(config) == cfg.Mode.RESOURCES else ""
+    rule_name="placement")  if cfg.measures_resources(config) else ""
 
 rappas_benchmark_templates = [_rappas_build_benchmark_template, _rappas_place_benchmark_template]
 
@@ -72,7 +72,7 @@ rule db_build_in_ram_rappas:
         jplace = get_output_template(config, PlacementSoftware.RAPPAS, "jplace")
     log:
         get_log_template(config, PlacementSoftware.RAPPAS)
-    resources: mem_mb = 1000*config["config_rappas"]["memory"]
+    resources: mem_mb = cfg.get_mem_mb(config, "rappas", 1000 * config["config_rappas"]["memory"])
     params:
         states = ["nucl"] if config["states"]==0 else ["amino"],
 
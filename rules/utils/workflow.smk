@@ -12,7 +12,8 @@ from typing import List, Dict
 import pewo.config as cfg
 from pewo.software import AlignmentSoftware, PlacementSoftware
 from pewo.templates import get_software_dir, get_common_queryname_template, get_common_template_args, \
-    get_output_template, get_output_template_args
+    get_output_template, get_output_template_args, get_query_batch_alignment_template, get_placement_table, \
+    get_optimisation_record_template
 
 def get_accuracy_nd_plots() -> List[str]:
     """
@@ -67,10 +68,58 @@ def get_likelihood_plots() -> List[str]:
     return list(itertools.chain(tables, plots))
 
 
+def get_placement_table_outputs() -> List[str]:
+    """
+    Returns the table of all placements, if it is enabled
+    """
+    return [get_placement_table(config)] if cfg.builds_placement_table(config) else []
+
+
 def get_resources_outputs() -> List[str]:
     return [os.path.join(config["workdir"], "resources.tsv")]
 
 
+def get_optimisation_records() -> List[str]:
+    """
+    Returns the records of the optimisation cache of every pruning
+    """
+    return expand(get_optimisation_record_template(config), pruning=range(config["pruning_count"]))
+
+
+def get_optimisation_cache_outputs() -> List[str]:
+    """
+    Returns the table of the optimisation cache records, written by the resources plots
+    """
+    return [os.path.join(config["workdir"], "optimisation_cache.tsv")]
+
+
+def get_resources_stats() -> List[str]:
+    return [os.path.join(config["workdir"], "resources_stats.tsv")]
+
+
+def get_resources_history() -> List[str]:
+    return [os.path.join(config["workdir"], "resources_history.tsv")]
+
+
+def get_sampling_outputs() -> List[str]:
+    """
+    Returns the phase summary and the plots of sampled jobs, if sampling is enabled
+    """
+    if not cfg.get_sampling_interval(config):
+        return []
+    return [os.path.join(config["workdir"], "sampling_phases.tsv"),
+            os.path.join(config["workdir"], "sampling_memory.svg"),
+            os.path.join(config["workdir"], "sampling_phases.svg")]
+
+
+def get_scaling_plots() -> List[str]:
+    """
+    Returns a list of plots that will be computed in the scaling mode
+    """
+    return [os.path.join(config["workdir"], "scaling_speedup.svg"),
+            os.path.join(config["workdir"], "scaling_efficiency.svg")]
+
+
 #def get_resources_plots() -> List[str]:
 #    """
 #    Returns a list of plots files that will be computed in the resources mode
@@ -92,7 +141,10 @@ def build_accuracy_workflow() -> List[str]:
     node_distance_reports = get_accuracy_nd_plots()
     expected_node_distance_reports = get_accuracy_end_plots()
 
-    return list(itertools.chain(placements, csv, node_distance_reports, expected_node_distance_reports))
+    # table of all placements
+    table = get_placement_table_outputs()
+
+    return list(itertools.chain(placements, table, csv, node_distance_reports, expected_node_distance_reports))
 
 
 def build_resources_workflow() -> List[str]:
@@ -115,9 +167,45 @@ def build_resources_workflow() -> List[str]:
 
     # collection of results and generation of summary plots
     l.extend(get_resources_outputs())
+
+    # mean, median and confidence intervals of every benchmark
+    l.extend(get_resources_stats())
+
+    # memory over time and phases of sampled jobs
+    l.extend(get_sampling_outputs())
+
+    # measurements with job features, to predict resources of later runs
+    l.extend(get_resources_history())
     return l
 
 
+def build_scaling_workflow() -> List[str]:
+    """
+    Creates a list of output files for the scaling workflow
+    """
+    # benchmarks of every tool and number of threads
+    benchmarks = get_scaling_benchmarks(config)
+
+    # speedup and efficiency tables and plots
+    table = [os.path.join(config["workdir"], "scaling.tsv")]
+    scaling_reports = get_scaling_plots()
+
+    return list(itertools.chain(benchmarks, table, scaling_reports))
+
+
+def build_volume_workflow() -> List[str]:
+    """
+    Creates a list of output files for the query volume workflow
+    """
+    # .jplace files of every query count
+    placements = build_placements_workflow()
+
+    # placement speed, memory growth and break-even query counts
+    reports = get_volume_outputs()
+
+    return list(itertools.chain(placements, reports))
+
+
 def build_likelihood_workflow() -> List[str]:
     """
     Creates a list of output files for the likelihood workflow
@@ -137,8 +225,13 @@ def build_likelihood_workflow() -> List[str]:
 def _get_aligned_queries() -> List[str]:
     """
     Returns the list of .fasta files of aligned query files. These files
-    must be produced by the alignment stage.
+    must be produced by the alignment stage. Queries aligned together are
+    in a single file, alignments of query files are made only if needed.
     """
+    if cfg.aligns_queries_together(config):
+        return expand(get_query_batch_alignment_template(config) + ".fasta",
+                      pruning=get_common_template_args(config)["pruning"])
+
     _alignment_dir = get_software_dir(config, AlignmentSoftware.HMMER)
     query_alignment_template = os.path.join(_alignment_dir,
                                             "{pruning}",
@@ -196,7 +289,7 @@ def _get_resources_tsv(config: Dict, software: PlacementSoftware, **kwargs) -> L
     """
     Creates a list of .tsv output files containing benchmark results of given software.
     """
-    if cfg.get_mode(config) != cfg.Mode.RESOURCES:
+    if not cfg.measures_resources(config):
         return []
 
     result = []
@@ -220,6 +313,8 @@ def _get_resources_tsv(config: Dict, software: PlacementSoftware, **kwargs) -> L
             h_index = heuristics.index(h)
             software_templates.append(epang_benchmark_templates[h_index])
             software_template_args.append(epang_benchmark_template_args[h_index])
+        software_templates.extend(epang_binary_benchmark_templates)
+        software_template_args.extend(epang_binary_benchmark_template_args)
     elif software == PlacementSoftware.PPLACER:
         software_templates = pplacer_benchmark_templates + hmmer_benchmark_templates
         software_template_args = pplacer_benchmark_template_args + hmmer_benchmark_template_args
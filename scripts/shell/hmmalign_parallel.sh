@@ -0,0 +1,77 @@
+#!/usr/bin/env bash
+#
+# Aligns queries to a profile with several hmmalign processes.
+#
+# The query file is split in contiguous chunks that are aligned in parallel.
+# The reference alignment is mapped only to the first chunk, so that reference
+# sequences appear once in the result. Chunk alignments are built against
+# the same profile, and merged in the order of the query file into the
+# alignment a single hmmalign process writes: sequences are aligned to the
+# profile independently, only the widths and the layout of insert columns
+# depend on the other sequences (see pewo/alignment/merge_hmm_alignments.py).
+#
+# Usage: hmmalign_parallel.sh <dna|amino> <chunks> <profile.hmm> <reference.align> <queries.fasta> <output.psiblast>
+#
+# author: Nikolai Romashchenko
+# license: MIT
+
+set -euo pipefail
+
+if [ "$#" -ne 6 ]; then
+    echo "Usage: $0 <dna|amino> <chunks> <profile.hmm> <reference.align> <queries.fasta> <output.psiblast>" >&2
+    exit 1
+fi
+
+states="$1"
+chunks="$2"
+hmm="$3"
+reference="$4"
+queries="$5"
+output="$6"
+
+total=$(grep -c '^>' "$queries" || true)
+if [ "$total" -lt "$chunks" ]; then
+    chunks="$total"
+fi
+
+# nothing to parallelize: the serial alignment
+if [ "$chunks" -le 1 ]; then
+    exec hmmalign --"$states" --outformat PSIBLAST -o "$output" --mapali "$reference" "$hmm" "$queries"
+fi
+
+repo_dir=$(cd "$(dirname "$0")/../.." && pwd)
+tmp_dir=$(mktemp -d "$(dirname "$output")/.hmmalign.XXXXXX")
+trap 'rm -rf "$tmp_dir"' EXIT
+
+# split queries in contiguous chunks of equal size
+size=$(( (total + chunks - 1) / chunks ))
+awk -v size="$size" -v dir="$tmp_dir" '
+    /^>/ { chunk = int(n / size); n++ }
+    { print > (dir "/chunk" chunk ".fasta") }
+' "$queries"
+
+pids=()
+for (( i = 0; i < chunks; i++ )); do
+    # fewer chunks than requested if the size was rounded up
+    if [ ! -e "$tmp_dir/chunk$i.fasta" ]; then
+        break
+    fi
+    mapali=()
+    if [ "$i" -eq 0 ]; then
+        mapali=(--mapali "$reference")
+    fi
+    hmmalign --"$states" --outformat Pfam -o "$tmp_dir/chunk$i.pfam" \
+        "${mapali[@]}" "$hmm" "$tmp_dir/chunk$i.fasta" &
+    pids+=($!)
+done
+
+for pid in "${pids[@]}"; do
+    wait "$pid"
+done
+
+chunk_files=()
+for (( i = 0; i < ${#pids[@]}; i++ )); do
+    chunk_files+=("$tmp_dir/chunk$i.pfam")
+done
+PYTHONPATH="$repo_dir${PYTHONPATH:+:$PYTHONPATH}" \
+    python -m pewo.alignment.merge_hmm_alignments "$output" "${chunk_files[@]}"
@@ -0,0 +1,106 @@
+"""
+Tests of the built-in likelihood evaluator against a naive computation on extended trees.
+"""
+
+__author__ = "Nikolai Romashchenko"
+__license__ = "MIT"
+
+
+import numpy as np
+import pytest
+from pewo.io import newick
+from pewo.likelihood.evaluator import LikelihoodEvaluator, gamma_rates
+
+
+_TREE = "((A:0.1,B:0.2):0.05,(C:0.3,(D:0.15,E:0.1):0.2):0.1,(F:0.25,(G:0.05,H:0.4):0.3):0.02);"
+
+_TIPS = {"A": [1, 0, 0, 0], "C": [0, 1, 0, 0], "G": [0, 0, 1, 0], "T": [0, 0, 0, 1], "R": [1, 0, 1, 0]}
+
+
+def _random_alignment(names, length, seed):
+    random = np.random.default_rng(seed)
+    chars = np.array(list("ACGTACGTACGTACGT-NR"))
+    return dict((name, "".join(random.choice(chars, length))) for name in names)
+
+
+def _frequencies(sequences):
+    counts = np.zeros(4)
+    for sequence in sequences:
+        for char in sequence:
+            if char in _TIPS:
+                counts += np.array(_TIPS[char]) / sum(_TIPS[char])
+    frequencies = np.maximum(counts / counts.sum(), 1.0e-3)
+    return frequencies / frequencies.sum()
+
+
+def _expm(matrix):
+    """
+    Matrix exponential by scaling and squaring of the Taylor series.
+    """
+    squarings = max(0, int(np.ceil(np.log2(max(np.abs(matrix).sum(axis=1).max(), 1e-300)))) + 4)
+    scaled = matrix / 2 ** squarings
+    result = term = np.eye(len(matrix))
+    for i in range(1, 30):
+        term = term @ scaled / i
+        result = result + term
+    for _ in range(squarings):
+        result = result @ result
+    return result
+
+
+def _naive_log_likelihood(tree_string, alignment, categories, frequency_sequences):
+    """
+    Felsenstein pruning on the whole tree, for GTR with equal exchangeabilities
+    and the frequencies of given sequences.
+    """
+    tree = newick.parse(tree_string)
+    frequencies = _frequencies(frequency_sequences)
+    rate_matrix = np.outer(np.ones(4), frequencies)
+    np.fill_diagonal(rate_matrix, 0.0)
+    np.fill_diagonal(rate_matrix, -rate_matrix.sum(axis=1))
+    rate_matrix /= -np.dot(frequencies, np.diag(rate_matrix))
+
+    length = len(next(iter(alignment.values())))
+    site_likelihoods = np.zeros(length)
+    for rate in gamma_rates(1.0, categories):
+        def _partial(node):
+            if tree.is_leaf(node):
+                return np.array([_TIPS.get(char, [1, 1, 1, 1]) for char in alignment[tree.names[node]]],
+                                dtype=np.float64)
+            partial = np.ones((length, 4))
+            for child in tree.children(node):
+                transition = _expm(rate_matrix * rate * tree.branch_length[child])
+                partial *= _partial(child) @ transition.T
+            return partial
+        site_likelihoods += _partial(tree.root) @ frequencies / categories
+    return float(np.log(site_likelihoods).sum())
+
+
+@pytest.mark.parametrize("categories", [1, 4])
+@pytest.mark.parametrize("extended_frequencies", [True, False])
+def test_extended_trees_match_naive_pruning(categories, extended_frequencies):
+    tree = newick.parse(_TREE)
+    leaf_names = [tree.names[leaf] for leaf in tree.leaves()]
+    reference = _random_alignment(leaf_names, 60, seed=1)
+    evaluator = LikelihoodEvaluator(tree, reference, "GTR+G", categories,
+                                    extended_frequencies=extended_frequencies)
+
+    # the query inserts two columns to the reference alignment
+    alignment = dict((name, sequence[:30] + "--" + sequence[30:]) for name, sequence in reference.items())
+    queries = _random_alignment(["query0", "query1"], 62, seed=2)
+    queries["query1"] = "-" * 20 + queries["query1"][20:50] + "-" * 12
+    alignment.update(queries)
+
+    writer = newick.ExtendedTreeWriter(tree)
+    placements = [("query0", 0, 0.04, 0.1), ("query1", 4, 0.1, 0.02), ("query0", 9, 0.01, 0.3)]
+    # a second call reuses the partials of queries, with other insertion branches
+    other_placements = [("query1", 10, 0.2, 0.05), ("query0", 6, 0.1, 0.1)]
+    likelihoods = evaluator.log_likelihoods(alignment, placements) + \
+        evaluator.log_likelihoods(alignment, other_placements)
+    for (query_name, node, distal_length, pendant_length), likelihood in zip(placements + other_placements,
+                                                                             likelihoods):
+        extended_tree = writer.to_string(node, distal_length, pendant_length, query_name)
+        extended_alignment = dict((name, alignment[name]) for name in leaf_names + [query_name])
+        frequency_sequences = extended_alignment.values() if extended_frequencies else reference.values()
+        expected = _naive_log_likelihood(extended_tree, extended_alignment, categories, frequency_sequences)
+        assert likelihood == pytest.approx(expected, rel=1e-9)
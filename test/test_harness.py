@@ -0,0 +1,40 @@
+"""
+Tests of the measurements of the adaptive benchmark harness.
+"""
+
+__author__ = "Nikolai Romashchenko"
+__license__ = "MIT"
+
+
+import numpy as np
+from pewo.resources.harness import read_runs, run_adaptive, run_command
+from pewo.resources.sampler import read_samples
+
+
+def test_run_does_not_count_memory_of_caller():
+    # the forked shell shares the memory of the caller until it executes
+    memory = np.ones(300 * 2 ** 20 // 8)
+    code, run = run_command("sleep 0.2")
+    assert code == 0
+    assert run.max_rss < 50
+    del memory
+
+
+def test_run_measures_memory_of_children():
+    code, run = run_command("python -c 'import numpy as np; np.ones(200 * 2 ** 17).sum()' | cat")
+    assert code == 0
+    assert run.max_rss > 150
+
+
+def test_adaptive_runs_sample_the_cold_run(tmp_path):
+    run_file = tmp_path / "runs.tsv"
+    sample_file = tmp_path / "samples.tsv"
+    code = run_adaptive("sleep 0.5", str(run_file), min_repeats=1, max_repeats=3, tolerance=1.0,
+                        confidence=0.95, sample_file=str(sample_file), interval=0.1)
+    assert code == 0
+    # the sampler polls from the harness, and does not count in the CPU time of runs
+    runs = read_runs(str(run_file))
+    assert all(run.cpu_s < 0.05 for run in runs)
+    samples = read_samples(str(sample_file))
+    assert 3 <= len(samples) <= 6
+    assert samples[-1].time_s < runs[0].s
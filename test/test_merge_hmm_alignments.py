@@ -0,0 +1,43 @@
+"""
+Tests of the merge of hmmalign chunk alignments.
+"""
+
+__author__ = "Nikolai Romashchenko"
+__license__ = "MIT"
+
+
+from pewo.alignment.merge_hmm_alignments import merge_alignments
+
+
+def _write_pfam(path, reference, rows):
+    lines = ["# STOCKHOLM 1.0"]
+    lines.extend(f"{name} {sequence}" for name, sequence in rows)
+    lines.append(f"#=GC RF {reference}")
+    lines.append("//")
+    path.write_text("\n".join(lines) + "\n")
+
+
+def test_merge_lays_out_insertions_as_hmmalign(tmp_path):
+    # a profile of three match states; chunks have insert blocks of different widths
+    chunk0 = tmp_path / "chunk0.pfam"
+    _write_pfam(chunk0, "..x..x.x", [("ref", "..Aac-gT"),
+                                     ("query0", "ctG..C.A")])
+    chunk1 = tmp_path / "chunk1.pfam"
+    _write_pfam(chunk1, "...x.x...x", [("query1", "gtaGaCcgaA")])
+
+    output = tmp_path / "merged.psiblast"
+    merge_alignments([str(chunk0), str(chunk1)], str(output))
+
+    # the N-terminal insertion is right-justified, internal ones are split in half
+    assert output.read_text() == ("ref     ---Aac---gT\n"
+                                  "query0  -ctG--C---A\n"
+                                  "query1  gtaG-aCcgaA\n")
+
+
+def test_merge_writes_psiblast_blocks(tmp_path):
+    chunk = tmp_path / "chunk0.pfam"
+    _write_pfam(chunk, "x" * 70, [("query", "A" * 70)])
+
+    output = tmp_path / "merged.psiblast"
+    merge_alignments([str(chunk)], str(output))
+    assert output.read_text() == f"query  {'A' * 60}\n\nquery  {'A' * 10}\n"
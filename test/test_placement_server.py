@@ -0,0 +1,86 @@
+"""
+Tests of the placement server with stub placement tools.
+"""
+
+__author__ = "Nikolai Romashchenko"
+__license__ = "MIT"
+
+
+import csv
+import os
+import sys
+import threading
+import pytest
+from pewo.placement import server
+
+
+# A stub of RAPPAS (-q with a comma-separated list of files) and EPIK (files as arguments).
+# It writes one .jplace file per query file and its own peak memory, and fails on unexpected arguments.
+_STUB = """
+import argparse, os, sys, time
+parser = argparse.ArgumentParser()
+parser.add_argument("-w", required=True)
+parser.add_argument("-q")
+parser.add_argument("files", nargs="*")
+args = parser.parse_args()
+if args.q and args.files:
+    sys.exit("unexpected arguments: " + " ".join(args.files))
+time.sleep(0.2)
+for query in (args.q.split(",") if args.q else args.files):
+    with open(os.path.join(args.w, "placements_" + os.path.basename(query) + ".jplace"), "w") as f_out:
+        f_out.write("{}")
+# unlike ru_maxrss, the peak in /proc is reset at exec and does not include the memory of the server
+with open("/proc/self/status") as f_in, open(os.path.join(args.w, "max_rss.txt"), "w") as f_out:
+    f_out.write(str(next(int(line.split()[1]) for line in f_in if line.startswith("VmHWM:")) / 1024))
+"""
+
+_REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("arguments, separator", [("-q {queries}", ","), ("{queries}", " ")])
+def test_batch_of_two_requests(tmp_path, monkeypatch, arguments, separator):
+    # the server runs in a separate process
+    monkeypatch.setenv("PYTHONPATH", os.pathsep.join([_REPO_DIR, os.environ.get("PYTHONPATH", "")]))
+
+    stub = tmp_path / "stub.py"
+    stub.write_text(_STUB)
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+    command = f"{sys.executable} {stub} -w {output_dir} {arguments}"
+
+    queries = []
+    for i in range(2):
+        query = tmp_path / f"query{i}.fasta"
+        query.write_text(f">query{i}\nACGT\n")
+        queries.append(str(query))
+
+    codes = [None, None]
+
+    def _place(i):
+        codes[i] = server.place(command, [queries[i]], str(output_dir), str(tmp_path / f"report{i}.tsv"),
+                                batch_window=1.0, idle_timeout=1.0, separator=separator)
+
+    threads = [threading.Thread(target=_place, args=(i,)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert codes == [0, 0]
+    for i in range(2):
+        assert (output_dir / f"placements_query{i}.fasta.jplace").exists()
+
+    reports = []
+    for i in range(2):
+        with open(tmp_path / f"report{i}.tsv") as f_in:
+            reports.extend(csv.DictReader(f_in, delimiter="\t"))
+    assert [report["batch_requests"] for report in reports] == ["2", "2"]
+    # the load of the batch is shared by its requests, not counted by each of them
+    load_s = [float(report["load_s"]) for report in reports]
+    assert load_s[0] == pytest.approx(load_s[1], abs=1e-3)
+    # values of reports are rounded to 0.1 ms
+    assert sum(load_s) <= float(reports[0]["batch_s"]) + 1e-3
+    # the peak memory is the one of the placement process tree, not of the server
+    stub_rss = float((output_dir / "max_rss.txt").read_text())
+    for report in reports:
+        assert float(report["max_rss"]) < stub_rss + 10
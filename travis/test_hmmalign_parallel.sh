@@ -0,0 +1,43 @@
+#!/bin/bash
+#
+# Checks that the parallel hmmalign alignment is identical to the serial one
+# on the reads of the likelihood test, after the conversion to .fasta.
+
+err_report() {
+    echo "Error on line $1"
+}
+
+trap 'err_report $LINENO' ERR
+set -e
+
+if [ -n "$CONDA_DIR" ]; then
+    source "$CONDA_DIR/etc/profile.d/conda.sh"
+    conda activate PEWO
+fi
+
+test_dir=`pwd`/travis/tests/2_travis_likelihood_test
+alignment=$test_dir/alignment_150.fasta
+reads=$test_dir/EMP_92_studies_10.fas
+run_dir=$test_dir/run_hmmalign_parallel
+mkdir -p $run_dir
+
+hmmbuild --dna $run_dir/profile.hmm $alignment > /dev/null
+hmmalign --dna --outformat PSIBLAST -o $run_dir/serial.psiblast --mapali $alignment $run_dir/profile.hmm $reads
+for chunks in 2 3; do
+    scripts/shell/hmmalign_parallel.sh dna $chunks $run_dir/profile.hmm $alignment $reads $run_dir/parallel$chunks.psiblast
+done
+
+for output in serial parallel2 parallel3; do
+    python -c "from pewo.alignment.psiblast2fasta import psiblast2fasta_split; import sys; psiblast2fasta_split(*sys.argv[1:])" \
+        $run_dir/$output.psiblast $reads $run_dir/$output.fasta $run_dir/$output.log
+done
+
+for chunks in 2 3; do
+    for suffix in "" _queries _refs; do
+        diff -q $run_dir/serial.fasta$suffix $run_dir/parallel$chunks.fasta$suffix
+    done
+done
+echo "Parallel hmmalign alignments are identical to the serial one"
+
+# Clean after
+rm -rf $run_dir